@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.tasks'
+    label = 'tasks'
+
+    def ready(self):
+        # register the @task functions of every app (<app>/tasks.py)
+        autodiscover_modules('tasks')
@@ -0,0 +1,291 @@
+'''
+Queue backends of the task subsystem
+
+A backend stores encoded task messages per queue with at-least-once
+delivery: `reserve` hands a message to one worker and keeps it in flight
+until the worker `ack`s it; a message whose worker died is handed out
+again once its visibility timeout passed (`requeue_expired`). Retries are
+kept aside until their time comes (`retry`, `promote_due`) and messages
+out of retries go to a dead letter list (`bury`).
+
+`RedisBackend` keeps the queues in the Redis of the default cache:
+
+    tasks:<queue>               pending messages (list, LPUSH/BLMOVE)
+    tasks:<queue>:processing    reserved messages (list)
+    tasks:<queue>:leases        reserved messages by lease deadline (sorted set)
+    tasks:<queue>:delayed       retries by due time (sorted set)
+    tasks:<queue>:dead          messages out of retries (list)
+
+`MemoryBackend` keeps them in the process, for tests and local runs
+without a worker.
+
+Usage:
+    from apps.tasks.backends import get_backend
+
+    backend = get_backend()
+    backend.enqueue('default', message)
+    message = backend.reserve('default', timeout=5)
+    backend.ack('default', message)
+'''
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from django_drf_boilerplate.utils.redis import get_redis_client, make_key
+
+# moves the messages whose lease expired back to the queue, a message is
+# only moved by the worker that removes it from the processing list;
+# messages of a worker that died between BLMOVE and taking the lease get
+# a lease now, so they come back after a full visibility timeout
+REQUEUE_EXPIRED = '''
+for _, message in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+    redis.call('ZADD', KEYS[3], 'NX', ARGV[1] + ARGV[3], message)
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, message in ipairs(expired) do
+    redis.call('ZREM', KEYS[3], message)
+    if redis.call('LREM', KEYS[2], 1, message) > 0 then
+        redis.call('RPUSH', KEYS[1], message)
+    end
+end
+return #expired
+'''
+
+# moves the retries that are due to the queue
+PROMOTE_DUE = '''
+local due = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, message in ipairs(due) do
+    redis.call('ZREM', KEYS[2], message)
+    redis.call('LPUSH', KEYS[1], message)
+end
+return #due
+'''
+
+
+class RedisBackend:
+    '''
+    Queues in Redis lists, reserved messages are moved atomically to a
+    processing list so a crash between reserve and ack loses nothing
+    '''
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self._scripts = {}
+
+    @property
+    def client(self):
+        client = get_redis_client(self.alias)
+        if client is None:
+            raise ImproperlyConfigured(
+                f'TASKS_BACKEND redis needs a RedisCache in CACHES[{self.alias!r}]')
+        return client
+
+    def _keys(self, queue) -> dict:
+        base = make_key(f'tasks:{queue}', self.alias)
+        return {'queue': base, 'processing': f'{base}:processing',
+                'leases': f'{base}:leases', 'delayed': f'{base}:delayed',
+                'dead': f'{base}:dead'}
+
+    def _script(self, source):
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = self.client.register_script(source)
+        return script
+
+    def enqueue(self, queue, message: bytes):
+        self.client.lpush(self._keys(queue)['queue'], message)
+
+    def reserve(self, queue, timeout=5):
+        '''
+        Returns the next message, waiting up to `timeout` seconds, or `None`
+        '''
+        keys = self._keys(queue)
+        client = self.client
+        if timeout:
+            message = client.blmove(keys['queue'], keys['processing'], timeout,
+                                    src='RIGHT', dest='LEFT')
+        else:
+            # BLMOVE waits forever with a 0 timeout
+            message = client.lmove(keys['queue'], keys['processing'], 'RIGHT', 'LEFT')
+        if message is not None:
+            client.zadd(keys['leases'],
+                        {message: time.time() + settings.TASKS_VISIBILITY_TIMEOUT})
+        return message
+
+    def touch(self, queue, message: bytes, timeout):
+        '''
+        Extends the lease of a reserved message to `timeout` seconds from now
+        '''
+        self.client.zadd(self._keys(queue)['leases'], {message: time.time() + timeout},
+                         xx=True)
+
+    def ack(self, queue, message: bytes):
+        keys = self._keys(queue)
+        pipeline = self.client.pipeline()
+        pipeline.lrem(keys['processing'], 1, message)
+        pipeline.zrem(keys['leases'], message)
+        pipeline.execute()
+
+    def retry(self, queue, message: bytes, retry: bytes, delay):
+        '''
+        Acks `message` and schedules `retry` (its next attempt) in `delay`
+        seconds
+        '''
+        keys = self._keys(queue)
+        pipeline = self.client.pipeline()
+        pipeline.zadd(keys['delayed'], {retry: time.time() + delay})
+        pipeline.lrem(keys['processing'], 1, message)
+        pipeline.zrem(keys['leases'], message)
+        pipeline.execute()
+
+    def bury(self, queue, message: bytes, dead: bytes):
+        '''
+        Acks `message` and keeps `dead` in the dead letter list
+        '''
+        keys = self._keys(queue)
+        pipeline = self.client.pipeline()
+        pipeline.lpush(keys['dead'], dead)
+        pipeline.ltrim(keys['dead'], 0, settings.TASKS_DEAD_LETTER_LIMIT - 1)
+        pipeline.lrem(keys['processing'], 1, message)
+        pipeline.zrem(keys['leases'], message)
+        pipeline.execute()
+
+    def promote_due(self, queue, limit=100) -> int:
+        keys = self._keys(queue)
+        return self._script(PROMOTE_DUE)(keys=[keys['queue'], keys['delayed']],
+                                         args=[time.time(), limit])
+
+    def requeue_expired(self, queue, limit=100) -> int:
+        keys = self._keys(queue)
+        return self._script(REQUEUE_EXPIRED)(
+            keys=[keys['queue'], keys['processing'], keys['leases']],
+            args=[time.time(), limit, settings.TASKS_VISIBILITY_TIMEOUT])
+
+    def size(self, queue) -> dict:
+        keys = self._keys(queue)
+        pipeline = self.client.pipeline()
+        pipeline.llen(keys['queue'])
+        pipeline.llen(keys['processing'])
+        pipeline.zcard(keys['delayed'])
+        pipeline.llen(keys['dead'])
+        pending, processing, delayed, dead = pipeline.execute()
+        return {'pending': pending, 'processing': processing,
+                'delayed': delayed, 'dead': dead}
+
+
+class MemoryQueue:
+    def __init__(self):
+        self.pending = deque()
+        # message: lease deadline
+        self.processing = {}
+        # (due time, message)
+        self.delayed = []
+        self.dead = deque(maxlen=settings.TASKS_DEAD_LETTER_LIMIT)
+
+
+class MemoryBackend:
+    '''
+    Queues of this process, same semantics as `RedisBackend`
+    '''
+
+    def __init__(self):
+        self.queues = {}
+        self._condition = threading.Condition()
+
+    def _queue(self, queue) -> MemoryQueue:
+        if queue not in self.queues:
+            self.queues[queue] = MemoryQueue()
+        return self.queues[queue]
+
+    def enqueue(self, queue, message: bytes):
+        with self._condition:
+            self._queue(queue).pending.appendleft(message)
+            self._condition.notify()
+
+    def reserve(self, queue, timeout=5):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            pending = self._queue(queue).pending
+            while not pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            message = pending.pop()
+            self._queue(queue).processing[message] = (
+                time.time() + settings.TASKS_VISIBILITY_TIMEOUT)
+            return message
+
+    def touch(self, queue, message: bytes, timeout):
+        with self._condition:
+            processing = self._queue(queue).processing
+            if message in processing:
+                processing[message] = time.time() + timeout
+
+    def ack(self, queue, message: bytes):
+        with self._condition:
+            self._queue(queue).processing.pop(message, None)
+
+    def retry(self, queue, message: bytes, retry: bytes, delay):
+        with self._condition:
+            self._queue(queue).delayed.append((time.time() + delay, retry))
+            self._queue(queue).processing.pop(message, None)
+
+    def bury(self, queue, message: bytes, dead: bytes):
+        with self._condition:
+            self._queue(queue).dead.appendleft(dead)
+            self._queue(queue).processing.pop(message, None)
+
+    def promote_due(self, queue, limit=100) -> int:
+        now = time.time()
+        with self._condition:
+            state = self._queue(queue)
+            due = sorted(item for item in state.delayed if item[0] <= now)[:limit]
+            for item in due:
+                state.delayed.remove(item)
+                state.pending.appendleft(item[1])
+            if due:
+                self._condition.notify_all()
+            return len(due)
+
+    def requeue_expired(self, queue, limit=100) -> int:
+        now = time.time()
+        with self._condition:
+            state = self._queue(queue)
+            expired = [message for message, deadline in state.processing.items()
+                       if deadline <= now][:limit]
+            for message in expired:
+                del state.processing[message]
+                state.pending.append(message)
+            if expired:
+                self._condition.notify_all()
+            return len(expired)
+
+    def size(self, queue) -> dict:
+        with self._condition:
+            state = self._queue(queue)
+            return {'pending': len(state.pending), 'processing': len(state.processing),
+                    'delayed': len(state.delayed), 'dead': len(state.dead)}
+
+    def clear(self):
+        with self._condition:
+            self.queues.clear()
+
+
+BACKENDS = {'redis': RedisBackend, 'memory': MemoryBackend}
+_backends = {}
+
+
+def get_backend():
+    '''
+    Returns the backend of `TASKS_BACKEND`, one instance per process
+    '''
+    name = settings.TASKS_BACKEND
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f'TASKS_BACKEND must be one of {", ".join(BACKENDS)}')
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
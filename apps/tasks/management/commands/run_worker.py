@@ -0,0 +1,54 @@
+'''
+Run a background task worker
+
+Stops after the current task on SIGTERM/SIGINT. Run as many workers as
+needed, every call is handed to one of them.
+
+Usage:
+    python manage.py run_worker
+    python manage.py run_worker --queue default --queue emails
+    python manage.py run_worker --burst      # exit once the queues are empty
+    python manage.py run_worker --stats
+'''
+import signal
+
+from django.core.management.base import BaseCommand
+
+from apps.tasks.backends import get_backend
+from apps.tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run a background task worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help='Queue to work on, repeatable (default: default)')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queues are empty')
+        parser.add_argument('--poll-timeout', type=float, default=5,
+                            help='Seconds a reserve waits for a task (default: 5)')
+        parser.add_argument('--stats', action='store_true',
+                            help='Print the size of the queues and exit')
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or ['default']
+        if options['stats']:
+            backend = get_backend()
+            for queue in queues:
+                sizes = backend.size(queue)
+                self.stdout.write(f'{queue}: ' + ' '.join(
+                    f'{name}: {size}' for name, size in sizes.items()))
+            return
+
+        worker = Worker(queues, poll_timeout=options['poll_timeout'])
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the current task...')
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(f'Worker started on {", ".join(queues)}')
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped, {worker.processed} tasks run'))
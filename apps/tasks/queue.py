@@ -0,0 +1,128 @@
+'''
+Background tasks
+
+`@task` registers a function as a task; `delay` puts a call of it on its
+queue, `delay_on_commit` does so once the current transaction commits, so
+a worker never sees rows the request has not committed and the request
+does not wait for the work. Workers (`manage.py run_worker`) run the calls
+at least once: a call that raises is retried `max_retries` times with an
+exponential backoff, then kept in the dead letter list of the queue. Tasks
+should be safe to run twice.
+
+Arguments are encoded as JSON, pass ids rather than model instances.
+
+Usage:
+    from apps.tasks.queue import task
+
+    @task(max_retries=5, backoff=2)
+    def send_welcome_email(user_id):
+        ...
+
+    send_welcome_email.delay_on_commit(user.pk)
+'''
+import json
+import logging
+import time
+import uuid
+
+from django.db import transaction
+
+from apps.tasks.backends import get_backend
+from django_drf_boilerplate.utils.encoders import dumps
+from django_drf_boilerplate.utils.tracing import get_request_id
+
+logger = logging.getLogger(__name__)
+
+# registered tasks by name
+TASKS = {}
+
+
+def encode(message: dict) -> bytes:
+    return dumps(message)
+
+
+def decode(message: bytes) -> dict:
+    return json.loads(message)
+
+
+class Task:
+    '''
+    Function run by the workers
+
+    Parameters
+    ----------
+        func : `callable`
+            task body, called with the JSON decoded arguments
+        queue : `str`
+            queue the calls are put on
+        max_retries : `int`
+            retries of a failing call before it is buried
+        backoff : `float`
+            seconds before the first retry, doubled for each further one
+        max_backoff : `float`
+            seconds between retries at most
+        visibility_timeout : `int`
+            seconds a call may run before it is handed to another worker,
+            `TASKS_VISIBILITY_TIMEOUT` if not given
+    '''
+
+    def __init__(self, func, name=None, queue='default', max_retries=3,
+                 backoff=2.0, max_backoff=300.0, visibility_timeout=None):
+        self.func = func
+        self.name = name or f'{func.__module__}.{func.__qualname__}'
+        self.queue = queue
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.visibility_timeout = visibility_timeout
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<Task {self.name}>'
+
+    def delay(self, *args, **kwargs) -> str:
+        '''
+        Puts a call on the queue and returns its id
+        '''
+        task_id = uuid.uuid4().hex
+        get_backend().enqueue(self.queue, encode({
+            'id': task_id, 'task': self.name, 'args': args, 'kwargs': kwargs,
+            'attempt': 0, 'enqueued_at': time.time(),
+            # logged by the worker, ties the call to the request that made it
+            'request_id': get_request_id()}))
+        return task_id
+
+    def delay_on_commit(self, *args, using=None, **kwargs):
+        '''
+        Puts a call on the queue once the current transaction commits (now
+        outside one); a failure to enqueue is logged, the commit stands
+        '''
+        def enqueue():
+            try:
+                self.delay(*args, **kwargs)
+            except Exception:
+                logger.exception('Task %s could not be enqueued', self.name)
+
+        transaction.on_commit(enqueue, using=using)
+
+    def retry_delay(self, attempt) -> float:
+        '''
+        Returns the seconds before retry number `attempt` (from 1)
+        '''
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+
+def task(func=None, **options):
+    '''
+    Registers a function as a `Task`, with or without options
+    '''
+    def register(func):
+        registered = Task(func, **options)
+        TASKS[registered.name] = registered
+        return registered
+    if func is not None:
+        return register(func)
+    return register
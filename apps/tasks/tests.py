@@ -0,0 +1,118 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from apps.tasks.backends import get_backend
+from apps.tasks.queue import TASKS, Task, decode, task
+from apps.tasks.worker import Worker
+from apps.users.tests import LOCMEM_CACHES
+
+calls = []
+
+
+@task(max_retries=2, backoff=0)
+def record_call(value, fail_times=0):
+    calls.append(value)
+    if calls.count(value) <= fail_times:
+        raise ValueError(f'attempt {calls.count(value)}')
+
+
+class UnreachableBackend:
+    def enqueue(self, queue, message):
+        raise ConnectionError('queue unreachable')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, TASKS_BACKEND='memory',
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        self.backend = get_backend()
+        self.backend.clear()
+
+    def test_delay_and_run(self):
+        record_call.delay('a')
+        record_call.delay('b')
+        self.assertEqual(calls, [])
+        self.assertEqual(self.backend.size('default')['pending'], 2)
+        worker = Worker(backend=self.backend)
+        worker.run(burst=True)
+        self.assertEqual((calls, worker.processed), (['a', 'b'], 2))
+        self.assertEqual(self.backend.size('default'),
+                         {'pending': 0, 'processing': 0, 'delayed': 0, 'dead': 0})
+
+    def test_retries_then_succeeds(self):
+        record_call.delay('a', fail_times=2)
+        with self.assertLogs('apps.tasks.worker', 'WARNING'):
+            Worker(backend=self.backend).run(burst=True)
+        self.assertEqual(calls, ['a', 'a', 'a'])
+        self.assertEqual(self.backend.size('default')['dead'], 0)
+
+    def test_buried_after_last_retry(self):
+        record_call.delay('a', fail_times=5)
+        with self.assertLogs('apps.tasks.worker', 'ERROR'):
+            Worker(backend=self.backend).run(burst=True)
+        self.assertEqual(calls, ['a', 'a', 'a'])
+        dead = decode(self.backend.queues['default'].dead[0])
+        self.assertEqual((dead['attempt'], dead['error']),
+                         (3, "ValueError('attempt 3')"))
+
+    def test_lost_call_is_redelivered(self):
+        record_call.delay('a')
+        # a worker reserves it and dies
+        self.assertIsNotNone(self.backend.reserve('default', timeout=0))
+        self.assertIsNone(self.backend.reserve('default', timeout=0))
+        self.assertEqual(self.backend.requeue_expired('default'), 0)
+        with override_settings(TASKS_VISIBILITY_TIMEOUT=0):
+            record_call.delay('b')
+            self.backend.reserve('default', timeout=0)
+        with self.assertLogs('apps.tasks.worker', 'WARNING'):
+            Worker(backend=self.backend).run(burst=True)
+        self.assertEqual(calls, ['b'])
+
+    def test_long_task_keeps_its_call(self):
+        slow = Task(len, name='apps.tasks.tests.slow', visibility_timeout=3600)
+        with override_settings(TASKS_VISIBILITY_TIMEOUT=0):
+            slow.delay([1])
+            message = self.backend.reserve('default', timeout=0)
+            self.backend.touch('default', message, slow.visibility_timeout)
+        self.assertEqual(self.backend.requeue_expired('default'), 0)
+        self.assertEqual(self.backend.size('default')['processing'], 1)
+
+    def test_retry_backoff(self):
+        exponential = Task(len, backoff=2, max_backoff=30)
+        self.assertEqual([exponential.retry_delay(attempt) for attempt in range(1, 6)],
+                         [2, 4, 8, 16, 30])
+
+    def test_registry(self):
+        self.assertIs(TASKS['apps.tasks.tests.record_call'], record_call)
+        self.assertIn('apps.users.tasks.user_registered', TASKS)
+
+    def test_registration_enqueues_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = APIClient().post(reverse('register_user'), {
+                'email': 'new@example.com', 'password': 'secret-pass-123',
+                'first_name': 'New', 'last_name': 'User'}, format='json')
+            self.assertEqual(self.backend.size('default')['pending'], 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        message = decode(self.backend.queues['default'].pending[0])
+        self.assertEqual((message['task'], message['args']),
+                         ('apps.users.tasks.user_registered', [response.json()['data']['id']]))
+        with self.assertLogs('apps.users.tasks', 'INFO') as logs:
+            Worker(backend=self.backend).run(burst=True)
+        self.assertIn('New user created: new@example.com', logs.output[0])
+
+    def test_enqueue_failure_does_not_fail_the_request(self):
+        with (mock.patch('apps.tasks.queue.get_backend', return_value=UnreachableBackend()),
+              self.assertLogs('apps.tasks.queue', 'ERROR') as logs,
+              self.captureOnCommitCallbacks(execute=True)):
+            response = APIClient().post(reverse('register_user'), {
+                'email': 'new@example.com', 'password': 'secret-pass-123',
+                'first_name': 'New', 'last_name': 'User'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('apps.users.tasks.user_registered could not be enqueued',
+                      logs.output[0])
@@ -0,0 +1,122 @@
+'''
+Task worker
+
+Reserves the calls of its queues one at a time and acks each once it ran;
+a call that raises is retried with the backoff of its task or buried in
+the dead letter list after its last retry. Between calls the worker moves
+due retries back to their queue and takes over the calls of workers that
+died (visibility timeout passed).
+
+Usage:
+    python manage.py run_worker --queue default
+'''
+import logging
+import time
+
+from django.db import close_old_connections
+
+from apps.tasks.backends import get_backend
+from apps.tasks.queue import TASKS, decode, encode
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    '''
+    Runs the tasks of `queues`
+
+    Parameters
+    ----------
+        queues : `list`
+            queue names, polled in order
+        backend : `RedisBackend` or `MemoryBackend`
+            `TASKS_BACKEND` if not given
+        poll_timeout : `float`
+            seconds a reserve waits for a call
+        maintenance_interval : `float`
+            seconds between two checks for due retries and expired calls
+    '''
+
+    def __init__(self, queues=('default',), backend=None, poll_timeout=5,
+                 maintenance_interval=1):
+        self.queues = list(queues)
+        self.backend = backend or get_backend()
+        self.poll_timeout = poll_timeout
+        self.maintenance_interval = maintenance_interval
+        self.running = False
+        self.processed = 0
+        self._maintained = 0.0
+
+    def stop(self):
+        '''
+        Stops the worker after the current call
+        '''
+        self.running = False
+
+    def maintain(self, force=False):
+        if not force and time.monotonic() - self._maintained < self.maintenance_interval:
+            return
+        self._maintained = time.monotonic()
+        for queue in self.queues:
+            if self.backend.requeue_expired(queue):
+                logger.warning('Calls of a lost worker requeued on %s', queue)
+            self.backend.promote_due(queue)
+
+    def run(self, burst=False):
+        '''
+        Runs calls until `stop()`, or until the queues are empty with `burst`
+        '''
+        self.running = True
+        # a blocking reserve on one queue would starve the others
+        timeout = 0 if burst else (self.poll_timeout if len(self.queues) == 1 else 1)
+        while self.running:
+            self.maintain(force=burst)
+            reserved = False
+            for queue in self.queues:
+                message = self.backend.reserve(queue, timeout=timeout)
+                if message is not None:
+                    reserved = True
+                    self.process(queue, message)
+            if burst and not reserved:
+                break
+        self.running = False
+
+    def process(self, queue, message: bytes):
+        '''
+        Runs one reserved call and acks, retries or buries it
+        '''
+        data = decode(message)
+        task = TASKS.get(data['task'])
+        if task is None:
+            logger.error('Unknown task %s (%s), buried', data['task'], data['id'])
+            self.backend.bury(queue, message, encode({**data, 'error': 'unknown task'}))
+            return
+        if task.visibility_timeout is not None:
+            # a long running task keeps its call from other workers
+            self.backend.touch(queue, message, task.visibility_timeout)
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            task.func(*data['args'], **data['kwargs'])
+        except Exception as exp:
+            attempt = data['attempt'] + 1
+            if attempt > task.max_retries:
+                logger.exception('Task %s (%s) failed %s times, buried', task.name,
+                                 data['id'], attempt, extra={'request_id': data['request_id']})
+                self.backend.bury(queue, message, encode(
+                    {**data, 'attempt': attempt, 'error': repr(exp)}))
+            else:
+                delay = task.retry_delay(attempt)
+                logger.warning('Task %s (%s) failed, retry %s in %.1fs: %r', task.name,
+                               data['id'], attempt, delay, exp,
+                               extra={'request_id': data['request_id']})
+                self.backend.retry(queue, message, encode({**data, 'attempt': attempt}),
+                                   delay)
+        else:
+            self.backend.ack(queue, message)
+            logger.info('Task %s (%s) done in %.2fms', task.name, data['id'],
+                        (time.perf_counter() - start) * 1000,
+                        extra={'request_id': data['request_id']})
+        finally:
+            self.processed += 1
+            close_old_connections()
@@ -1,3 +1,37 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.utils.translation import gettext_lazy as _
 
-# Register your models here.
+from apps.users.cache import revoke_user_tokens
+from apps.users.models import CustomUser, Designation, Role
+
+
+@admin.register(CustomUser)
+class CustomUserAdmin(UserAdmin):
+    list_display = ('email', 'username', 'first_name', 'last_name',
+                    'designation', 'is_staff', 'is_active')
+    list_select_related = ('designation',)
+    ordering = ('email',)
+    fieldsets = UserAdmin.fieldsets + (
+        (_('Organisation'), {'fields': ('designation', 'roles')}),
+    )
+    # email is unique and required, the add form of UserAdmin lacks it
+    add_fieldsets = (
+        (None, {
+            'classes': ('wide',),
+            'fields': ('username', 'email', 'first_name', 'last_name',
+                       'password1', 'password2'),
+        }),
+    )
+    actions = ['revoke_all_sessions']
+
+    @admin.action(description=_('Revoke all sessions of the selected users'))
+    def revoke_all_sessions(self, request, queryset):
+        user_ids = list(queryset.values_list('pk', flat=True))
+        revoke_user_tokens(*user_ids)
+        self.message_user(request, _('Revoked the sessions of %(count)d users') % {
+            'count': len(user_ids)}, messages.SUCCESS)
+
+
+admin.site.register(Role)
+admin.site.register(Designation)
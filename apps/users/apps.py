@@ -5,3 +5,7 @@ class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.users'
     label = 'users'
+
+    def ready(self):
+        # register signal handlers
+        from apps.users import signals  # noqa: F401
@@ -0,0 +1,239 @@
+'''
+Async views for users app
+
+Async versions of the profile and token endpoints for ASGI servers. Cache
+reads go through the async cache API and database access through the
+async ORM, so a worker keeps serving other requests while they wait.
+Authentication, revocation checks and throttling behave as in the DRF
+views, responses have the same bodies and headers.
+
+They replace the DRF views when `API_ASYNC_VIEWS` is set, see
+`apps/users/urls.py`.
+
+Usage:
+    API_ASYNC_VIEWS=true gunicorn -c gunicorn.conf.py
+'''
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser, update_last_login
+from django.db import close_old_connections
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import (APIException, NotAuthenticated,
+                                       ParseError, Throttled, ValidationError)
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import (AuthenticationFailed,
+                                                 InvalidToken, TokenError)
+from rest_framework_simplejwt.serializers import (TokenObtainSerializer,
+                                                  TokenRefreshSerializer)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.users.authentication import ClaimsUser, StatelessJWTAuthentication
+from apps.users.cache import aget_cached_profile, aset_cached_profile
+from apps.users.errors import UserErrorMessages
+from apps.users.loaders import (aload_user_relations, profile_queryset,
+                                user_last_modified)
+from apps.users.models import CustomUser
+from apps.users.revocation import TOKEN_VERSION_CLAIM, acheck_token
+from apps.users.serializers import (CustomTokenObtainPairSerializer,
+                                    UserReadSerializer)
+from apps.users.throttling import (AnonIPRateThrottle, LoginRateThrottle,
+                                   ProfileRateThrottle)
+from django_drf_boilerplate.utils.conditional import (conditional_response,
+                                                      payload_etag,
+                                                      set_validators)
+from django_drf_boilerplate.utils.response import ApiJsonResponse, ApiResponse
+
+logger = logging.getLogger(__name__)
+
+_authentication = StatelessJWTAuthentication()
+
+
+def _in_pool(func):
+    '''
+    Wraps a blocking `func` for `await`, run in the thread pool
+
+    `sync_to_async` runs thread sensitive code one call at a time on a
+    single thread shared by every request of the worker, so a slow password
+    hash or cache round trip would queue all the others behind it. Like at
+    the end of a request, the connections of the pool thread past their
+    `CONN_MAX_AGE` are closed after the call.
+    '''
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)
+
+
+def _exception_response(request, exp: APIException):
+    '''
+    Renders an `APIException` like DRF's exception handler
+    '''
+    data = exp.detail if isinstance(exp.detail, (dict, list)) else {'detail': exp.detail}
+    response = ApiJsonResponse(data, status=exp.status_code)
+    if isinstance(exp, (AuthenticationFailed, NotAuthenticated)):
+        response.headers['WWW-Authenticate'] = _authentication.authenticate_header(request)
+    if getattr(exp, 'wait', None):
+        response.headers['Retry-After'] = '%d' % exp.wait
+    return response
+
+
+def _request_data(request) -> dict:
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError as exp:
+            raise ParseError(f'JSON parse error - {exp}') from exp
+        if not isinstance(data, dict):
+            raise ParseError('JSON parse error - expected an object')
+        return data
+    return request.POST
+
+
+def _required(data, *fields):
+    missing = {field: ['This field is required.'] for field in fields
+               if not data.get(field)}
+    if missing:
+        raise ValidationError(missing)
+
+
+async def aauthenticate_request(request):
+    '''
+    Returns the user of the bearer token of a request, `None` without one
+
+    Raises
+    ------
+        `AuthenticationFailed`
+            if the token is invalid or revoked
+    '''
+    header = _authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = _authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    token = _authentication.get_validated_token(raw_token)
+    if api_settings.USER_ID_CLAIM not in token:
+        raise InvalidToken('Token contained no recognizable user identification')
+    await acheck_token(token)
+    if TOKEN_VERSION_CLAIM not in token:
+        # tokens without a version, database lookup
+        return await sync_to_async(JWTAuthentication.get_user)(_authentication, token)
+    return ClaimsUser(token)
+
+
+async def athrottle(request, *throttle_classes):
+    '''
+    Raises `Throttled` if a throttle denies the request, `request.user`
+    must be set
+    '''
+    durations = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not await _in_pool(throttle.allow_request)(request, None):
+            durations.append(throttle.wait())
+    if durations:
+        raise Throttled(wait=max(durations))
+
+
+@require_GET
+async def get_user_profile(request):
+    '''
+    Get User Profile API (async)
+
+    Parameters
+    ----------
+        request : `HttpRequest`
+            User request object
+
+    Returns
+    -------
+        `ApiResponse`
+        API response in standard format
+    '''
+    try:
+        request.user = await aauthenticate_request(request)
+        if request.user is None:
+            raise NotAuthenticated()
+        await athrottle(request, ProfileRateThrottle)
+    except APIException as exp:
+        return _exception_response(request, exp)
+
+    user_id = request.user.id
+    logger.info('Get user profile: %s', user_id)
+    try:
+        entry = await aget_cached_profile(user_id)
+        if entry is None:
+            user = await profile_queryset().aget(id=user_id)
+            entry = await aset_cached_profile(user.id, UserReadSerializer(user).data,
+                                              last_modified=user_last_modified(user))
+            logger.debug('User profile fetched successfully: %s', user)
+        etag = payload_etag(entry['digest'])
+        response = conditional_response(request, etag, entry['last_modified'])
+        if response is None:
+            response = ApiResponse.success(data=entry['data'],
+                                           message=UserErrorMessages.USER_FETCHED_SUCCESSFULLY.value)
+        return set_validators(response, etag, entry['last_modified'])
+    except CustomUser.DoesNotExist:
+        logger.debug('User not found: %s', user_id)
+        return ApiResponse.error(message=UserErrorMessages.USER_NOT_FOUND.value)
+    except Exception as exp:
+        logger.exception('Error in fetching user profile: %s', exp)
+        return ApiResponse.error(message=UserErrorMessages.ERROR_FETCHING_USER.value,
+                                 error=str(exp))
+
+
+@csrf_exempt
+@require_POST
+async def token_obtain_pair(request):
+    '''
+    Async `CustomTokenObtainPairView`
+    '''
+    try:
+        request.user = AnonymousUser()
+        await athrottle(request, AnonIPRateThrottle, LoginRateThrottle)
+        data = _request_data(request)
+        _required(data, CustomUser.USERNAME_FIELD, 'password')
+        user = await _in_pool(authenticate)(request, **{
+            CustomUser.USERNAME_FIELD: data[CustomUser.USERNAME_FIELD],
+            'password': data['password']})
+        if not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                TokenObtainSerializer.default_error_messages['no_active_account'],
+                'no_active_account')
+    except APIException as exp:
+        return _exception_response(request, exp)
+
+    # get_token() finds the relations loaded and does not query
+    await aload_user_relations(user)
+    refresh = CustomTokenObtainPairSerializer.get_token(user)
+    if api_settings.UPDATE_LAST_LOGIN:
+        await sync_to_async(update_last_login)(None, user)
+    return ApiJsonResponse({'refresh': str(refresh),
+                            'access': str(refresh.access_token)})
+
+
+@csrf_exempt
+@require_POST
+async def token_refresh(request):
+    '''
+    Async `CustomTokenRefreshView`
+    '''
+    try:
+        data = _request_data(request)
+        _required(data, 'refresh')
+        try:
+            await acheck_token(RefreshToken(data['refresh']))
+            # only the revocation check needs I/O, the rest is simplejwt's
+            tokens = TokenRefreshSerializer().validate({'refresh': data['refresh']})
+        except TokenError as exp:
+            raise InvalidToken(exp.args[0]) from exp
+    except APIException as exp:
+        return _exception_response(request, exp)
+    return ApiJsonResponse(tokens)
@@ -0,0 +1,118 @@
+'''
+Stateless JWT authentication for users app
+
+`request.user` is built from the token claims (`user_id`, `is_staff`,
+`is_superuser`, `roles`, `designation`) instead of loading the
+`CustomUser` row on every request. Revocation is checked against the
+revocation store and the cached token version of the user (`ver` claim,
+see `apps.users.revocation`), the row is only fetched when a view reads
+an attribute the token does not carry.
+
+Tokens issued before the `ver` claim existed are authenticated the
+simplejwt way, with a database lookup.
+
+Usage:
+    REST_FRAMEWORK = {
+        'DEFAULT_AUTHENTICATION_CLASSES': (
+            'apps.users.authentication.StatelessJWTAuthentication',
+        ),
+    }
+
+    request.user.is_staff       # from the token
+    request.user.email          # loads the row once, on first access
+    request.user.has_perm(...)  # same, every other user member is the row's
+    request.user.instance       # the `CustomUser` row
+'''
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.users.models import CustomUser
+from apps.users.revocation import TOKEN_VERSION_CLAIM, check_token
+
+
+class ClaimsUser:
+    '''
+    Token backed user with a lazily loaded `CustomUser` row
+
+    The id, staff and superuser flags and the roles and designation names
+    come from the token; every other attribute or method (`email`,
+    `get_username`, `has_perm`, `groups`, `save`, ...) is the one of the
+    row, loaded on first use.
+    '''
+    # tokens are only issued to and accepted for active users
+    is_active = True
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token):
+        self.token = token
+
+    def __str__(self) -> str:
+        return f'ClaimsUser {self.id}'
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (ClaimsUser, CustomUser)):
+            return NotImplemented
+        return self.id == other.pk
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    @cached_property
+    def id(self):
+        return self.token[api_settings.USER_ID_CLAIM]
+
+    @property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def is_staff(self) -> bool:
+        return self.token.get('is_staff', False)
+
+    @cached_property
+    def is_superuser(self) -> bool:
+        return self.token.get('is_superuser', False)
+
+    @cached_property
+    def roles_names(self) -> list:
+        return self.token.get('roles', [])
+
+    @cached_property
+    def designation_title(self):
+        return self.token.get('designation')
+
+    @cached_property
+    def instance(self) -> CustomUser:
+        '''
+        The `CustomUser` row of the token, loaded on first access
+        '''
+        try:
+            return CustomUser.objects.select_related('designation').get(pk=self.id)
+        except CustomUser.DoesNotExist as exp:
+            raise AuthenticationFailed(_('User not found'),
+                                       code='user_not_found') from exp
+
+    def __getattr__(self, attr):
+        # only called for attributes the class does not define
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.instance, attr)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    '''
+    JWT authentication without a user query per request
+    '''
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(
+                _('Token contained no recognizable user identification'))
+        check_token(validated_token)
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        return ClaimsUser(validated_token)
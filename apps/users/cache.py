@@ -0,0 +1,534 @@
+'''
+Cache helpers for users app
+
+The serialized user profile is cached in `CACHES['default']` keyed by the
+user id and a global profile generation. Changes to a single user delete
+that user's entry, changes to `Role`/`Designation` bump the generation so
+every cached profile is dropped at once.
+
+The token version of a user (`CustomUser.token_version`, embedded in its
+JWTs) is read through the cache so the stateless authentication can check
+revocation without a database query.
+
+`Role` and `Designation` are served from a two tier lookup cache: a bounded
+in-process LRU in front of `CACHES['default']`. Both tiers are keyed by a
+table version stored in the cache, bumping it invalidates every process.
+
+Usage:
+    from apps.users.cache import get_cached_profile, set_cached_profile
+
+    entry = get_cached_profile(user_id)
+    if entry is None:
+        entry = set_cached_profile(user_id, UserReadSerializer(user).data,
+                                   last_modified=user_last_modified(user))
+    entry['data'], entry['digest'], entry['last_modified']
+
+    from apps.users.cache import role_lookup
+
+    role_lookup.all()                       # every role ordered by id
+    role_lookup.get(1)                      # role with id 1 or None
+    role_lookup.resolve(['admin', 'x'])     # {'ADMIN': <Role>}
+
+    from apps.users.cache import get_token_version, revoke_user_tokens
+
+    get_token_version(user_id)      # None if the user is gone or inactive
+    revoke_user_tokens(user_id)     # every issued token stops working
+'''
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+
+from apps.users.models import CustomUser, Designation, Role
+from django_drf_boilerplate.utils.conditional import payload_digest
+
+# bump when the serialized profile format changes
+PROFILE_SCHEMA_VERSION = 2
+
+PROFILE_GENERATION_KEY = 'users:profile:generation'
+PROFILE_HITS_KEY = 'users:profile:hits'
+PROFILE_MISSES_KEY = 'users:profile:misses'
+
+
+def _incr(key, delta=1):
+    '''
+    Atomically increment a counter in the cache, creating it if missing
+    '''
+    cache.add(key, 0, timeout=None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # key evicted between add and incr
+        cache.set(key, delta, timeout=None)
+        return delta
+
+
+def _new_generation() -> int:
+    # time based so a lost generation key never reuses an old generation
+    return int(time.time() * 1000)
+
+
+def get_profile_generation() -> int:
+    '''
+    Returns the current profile cache generation
+    '''
+    generation = cache.get(PROFILE_GENERATION_KEY)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(PROFILE_GENERATION_KEY, generation, timeout=None):
+            generation = cache.get(PROFILE_GENERATION_KEY, generation)
+    return generation
+
+
+async def aget_profile_generation() -> int:
+    '''
+    Async `get_profile_generation`
+    '''
+    generation = await cache.aget(PROFILE_GENERATION_KEY)
+    if generation is None:
+        generation = _new_generation()
+        if not await cache.aadd(PROFILE_GENERATION_KEY, generation, timeout=None):
+            generation = await cache.aget(PROFILE_GENERATION_KEY, generation)
+    return generation
+
+
+def profile_cache_key(user_id, generation=None) -> str:
+    '''
+    Returns the cache key of the profile of a user
+
+    Parameters
+    ----------
+        user_id : `int`
+            id of the user
+        generation : `int`
+            profile generation, current generation if not given
+    '''
+    if generation is None:
+        generation = get_profile_generation()
+    return f'users:profile:v{PROFILE_SCHEMA_VERSION}:{generation}:{user_id}'
+
+
+class ProfileCacheStats:
+    '''
+    Hit/miss counters of the profile cache
+
+    Counts are kept in process and flushed to the cache every
+    `flush_interval` seconds so the cluster wide totals can be read with
+    `totals()` without an extra round trip on every request.
+    '''
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._pending_hits = 0
+        self._pending_misses = 0
+        self._last_flush = time.monotonic()
+
+    def record_hit(self, count=1):
+        with self._lock:
+            self._hits += count
+            self._pending_hits += count
+        self._maybe_flush()
+
+    def record_miss(self, count=1):
+        with self._lock:
+            self._misses += count
+            self._pending_misses += count
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        '''
+        Pushes the pending counts of this process to the cache
+        '''
+        with self._lock:
+            hits, misses = self._pending_hits, self._pending_misses
+            self._pending_hits = self._pending_misses = 0
+            self._last_flush = time.monotonic()
+        if hits:
+            _incr(PROFILE_HITS_KEY, hits)
+        if misses:
+            _incr(PROFILE_MISSES_KEY, misses)
+
+    def local(self) -> dict:
+        '''
+        Returns the counts of this process
+        '''
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses}
+
+    def totals(self) -> dict:
+        '''
+        Returns the cluster wide counts (flushed counts of all processes)
+        '''
+        self.flush()
+        counts = cache.get_many([PROFILE_HITS_KEY, PROFILE_MISSES_KEY])
+        return {'hits': counts.get(PROFILE_HITS_KEY, 0),
+                'misses': counts.get(PROFILE_MISSES_KEY, 0)}
+
+    def reset(self):
+        with self._lock:
+            self._hits = self._misses = 0
+            self._pending_hits = self._pending_misses = 0
+        cache.delete_many([PROFILE_HITS_KEY, PROFILE_MISSES_KEY])
+
+
+profile_cache_stats = ProfileCacheStats()
+
+
+def get_cached_profile(user_id):
+    '''
+    Returns the cached profile entry of a user or `None` on a miss
+
+    The entry holds the serialized profile (`data`), its hash (`digest`)
+    and the last modification time of the user and its relations
+    (`last_modified`).
+    '''
+    entry = cache.get(profile_cache_key(user_id))
+    if entry is None:
+        profile_cache_stats.record_miss()
+    else:
+        profile_cache_stats.record_hit()
+    return entry
+
+
+async def aget_cached_profile(user_id):
+    '''
+    Async `get_cached_profile`
+    '''
+    generation = await aget_profile_generation()
+    entry = await cache.aget(profile_cache_key(user_id, generation))
+    if entry is None:
+        profile_cache_stats.record_miss()
+    else:
+        profile_cache_stats.record_hit()
+    return entry
+
+
+def get_cached_profiles(user_ids) -> dict:
+    '''
+    Returns `{user_id: entry}` of the cached profiles of the given users,
+    with one cache round trip
+    '''
+    if not user_ids:
+        return {}
+    generation = get_profile_generation()
+    keys = {profile_cache_key(user_id, generation): user_id for user_id in user_ids}
+    entries = {keys[key]: entry for key, entry in cache.get_many(list(keys)).items()}
+    if entries:
+        profile_cache_stats.record_hit(len(entries))
+    if len(keys) > len(entries):
+        profile_cache_stats.record_miss(len(keys) - len(entries))
+    return entries
+
+
+def _profile_entry(data, last_modified):
+    data = dict(data)
+    return {'data': data, 'digest': payload_digest(data),
+            'last_modified': last_modified}
+
+
+def set_cached_profile(user_id, data, last_modified=None) -> dict:
+    '''
+    Stores the serialized profile payload of a user and returns its entry
+    '''
+    entry = _profile_entry(data, last_modified)
+    cache.set(profile_cache_key(user_id), entry,
+              timeout=settings.USER_PROFILE_CACHE_TIMEOUT)
+    return entry
+
+
+async def aset_cached_profile(user_id, data, last_modified=None) -> dict:
+    '''
+    Async `set_cached_profile`
+    '''
+    entry = _profile_entry(data, last_modified)
+    generation = await aget_profile_generation()
+    await cache.aset(profile_cache_key(user_id, generation), entry,
+                     timeout=settings.USER_PROFILE_CACHE_TIMEOUT)
+    return entry
+
+
+def set_cached_profiles(profiles) -> dict:
+    '''
+    Stores `{user_id: (data, last_modified)}` profiles with one cache round
+    trip and returns their entries by user id
+    '''
+    entries = {user_id: _profile_entry(data, last_modified)
+               for user_id, (data, last_modified) in profiles.items()}
+    if entries:
+        generation = get_profile_generation()
+        cache.set_many({profile_cache_key(user_id, generation): entry
+                        for user_id, entry in entries.items()},
+                       timeout=settings.USER_PROFILE_CACHE_TIMEOUT)
+    return entries
+
+
+def invalidate_user_profile(*user_ids):
+    '''
+    Drops the cached profile of the given users
+    '''
+    if not user_ids:
+        return
+    generation = get_profile_generation()
+    cache.delete_many([profile_cache_key(user_id, generation)
+                       for user_id in user_ids])
+
+
+def invalidate_all_profiles():
+    '''
+    Drops every cached profile by moving to a new generation
+    '''
+    if cache.add(PROFILE_GENERATION_KEY, _new_generation(), timeout=None):
+        return
+    try:
+        cache.incr(PROFILE_GENERATION_KEY)
+    except ValueError:
+        cache.set(PROFILE_GENERATION_KEY, _new_generation(), timeout=None)
+
+
+# stored for users that can not hold a valid token (deleted or inactive)
+NO_TOKEN_VERSION = -1
+
+
+def token_version_key(user_id) -> str:
+    return f'users:token_version:{user_id}'
+
+
+def get_token_version(user_id):
+    '''
+    Returns the current token version of a user, `None` if the user does
+    not exist or is inactive
+
+    Read through the cache, the database is only queried on a miss.
+    '''
+    key = token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # from the primary, a lagging replica would cache a revoked version
+        row = CustomUser.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk=user_id).values_list('token_version', 'is_active').first()
+        version = row[0] if row and row[1] else NO_TOKEN_VERSION
+        cache.set(key, version, timeout=settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return None if version == NO_TOKEN_VERSION else version
+
+
+async def aget_token_version(user_id):
+    '''
+    Async `get_token_version`
+    '''
+    key = token_version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        row = await CustomUser.objects.using(DEFAULT_DB_ALIAS).filter(
+            pk=user_id).values_list('token_version', 'is_active').afirst()
+        version = row[0] if row and row[1] else NO_TOKEN_VERSION
+        await cache.aset(key, version, timeout=settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return None if version == NO_TOKEN_VERSION else version
+
+
+def _forget_token_versions(user_ids):
+    cache.delete_many([token_version_key(user_id) for user_id in user_ids])
+
+
+def revoke_user_tokens(*user_ids):
+    '''
+    Invalidates every token issued to the given users by bumping their
+    token version
+
+    The cached versions are dropped now and again on commit, so a request
+    racing the transaction can not cache the old version.
+    '''
+    if not user_ids:
+        return
+    CustomUser.objects.filter(pk__in=user_ids).update(
+        token_version=F('token_version') + 1)
+    _forget_token_versions(user_ids)
+    transaction.on_commit(lambda: _forget_token_versions(user_ids))
+
+
+class LocalLRUCache:
+    '''
+    Thread safe, bounded least recently used cache
+    '''
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LookupCache:
+    '''
+    Two tier cache of a small lookup table
+
+    The whole table is stored in `CACHES['default']` under its current
+    version, rows and name/id entries are kept in a local LRU. The version
+    is re-read from the cache at most every `LOOKUP_CACHE_VERSION_TTL`
+    seconds, so other processes see an invalidation within that window.
+
+    Parameters
+    ----------
+        model : `Model`
+            lookup model
+        name_field : `str`
+            unique name field, matched case insensitively
+    '''
+
+    def __init__(self, model, name_field):
+        self.model = model
+        self.name_field = name_field
+        self.prefix = f'users:lookup:{model._meta.model_name}'
+        self.version_key = f'{self.prefix}:version'
+        self.local = LocalLRUCache(settings.LOOKUP_CACHE_MAX_ENTRIES)
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked = 0.0
+
+    def version(self) -> int:
+        '''
+        Returns the current table version
+        '''
+        now = time.monotonic()
+        with self._lock:
+            if (self._version is not None
+                    and now - self._checked < settings.LOOKUP_CACHE_VERSION_TTL):
+                return self._version
+        version = cache.get(self.version_key)
+        if version is None:
+            version = _new_generation()
+            if not cache.add(self.version_key, version, timeout=None):
+                version = cache.get(self.version_key, version)
+        with self._lock:
+            if version != self._version:
+                self.local.clear()
+            self._version, self._checked = version, now
+        return version
+
+    def invalidate(self):
+        '''
+        Moves every process to a new table version
+        '''
+        if not cache.add(self.version_key, _new_generation(), timeout=None):
+            try:
+                cache.incr(self.version_key)
+            except ValueError:
+                cache.set(self.version_key, _new_generation(), timeout=None)
+        with self._lock:
+            self.local.clear()
+            self._version = None
+
+    def invalidate_on_commit(self):
+        '''
+        Invalidates now and again once the current transaction commits, so
+        a reload racing the transaction can not keep uncommitted state out
+        '''
+        self.invalidate()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(self.invalidate)
+
+    def all(self) -> tuple:
+        '''
+        Returns every row ordered by primary key
+        '''
+        version = self.version()
+        rows = self.local.get(('all', version))
+        if rows is not None:
+            return rows
+        key = f'{self.prefix}:{version}:all'
+        rows = cache.get(key)
+        if rows is None:
+            # from the primary, rows of a lagging replica would be cached
+            # under the new version
+            rows = tuple(self.model.objects.using(DEFAULT_DB_ALIAS).order_by('pk'))
+            cache.set(key, rows, timeout=settings.LOOKUP_CACHE_TIMEOUT)
+        self.local.set(('all', version), rows)
+        return rows
+
+    def last_modified(self):
+        '''
+        Returns the latest `updated_at` of the table or `None` if empty
+        '''
+        version = self.version()
+        last_modified = self.local.get(('last_modified', version))
+        if last_modified is None:
+            last_modified = max((row.updated_at for row in self.all()),
+                                default=None)
+            self.local.set(('last_modified', version), last_modified)
+        return last_modified
+
+    def _index(self, version):
+        '''
+        Returns `(by_id, by_name)` maps of the whole table
+        '''
+        index = self.local.get(('index', version))
+        if index is None:
+            rows = self.all()
+            index = ({row.pk: row for row in rows},
+                     {getattr(row, self.name_field).upper(): row for row in rows})
+            self.local.set(('index', version), index)
+        return index
+
+    def get(self, pk):
+        '''
+        Returns the row with primary key `pk` or `None`
+        '''
+        version = self.version()
+        row = self.local.get(('id', version, pk))
+        if row is None:
+            row = self._index(version)[0].get(pk)
+            if row is not None:
+                self.local.set(('id', version, pk), row)
+        return row
+
+    def resolve(self, names) -> dict:
+        '''
+        Returns `{NAME: row}` for the given names that exist, upper cased
+        '''
+        version = self.version()
+        found = {}
+        for name in names:
+            name = name.upper()
+            row = self.local.get(('name', version, name))
+            if row is None:
+                row = self._index(version)[1].get(name)
+                if row is None:
+                    continue
+                self.local.set(('name', version, name), row)
+            found[name] = row
+        return found
+
+
+role_lookup = LookupCache(Role, 'name')
+designation_lookup = LookupCache(Designation, 'title')
@@ -0,0 +1,155 @@
+'''
+Dataloader style batch loading for users app
+
+A `BatchLoader` collects the keys asked for and fetches the ones it has
+not loaded yet with a single call of its batch function, usually one
+`IN` query, and keeps the results for the rest of the request. The
+`RequestLoaders` of a request hold one loader per model and build user
+profiles in batches: profiles are taken from the profile cache first, the
+misses are loaded with one query per model (users, their role ids, roles,
+designations; roles and designations come from the lookup cache when it
+has them) and written back to the profile cache at once.
+
+Usage:
+    from apps.users.dataloaders import RequestLoaders
+
+    loaders = RequestLoaders.for_request(request)
+    loaders.load_profiles([1, 2, 3])            # {user_id: profile entry}
+    loaders.user_ids_by_email.load_many(['a@example.com'])
+'''
+from apps.users.cache import (designation_lookup, get_cached_profiles,
+                              role_lookup, set_cached_profiles)
+from apps.users.loaders import user_last_modified
+from apps.users.models import CustomUser
+from apps.users.serializers import UserReadSerializer
+
+
+class BatchLoader:
+    '''
+    Loads values by key in batches, each key at most once
+
+    Parameters
+    ----------
+        batch : `callable`
+            called with a list of keys not loaded yet, returns `{key: value}`
+            for the keys that exist
+    '''
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.loaded = {}
+
+    def prime(self, key, value):
+        '''
+        Stores a value loaded elsewhere, e.g. by another query
+        '''
+        self.loaded.setdefault(key, value)
+
+    def load_many(self, keys) -> dict:
+        '''
+        Returns `{key: value}` of the keys that exist, in the order of `keys`
+        '''
+        keys = list(dict.fromkeys(keys))
+        missing = [key for key in keys if key not in self.loaded]
+        if missing:
+            found = self.batch(missing)
+            for key in missing:
+                # missing keys are remembered too, they are not asked again
+                self.loaded[key] = found.get(key)
+        return {key: self.loaded[key] for key in keys if self.loaded[key] is not None}
+
+    def load(self, key):
+        '''
+        Returns the value of `key` or `None`
+        '''
+        return self.load_many([key]).get(key)
+
+
+def _load_users(user_ids) -> dict:
+    return CustomUser.objects.in_bulk(user_ids)
+
+
+def _load_user_ids_by_email(emails) -> dict:
+    return dict(CustomUser.objects.filter(email__in=emails).values_list('email', 'id'))
+
+
+def _load_user_role_ids(user_ids) -> dict:
+    role_ids = {user_id: [] for user_id in user_ids}
+    rows = (CustomUser.roles.through.objects.filter(customuser_id__in=user_ids)
+            .order_by('pk').values_list('customuser_id', 'role_id'))
+    for user_id, role_id in rows:
+        role_ids[user_id].append(role_id)
+    return role_ids
+
+
+def lookup_batch(lookup):
+    '''
+    Returns a batch function reading rows from the lookup cache, with one
+    `IN` query for rows it does not have yet
+    '''
+    def batch(pks) -> dict:
+        rows = {pk: row for pk in pks if (row := lookup.get(pk)) is not None}
+        missing = [pk for pk in pks if pk not in rows]
+        if missing:
+            rows.update(lookup.model.objects.in_bulk(missing))
+        return rows
+    return batch
+
+
+def _set_relations(user, designation, roles):
+    '''
+    Attaches loaded relations to a user like `select_related` and
+    `prefetch_related` do, so serializing it runs no query
+    '''
+    CustomUser._meta.get_field('designation').set_cached_value(user, designation)
+    queryset = user.roles.all()
+    queryset._result_cache = roles
+    queryset._prefetch_done = True
+    user._prefetched_objects_cache = {'roles': queryset}
+
+
+class RequestLoaders:
+    '''
+    Loaders of one request, see `for_request`
+    '''
+
+    def __init__(self):
+        self.users = BatchLoader(_load_users)
+        self.user_ids_by_email = BatchLoader(_load_user_ids_by_email)
+        self.user_role_ids = BatchLoader(_load_user_role_ids)
+        self.roles = BatchLoader(lookup_batch(role_lookup))
+        self.designations = BatchLoader(lookup_batch(designation_lookup))
+
+    @classmethod
+    def for_request(cls, request) -> 'RequestLoaders':
+        '''
+        Returns the loaders of `request`, created on first use
+        '''
+        loaders = getattr(request, '_user_loaders', None)
+        if loaders is None:
+            loaders = request._user_loaders = cls()
+        return loaders
+
+    def load_profiles(self, user_ids) -> dict:
+        '''
+        Returns `{user_id: profile entry}` of the users that exist, like
+        `get_cached_profile` returns them, in the order of `user_ids`
+        '''
+        user_ids = list(dict.fromkeys(user_ids))
+        entries = get_cached_profiles(user_ids)
+        users = self.users.load_many([user_id for user_id in user_ids
+                                      if user_id not in entries])
+        if users:
+            role_ids = self.user_role_ids.load_many(list(users))
+            roles = self.roles.load_many(
+                [role_id for ids in role_ids.values() for role_id in ids])
+            designations = self.designations.load_many(
+                [user.designation_id for user in users.values() if user.designation_id])
+            for user in users.values():
+                _set_relations(user, designations.get(user.designation_id),
+                               [roles[role_id] for role_id in role_ids[user.pk]
+                                if role_id in roles])
+            entries.update(set_cached_profiles({
+                user.pk: (UserReadSerializer(user).data, user_last_modified(user))
+                for user in users.values()}))
+        return {user_id: entries[user_id] for user_id in user_ids if user_id in entries}
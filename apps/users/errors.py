@@ -44,3 +44,17 @@ class UserErrorMessages(Enum):
         'User not found with designation: {designation}')
     USER_NOT_FOUND_WITH_DEPARTMENT = _(
         'User not found with department: {department}')
+    ROLE_NOT_FOUND = _('Role not found: {names}')
+    DESIGNATION_NOT_FOUND = _('Designation not found')
+    USERS_IMPORTED_SUCCESSFULLY = _('Users imported successfully')
+    USER_IMPORT_QUEUED = _('User import queued')
+    IMPORT_JOB_FETCHED_SUCCESSFULLY = _('Import job fetched successfully')
+    IMPORT_JOB_NOT_FOUND = _('Import job not found')
+    USER_IMPORT_FAILED = _('User import failed')
+    UNSUPPORTED_IMPORT_FORMAT = _('Unsupported import format: {format}')
+    INVALID_IMPORT_ROW = _('Row is not a valid JSON object')
+    USERS_FETCHED_SUCCESSFULLY = _('Users fetched successfully')
+    EMPTY_USER_BATCH = _('Give at least one user id or email')
+    USER_BATCH_TOO_LARGE = _('At most {max_size} users can be fetched at once')
+    USER_LOGGED_OUT_SUCCESSFULLY = _('User logged out successfully')
+    USER_LOGOUT_FAILED = _('User logout failed')
@@ -0,0 +1,184 @@
+'''
+Password hashing service for users app
+
+Single passwords are hashed in process, batches can be fanned out to a
+`ProcessPoolExecutor` so bulk paths use every core instead of one. Every
+hash is timed and recorded in `hashing_stats` to tune the iterations of
+`PASSWORD_HASHERS` against the latency budget.
+
+Usage:
+    from apps.users.hashing import password_hasher
+
+    password_hasher.set_password(user, 'secret')
+    hashes = password_hasher.hash_many(['secret-1', 'secret-2'])
+'''
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, make_password
+
+from django_drf_boilerplate.utils.metrics import PASSWORD_HASH_TIME
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker(settings_module):
+    '''
+    Sets up Django in a spawned hashing process
+    '''
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def _timed_hash(password):
+    start = time.perf_counter()
+    encoded = make_password(password)
+    return encoded, time.perf_counter() - start
+
+
+class HashingStats:
+    '''
+    Count, total and max duration of the password hashes of this process
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def record(self, seconds):
+        PASSWORD_HASH_TIME.observe(seconds)
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.last = seconds
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+            self.last = 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'count': self.count, 'total': self.total,
+                    'mean': self.total / self.count if self.count else 0.0,
+                    'max': self.max, 'last': self.last}
+
+
+hashing_stats = HashingStats()
+
+
+class PasswordHashingService:
+    '''
+    Hashes passwords inline or on a process pool
+
+    The pool is created on first use and per process, so a forked server
+    worker never reuses the pool of its parent. A pool broken by a dead
+    hashing process is replaced once, then the batch is hashed inline.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    @property
+    def workers(self) -> int:
+        return settings.PASSWORD_HASHING_WORKERS or os.cpu_count() or 1
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(
+                        settings.PASSWORD_HASHING_START_METHOD),
+                    initializer=_init_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE',
+                                             'django_drf_boilerplate.settings'),))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def hash(self, password) -> str:
+        '''
+        Returns the hash of a single password, computed in process
+        '''
+        encoded, seconds = _timed_hash(password)
+        hashing_stats.record(seconds)
+        logger.debug('Password hashed in %.1f ms', seconds * 1000)
+        return encoded
+
+    def set_password(self, user, password):
+        '''
+        Timed `user.set_password`
+        '''
+        start = time.perf_counter()
+        user.set_password(password)
+        hashing_stats.record(time.perf_counter() - start)
+
+    def hash_many(self, passwords) -> list:
+        '''
+        Returns the hashes of `passwords` in the same order
+
+        Batches smaller than `PASSWORD_HASHING_POOL_THRESHOLD` or a single
+        configured worker are hashed in process.
+        '''
+        passwords = list(passwords)
+        if (self.workers <= 1
+                or len(passwords) < settings.PASSWORD_HASHING_POOL_THRESHOLD):
+            return [self.hash(password) for password in passwords]
+
+        start = time.perf_counter()
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        for _ in range(2):
+            pool = self._get_pool()
+            try:
+                results = list(pool.map(_timed_hash, passwords, chunksize=chunksize))
+                break
+            except BrokenProcessPool:
+                # a hashing process died (OOM, killed), the pool is unusable
+                logger.warning('Password hashing pool broken, discarded')
+                self._discard_pool(pool)
+        else:
+            return [self.hash(password) for password in passwords]
+        for _, seconds in results:
+            hashing_stats.record(seconds)
+        logger.debug('Hashed %s passwords on %s workers in %.1f ms',
+                     len(passwords), self.workers,
+                     (time.perf_counter() - start) * 1000)
+        return [encoded for encoded, _ in results]
+
+
+password_hasher = PasswordHashingService()
+atexit.register(password_hasher.shutdown)
+
+
+def describe_hasher() -> dict:
+    '''
+    Returns the algorithm and work factor of the default hasher
+    '''
+    hasher = get_hasher()
+    return {'algorithm': hasher.algorithm,
+            'iterations': getattr(hasher, 'iterations', None)}
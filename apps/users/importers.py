@@ -0,0 +1,359 @@
+'''
+Bulk user import for users app
+
+Rows are streamed from a CSV or JSONL file, validated in chunks with the
+`UserSerializer` rules and inserted with `bulk_create`, so memory stays
+bounded by the chunk size whatever the size of the file.
+
+CSV files need a header row, multiple roles are separated by `|`:
+
+    email,password,first_name,last_name,roles,designation
+    jane@example.com,secret,Jane,Doe,ADMIN|EDITOR,ENGINEER
+
+JSONL files have one object per line with `roles` as a list or a `|`
+separated string.
+
+Every chunk is committed on its own. `bulk_create` sends no `post_save`,
+so the post-registration task (`user_registered`) is enqueued here for the
+inserted users; the other `user_post_save` work does not apply to new
+users (no cached profile, token or read-your-writes pin yet).
+
+The import endpoint does not import in the request: the upload is stored
+in `USER_IMPORT_UPLOAD_DIR` and imported by a task worker
+(`start_import_job`), its progress and report are kept in the cache for
+`IMPORT_JOB_TIMEOUT` seconds (`get_import_job`).
+
+Usage:
+    from apps.users.importers import import_users, start_import_job
+
+    with open('users.csv', 'rb') as stream:
+        report = import_users(stream, 'csv', batch_size=1000)
+    report.as_dict()
+
+    job = start_import_job(upload, 'csv', user_id=request.user.id)
+'''
+import csv
+import io
+import json
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+from apps.users.errors import UserErrorMessages
+from apps.users.hashing import password_hasher
+from apps.users.models import CustomUser, Designation, Role
+from apps.users.serializers import UserImportSerializer
+from apps.users.tasks import import_users_file, user_registered
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+ROLES_SEPARATOR = '|'
+IMPORT_JOB_TIMEOUT = 24 * 3600
+
+
+class ImportFormatError(ValueError):
+    '''
+    Raised when the import file can not be parsed
+    '''
+
+
+class ImportReport:
+    '''
+    Outcome of a bulk import with the errors of every rejected row
+    '''
+
+    def __init__(self):
+        self.total = 0
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, row, email, errors):
+        self.errors.append({'row': row, 'email': email, 'errors': errors})
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def as_dict(self) -> dict:
+        return {'total': self.total, 'created': self.created,
+                'failed': self.failed,
+                'errors': sorted(self.errors, key=lambda error: error['row'])}
+
+
+def _split_roles(row):
+    roles = row.get('roles')
+    if isinstance(roles, str):
+        row['roles'] = [name.strip() for name in roles.split(ROLES_SEPARATOR)
+                        if name.strip()]
+    return row
+
+
+def iter_csv_rows(stream):
+    '''
+    Yields `(row_number, row)` from a binary CSV stream
+    '''
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or 'email' not in reader.fieldnames:
+            raise ImportFormatError('CSV header must contain an email column')
+        for number, row in enumerate(reader, start=1):
+            # drop empty cells so optional fields fall back to defaults
+            yield number, _split_roles({key: value for key, value in row.items()
+                                        if key and value not in (None, '')})
+    except (csv.Error, UnicodeDecodeError) as exp:
+        raise ImportFormatError(str(exp)) from exp
+    finally:
+        # leave the underlying stream open for the caller
+        text.detach()
+
+
+def iter_jsonl_rows(stream):
+    '''
+    Yields `(row_number, row)` from a binary JSONL stream, blank lines are
+    skipped but still counted
+    '''
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, _split_roles(row) if isinstance(row, dict) else None
+
+
+def iter_rows(stream, file_format):
+    '''
+    Yields `(row_number, row)` from a stream in one of `IMPORT_FORMATS`
+    '''
+    if file_format == 'csv':
+        return iter_csv_rows(stream)
+    if file_format == 'jsonl':
+        return iter_jsonl_rows(stream)
+    raise ImportFormatError(
+        UserErrorMessages.UNSUPPORTED_IMPORT_FORMAT.value.format(
+            format=file_format))
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class UserImporter:
+    '''
+    Imports users chunk by chunk
+
+    Role and designation names are resolved from maps loaded once per
+    import, emails are checked against the database with one query per
+    chunk.
+    '''
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.USER_IMPORT_BATCH_SIZE
+        self.roles = {name.upper(): pk for pk, name in
+                      Role.objects.values_list('id', 'name')}
+        self.designations = {title.upper(): pk for pk, title in
+                             Designation.objects.values_list('id', 'title')}
+        self.seen = set()
+        self.seen_usernames = set()
+        self.report = ImportReport()
+
+    def run(self, rows) -> ImportReport:
+        for chunk in _chunks(rows, self.batch_size):
+            self.report.total += len(chunk)
+            self.import_chunk(chunk)
+        return self.report
+
+    def validate_row(self, number, row):
+        '''
+        Returns the validated data of a row or `None` after reporting it
+        '''
+        if row is None:
+            self.report.add_error(
+                number, None, UserErrorMessages.INVALID_IMPORT_ROW.value)
+            return None
+        serializer = UserImportSerializer(data=row)
+        if not serializer.is_valid():
+            self.report.add_error(number, row.get('email'), serializer.errors)
+            return None
+        data = serializer.validated_data
+        data['email'] = CustomUser.objects.normalize_email(data['email'])
+        data.setdefault('username', data['email'])
+
+        errors = {}
+        missing = [name for name in data.get('roles', [])
+                   if name.upper() not in self.roles]
+        if missing:
+            errors['roles'] = UserErrorMessages.ROLE_NOT_FOUND.value.format(
+                names=', '.join(missing))
+        designation = data.get('designation')
+        if designation and designation.upper() not in self.designations:
+            errors['designation'] = UserErrorMessages.DESIGNATION_NOT_FOUND.value
+        if data['email'] in self.seen or data['username'] in self.seen_usernames:
+            errors['email'] = UserErrorMessages.USER_ALREADY_EXISTS.value
+        if errors:
+            self.report.add_error(number, data['email'], errors)
+            return None
+        self.seen.add(data['email'])
+        self.seen_usernames.add(data['username'])
+        return data
+
+    def import_chunk(self, chunk):
+        valid = []
+        for number, row in chunk:
+            data = self.validate_row(number, row)
+            if data is not None:
+                valid.append((number, data))
+        if not valid:
+            return
+
+        existing = set(CustomUser.objects.filter(
+            email__in=[data['email'] for _, data in valid]
+        ).values_list('email', flat=True))
+        existing_usernames = set(CustomUser.objects.filter(
+            username__in=[data['username'] for _, data in valid]
+        ).values_list('username', flat=True))
+        rows = []
+        for number, data in valid:
+            if data['email'] in existing or data['username'] in existing_usernames:
+                self.report.add_error(number, data['email'], {
+                    'email': UserErrorMessages.USER_ALREADY_EXISTS.value})
+            else:
+                rows.append(data)
+        if not rows:
+            return
+
+        passwords = password_hasher.hash_many(data['password'] for data in rows)
+        users = [
+            CustomUser(email=data['email'], username=data['username'],
+                       first_name=data.get('first_name', ''),
+                       last_name=data.get('last_name', ''),
+                       password=password,
+                       designation_id=self.designations.get(
+                           (data.get('designation') or '').upper()))
+            for data, password in zip(rows, passwords)
+        ]
+        with transaction.atomic():
+            users = CustomUser.objects.bulk_create(
+                users, batch_size=self.batch_size)
+            if any(user.pk is None for user in users):
+                # backends that can not return ids from bulk inserts
+                ids = dict(CustomUser.objects.filter(
+                    email__in=[user.email for user in users]
+                ).values_list('email', 'id'))
+                for user in users:
+                    user.pk = ids[user.email]
+            through = CustomUser.roles.through
+            through.objects.bulk_create([
+                through(customuser_id=user.pk, role_id=self.roles[name.upper()])
+                for user, data in zip(users, rows)
+                for name in dict.fromkeys(data.get('roles', []))
+            ], batch_size=self.batch_size)
+            for user in users:
+                user_registered.delay_on_commit(user.pk)
+        self.report.created += len(users)
+
+
+def import_users(stream, file_format, batch_size=None) -> ImportReport:
+    '''
+    Imports users from a binary CSV/JSONL stream
+
+    Parameters
+    ----------
+        stream : `file`
+            binary file like object
+        file_format : `str`
+            one of `IMPORT_FORMATS`
+        batch_size : `int`
+            rows per chunk and per insert, `USER_IMPORT_BATCH_SIZE` if not given
+
+    Returns
+    -------
+        `ImportReport`
+        counts and per row errors
+
+    Raises
+    ------
+        `ImportFormatError`
+            if the file can not be parsed
+    '''
+    return UserImporter(batch_size=batch_size).run(iter_rows(stream, file_format))
+
+
+def import_job_key(job_id) -> str:
+    return f'users:import:{job_id}'
+
+
+def import_storage() -> FileSystemStorage:
+    return FileSystemStorage(location=settings.USER_IMPORT_UPLOAD_DIR)
+
+
+def get_import_job(job_id):
+    '''
+    Returns the state of an import job (`status` queued, running, done or
+    failed, with its `report` once done), `None` if unknown or expired
+    '''
+    return cache.get(import_job_key(job_id))
+
+
+def _save_import_job(job, **changes) -> dict:
+    job = {**job, **changes}
+    cache.set(import_job_key(job['id']), job, timeout=IMPORT_JOB_TIMEOUT)
+    return job
+
+
+def start_import_job(upload, file_format, batch_size=None, user_id=None) -> dict:
+    '''
+    Stores an uploaded file and enqueues its import, returns the job
+
+    Raises
+    ------
+        `Exception`
+            if the task can not be enqueued, the upload is removed
+    '''
+    job_id = uuid.uuid4().hex
+    storage = import_storage()
+    path = storage.save(f'{job_id}.{file_format}', upload)
+    job = _save_import_job({'id': job_id, 'status': 'queued', 'file': upload.name,
+                            'format': file_format, 'user_id': user_id,
+                            'created_at': time.time()})
+    try:
+        import_users_file.delay(job_id, path, file_format, batch_size)
+    except Exception:
+        storage.delete(path)
+        cache.delete(import_job_key(job_id))
+        raise
+    return job
+
+
+def run_import_job(job_id, path, file_format, batch_size=None) -> dict:
+    '''
+    Imports the stored file of a job and records its report, the file is
+    removed afterwards
+    '''
+    job = get_import_job(job_id) or {'id': job_id, 'format': file_format}
+    job = _save_import_job(job, status='running', started_at=time.time())
+    storage = import_storage()
+    try:
+        with open(storage.path(path), 'rb') as stream:
+            report = import_users(stream, file_format, batch_size=batch_size)
+    except ImportFormatError as exp:
+        return _save_import_job(job, status='failed', error=str(exp),
+                                finished_at=time.time())
+    except Exception as exp:
+        # chunks committed before the failure stay imported
+        _save_import_job(job, status='failed', error=repr(exp), finished_at=time.time())
+        raise
+    finally:
+        storage.delete(path)
+    return _save_import_job(job, status='done', report=report.as_dict(),
+                            finished_at=time.time())
@@ -0,0 +1,84 @@
+'''
+Prefetch aware loaders for users app
+
+Everything that serializes a user together with its `designation` and
+`roles` should load the user through these helpers so the relations are
+fetched with one join and one prefetch query instead of one query per
+relation access.
+
+Usage:
+    from apps.users.loaders import load_user, load_user_relations
+
+    user = load_user(id=request.user.id)    # raises Http404
+    load_user_relations(user)               # user loaded elsewhere
+'''
+from django.db.models import aprefetch_related_objects, prefetch_related_objects
+from django.shortcuts import get_object_or_404
+
+from apps.users.models import CustomUser
+
+PROFILE_SELECT_RELATED = ('designation',)
+PROFILE_PREFETCH_RELATED = ('roles',)
+
+
+def profile_queryset():
+    '''
+    Returns a `CustomUser` queryset with the profile relations loaded
+    '''
+    return CustomUser.objects.select_related(
+        *PROFILE_SELECT_RELATED).prefetch_related(*PROFILE_PREFETCH_RELATED)
+
+
+def load_user(**lookup) -> CustomUser:
+    '''
+    Returns the user matching `lookup` with the profile relations loaded
+
+    Raises
+    ------
+        `Http404`
+            if no user matches
+    '''
+    return get_object_or_404(profile_queryset(), **lookup)
+
+
+def _missing_relations(user: CustomUser) -> list:
+    missing = [
+        name for name in PROFILE_SELECT_RELATED
+        if not CustomUser._meta.get_field(name).is_cached(user)
+    ]
+    prefetched = getattr(user, '_prefetched_objects_cache', {})
+    missing += [name for name in PROFILE_PREFETCH_RELATED
+                if name not in prefetched]
+    return missing
+
+
+def load_user_relations(user: CustomUser) -> CustomUser:
+    '''
+    Loads the missing profile relations of an already fetched user
+    '''
+    missing = _missing_relations(user)
+    if missing:
+        prefetch_related_objects([user], *missing)
+    return user
+
+
+async def aload_user_relations(user: CustomUser) -> CustomUser:
+    '''
+    Async `load_user_relations`
+    '''
+    missing = _missing_relations(user)
+    if missing:
+        await aprefetch_related_objects([user], *missing)
+    return user
+
+
+def user_last_modified(user: CustomUser):
+    '''
+    Returns the latest `updated_at` of a user and its profile relations
+    '''
+    load_user_relations(user)
+    timestamps = [user.updated_at]
+    if user.designation:
+        timestamps.append(user.designation.updated_at)
+    timestamps += [role.updated_at for role in user.roles.all()]
+    return max(timestamps)
@@ -0,0 +1,48 @@
+'''
+Bulk import users from a CSV or JSONL file
+
+Usage:
+    python manage.py import_users users.csv
+    python manage.py import_users users.jsonl --batch-size 5000 --report errors.json
+'''
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.importers import IMPORT_FORMATS, ImportFormatError, import_users
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='File format, taken from the extension if not given')
+        parser.add_argument('--batch-size', type=int,
+                            help='Rows per batch (default: USER_IMPORT_BATCH_SIZE)')
+        parser.add_argument('--report',
+                            help='Write the per row error report to this JSON file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError(f'Unsupported import format: {file_format}')
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        try:
+            with open(path, 'rb') as stream:
+                report = import_users(stream, file_format,
+                                      batch_size=options['batch_size'])
+        except (OSError, ImportFormatError) as exp:
+            raise CommandError(str(exp)) from exp
+
+        if options['report']:
+            with open(options['report'], 'w', encoding='utf-8') as file:
+                json.dump(report.as_dict(), file, indent=2, default=str)
+        else:
+            for error in report.errors:
+                self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.total} rows, {report.created} created, {report.failed} failed'))
@@ -0,0 +1,53 @@
+'''
+Measure the cost of hashing one password with the configured hasher
+
+Usage:
+    python manage.py password_hash_cost
+    python manage.py password_hash_cost --samples 50 --batch 200
+'''
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.users.hashing import describe_hasher, hashing_stats, password_hasher
+
+
+class Command(BaseCommand):
+    help = 'Measure the cost of hashing one password with PASSWORD_HASHERS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=20,
+                            help='Passwords hashed inline (default: 20)')
+        parser.add_argument('--batch', type=int, default=0,
+                            help='Also hash a batch of this size on the pool')
+
+    def handle(self, *args, **options):
+        hasher = describe_hasher()
+        self.stdout.write(
+            f"hasher: {hasher['algorithm']} iterations: {hasher['iterations']}")
+
+        durations = []
+        for sample in range(options['samples']):
+            start = time.perf_counter()
+            password_hasher.hash(f'password-{sample}')
+            durations.append((time.perf_counter() - start) * 1000)
+        if durations:
+            durations.sort()
+            p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+            self.stdout.write(
+                f'inline: mean {statistics.mean(durations):.1f} ms '
+                f'p95 {p95:.1f} ms max {durations[-1]:.1f} ms')
+
+        if options['batch']:
+            hashing_stats.reset()
+            start = time.perf_counter()
+            password_hasher.hash_many(
+                f'password-{index}' for index in range(options['batch']))
+            elapsed = time.perf_counter() - start
+            stats = hashing_stats.snapshot()
+            self.stdout.write(
+                f"pool ({password_hasher.workers} workers): {options['batch']} "
+                f"hashes in {elapsed * 1000:.0f} ms, "
+                f"{options['batch'] / elapsed:.1f} hashes/s, "
+                f"mean cost {stats['mean'] * 1000:.1f} ms per hash")
@@ -0,0 +1,29 @@
+'''
+Show hit/miss counters of the user profile cache
+
+Usage:
+    python manage.py profile_cache_stats
+    python manage.py profile_cache_stats --reset
+'''
+from django.core.management.base import BaseCommand
+
+from apps.users.cache import profile_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the user profile cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        totals = profile_cache_stats.totals()
+        lookups = totals['hits'] + totals['misses']
+        ratio = totals['hits'] / lookups if lookups else 0
+        self.stdout.write(
+            f"hits: {totals['hits']} misses: {totals['misses']} "
+            f"hit ratio: {ratio:.2%}")
+        if options['reset']:
+            profile_cache_stats.reset()
+            self.stdout.write('Counters reset')
@@ -0,0 +1,86 @@
+'''
+Seed users, roles and designations for benchmarks and local load tests
+
+Users are `<prefix><n>@example.com` with the same password, each with a
+designation and `--roles-per-user` roles. A staff user
+`<prefix>-staff@example.com` is added for the staff only views. Existing
+rows are kept, seeding twice adds nothing.
+
+Usage:
+    python manage.py seed_users --users 1000
+    python manage.py seed_users --users 50000 --roles 20 --designations 10 --password secret
+'''
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.users.hashing import password_hasher
+from apps.users.models import CustomUser, Designation, Role
+
+DEFAULT_PASSWORD = 'bench-password-123'
+
+
+class Command(BaseCommand):
+    help = 'Seed users, roles and designations for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Users to create (default: 1000)')
+        parser.add_argument('--roles', type=int, default=10,
+                            help='Roles to create (default: 10)')
+        parser.add_argument('--designations', type=int, default=5,
+                            help='Designations to create (default: 5)')
+        parser.add_argument('--roles-per-user', type=int, default=3,
+                            help='Roles given to every user (default: 3)')
+        parser.add_argument('--prefix', default='bench',
+                            help='Email, role and designation prefix (default: bench)')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD,
+                            help='Password of every seeded user')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per insert (default: 1000)')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+        # one hash for every user, hashing each would dominate the seeding
+        password = password_hasher.hash(options['password'])
+
+        with transaction.atomic():
+            Role.objects.bulk_create(
+                [Role(name=f'{prefix.upper()}_ROLE_{number}')
+                 for number in range(options['roles'])], ignore_conflicts=True)
+            Designation.objects.bulk_create(
+                [Designation(title=f'{prefix.upper()}_DESIGNATION_{number}')
+                 for number in range(options['designations'])], ignore_conflicts=True)
+            roles = list(Role.objects.filter(name__startswith=f'{prefix.upper()}_ROLE_')
+                         .order_by('id').values_list('id', flat=True))
+            designations = list(Designation.objects.filter(
+                title__startswith=f'{prefix.upper()}_DESIGNATION_').order_by('id'))
+
+            users = [CustomUser(email=f'{prefix}{number}@example.com',
+                                username=f'{prefix}{number}', first_name='Bench',
+                                last_name=f'User {number}', password=password,
+                                designation=designations[number % len(designations)]
+                                if designations else None)
+                     for number in range(options['users'])]
+            users.append(CustomUser(email=f'{prefix}-staff@example.com',
+                                    username=f'{prefix}-staff', first_name='Bench',
+                                    last_name='Staff', password=password, is_staff=True))
+            CustomUser.objects.bulk_create(users, batch_size=batch_size,
+                                           ignore_conflicts=True)
+
+            # ids are not returned with ignore_conflicts, read them back
+            user_ids = CustomUser.objects.filter(
+                email__startswith=prefix, email__endswith='@example.com'
+            ).values_list('id', flat=True)
+            through = CustomUser.roles.through
+            per_user = min(options['roles_per_user'], len(roles))
+            through.objects.bulk_create(
+                [through(customuser_id=user_id,
+                         role_id=roles[(user_id + offset) % len(roles)])
+                 for user_id in user_ids for offset in range(per_user)],
+                batch_size=batch_size, ignore_conflicts=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(users)} users ({prefix}0..{prefix}{options["users"] - 1}@example.com, '
+            f'{prefix}-staff@example.com), {len(roles)} roles, '
+            f'{len(designations)} designations, password: {options["password"]}'))
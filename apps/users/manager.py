@@ -13,8 +13,11 @@ class CustomUserManager(BaseUserManager):
         if not email:
             raise ValueError('The Email field must be set')
 
+        # imported here, the hashing service needs the apps to be loaded
+        from apps.users.hashing import password_hasher
+
         user = self.model(email=self.normalize_email(email), **extra_fields)
-        user.set_password(password)
+        password_hasher.set_password(user, password)
         user.save(using=self._db)
         return user
 
@@ -26,3 +29,11 @@ class CustomUserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', True)
 
         return self.create_user(email, password, **extra_fields)
+
+    def get_by_natural_key(self, username):
+        '''
+        Return the user used for authentication with its designation joined,
+        the token claims need it right after the password check
+        '''
+        return self.select_related('designation').get(
+            **{self.model.USERNAME_FIELD: username})
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0006_customuser_updated_at_designation_updated_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['designation', 'is_active'], name='users_user_desig_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['designation', 'id'], name='users_user_active_desig_idx'),
+        ),
+        # reverse of the (customuser_id, role_id) unique index of the auto
+        # created through table: users of a role in primary key order
+        migrations.RunSQL(
+            sql='CREATE INDEX users_customuser_roles_role_user_idx '
+                'ON users_customuser_roles (role_id, customuser_id)',
+            reverse_sql='DROP INDEX users_customuser_roles_role_user_idx',
+        ),
+    ]
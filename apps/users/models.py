@@ -15,6 +15,7 @@ class Role(models.Model):
         str: Role Name
     """
     name = models.CharField(max_length=255, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return str(self.name)
@@ -30,6 +31,7 @@ class Designation(models.Model):
         str: Designation Title
     """
     title = models.CharField(max_length=255, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return str(self.title)
@@ -48,8 +50,58 @@ class CustomUser(AbstractUser):
         Role, related_name='users')
     designation = models.ForeignKey(
         Designation, on_delete=models.CASCADE, related_name='users', null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # embedded in issued JWTs, bumping it revokes them
+    token_version = models.PositiveIntegerField(default=0)
     objects = CustomUserManager()
     
     USERNAME_FIELD = 'email'
 
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
+
+    # fields embedded in or guarding issued JWTs, changing one revokes them
+    TOKEN_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['designation', 'is_active'],
+                         name='users_user_desig_active_idx'),
+            # active users by designation, in primary key (page) order
+            models.Index(fields=['designation', 'id'],
+                         condition=models.Q(is_active=True),
+                         name='users_user_active_desig_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.track_token_fields()
+        return instance
+
+    def track_token_fields(self):
+        """
+        Remembers the current `TOKEN_FIELDS` values
+        """
+        self._token_fields = tuple(self.__dict__.get(name)
+                                   for name in self.TOKEN_FIELDS)
+
+    def token_fields_changed(self) -> bool:
+        """
+        Whether the password or a `TOKEN_FIELDS` value changed since the
+        user was loaded or last tracked
+        """
+        loaded = getattr(self, '_token_fields', None)
+        current = tuple(self.__dict__.get(name) for name in self.TOKEN_FIELDS)
+        return self._password is not None or (
+            loaded is not None and loaded != current)
+
+    def save(self, *args, **kwargs):
+        # token_version only moves through revoke_user_tokens(), a stale
+        # instance must never write an older version back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name != 'token_version']
+        super().save(*args, **kwargs)
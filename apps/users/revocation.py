@@ -0,0 +1,276 @@
+'''
+JWT revocation for users app
+
+Single tokens are revoked by `jti` in `CACHES['default']` with a timeout
+equal to their remaining lifetime, so the store never outgrows the set of
+live revoked tokens. Every revocation is also appended to a log
+(`users:revoked:log:<seq>`) from which each process keeps a bloom filter
+in sync: a token that is not in the filter is not revoked, only filter
+hits (revoked tokens and rare false positives) are confirmed against the
+cache.
+
+A revocation is seen at once by the process that made it and within
+`TOKEN_REVOCATION_SYNC_INTERVAL` seconds by the others. The first sequence
+number of every time bucket is kept (`users:revoked:bucket:<n>`) for as
+long as a token revoked then can live, so a filter is rebuilt from the
+oldest entry that can still be live, not from the start of the log.
+
+All tokens of a user are revoked by bumping the user's token version
+(`apps.users.cache.revoke_user_tokens`), checked here for tokens carrying
+the `ver` claim.
+
+Usage:
+    from apps.users.revocation import check_token, revocation_store
+
+    revocation_store.revoke(token)      # logout
+    check_token(token)                  # raises InvalidToken if revoked
+    await acheck_token(token)           # async views
+'''
+import hashlib
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.users.cache import aget_token_version, get_token_version
+
+TOKEN_VERSION_CLAIM = 'ver'
+
+REVOKED_LOG_SEQ_KEY = 'users:revoked:seq'
+# log entries re-read on every sync, covers revocations that took their
+# sequence number but were not written yet at the previous sync
+SYNC_OVERLAP = 64
+SYNC_CHUNK_SIZE = 1000
+# buckets covering the longest token lifetime, read in one call on rebuild
+LOG_BUCKETS = 100
+
+
+def revoked_key(jti) -> str:
+    return f'users:revoked:{jti}'
+
+
+def revoked_log_key(seq) -> str:
+    return f'users:revoked:log:{seq}'
+
+
+def revoked_bucket_key(bucket) -> str:
+    return f'users:revoked:bucket:{bucket}'
+
+
+def _token_lifetime() -> float:
+    # seconds a revoked token (and its log entry) can live at most
+    return max(api_settings.ACCESS_TOKEN_LIFETIME,
+               api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+
+
+def _bucket_seconds() -> int:
+    return max(60, math.ceil(_token_lifetime() / LOG_BUCKETS))
+
+
+class BloomFilter:
+    '''
+    Fixed size bloom filter of strings
+
+    Parameters
+    ----------
+        capacity : `int`
+            number of values the error rate is computed for
+        error_rate : `float`
+            false positive probability at `capacity` values
+    '''
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # double hashing, two 64 bit halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class TokenRevocationStore:
+    '''
+    Revoked `jti`s in the cache behind a per process bloom filter
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._seen = 0
+        # log sequence numbers in the filter from the last SYNC_OVERLAP on,
+        # the overlap is re-read but each entry is added (counted) once
+        self._applied = set()
+        self._last_sync = 0.0
+
+    def _new_bloom(self):
+        return BloomFilter(settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+                           settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE)
+
+    def _next_seq(self) -> int:
+        cache.add(REVOKED_LOG_SEQ_KEY, 0, timeout=None)
+        try:
+            return cache.incr(REVOKED_LOG_SEQ_KEY)
+        except ValueError:
+            # key evicted between add and incr
+            cache.set(REVOKED_LOG_SEQ_KEY, 1, timeout=None)
+            return 1
+
+    def revoke(self, token):
+        '''
+        Revokes a single validated token until it expires
+        '''
+        jti = token[api_settings.JTI_CLAIM]
+        timeout = max(1, math.ceil(token['exp'] - time.time()))
+        cache.set(revoked_key(jti), True, timeout=timeout)
+        seq = self._next_seq()
+        cache.set(revoked_log_key(seq), jti, timeout=timeout)
+        bucket_seconds = _bucket_seconds()
+        # the first revocation of the bucket, its entries expire by then
+        cache.add(revoked_bucket_key(int(time.time() // bucket_seconds)), seq,
+                  timeout=math.ceil(_token_lifetime()) + 2 * bucket_seconds)
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+                self._applied.add(seq)
+
+    def _oldest_live_seq(self, seq) -> int:
+        '''
+        Returns the first sequence number of the buckets whose entries can
+        still be live, `seq + 1` if there are none
+        '''
+        bucket_seconds = _bucket_seconds()
+        now = time.time()
+        first = int((now - _token_lifetime()) // bucket_seconds) - 1
+        keys = [revoked_bucket_key(bucket)
+                for bucket in range(first, int(now // bucket_seconds) + 1)]
+        return min(cache.get_many(keys).values(), default=seq + 1)
+
+    def sync(self):
+        '''
+        Adds the log entries written since the last sync to the bloom filter
+        '''
+        seq = cache.get(REVOKED_LOG_SEQ_KEY) or 0
+        with self._lock:
+            bloom, seen, applied = self._bloom, self._seen, set(self._applied)
+        if bloom is None or seq < seen or bloom.count > bloom.capacity:
+            # first sync, lost sequence or full filter: rebuild from the
+            # oldest log entry that can be live (the overlap covers
+            # revocations of a bucket that took their number out of order)
+            bloom, seen, applied = (self._new_bloom(),
+                                    self._oldest_live_seq(seq) - 1, set())
+        for start in range(max(1, seen - SYNC_OVERLAP + 1), seq + 1, SYNC_CHUNK_SIZE):
+            keys = {revoked_log_key(number): number for number in
+                    range(start, min(start + SYNC_CHUNK_SIZE, seq + 1))
+                    if number not in applied}
+            for key, jti in cache.get_many(list(keys)).items():
+                bloom.add(jti)
+                applied.add(keys[key])
+        with self._lock:
+            if bloom is self._bloom:
+                # revoked by this process during the sync
+                applied |= self._applied
+            self._bloom, self._seen = bloom, seq
+            self._applied = {number for number in applied if number > seq - SYNC_OVERLAP}
+            self._last_sync = time.monotonic()
+
+    def _needs_sync(self) -> bool:
+        return (self._bloom is None or time.monotonic() - self._last_sync
+                >= settings.TOKEN_REVOCATION_SYNC_INTERVAL)
+
+    def _maybe_sync(self):
+        if self._needs_sync():
+            self.sync()
+
+    def is_revoked(self, token) -> bool:
+        '''
+        Whether a validated token was revoked, stays in process for
+        tokens missing from the bloom filter
+        '''
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti is None:
+            return False
+        self._maybe_sync()
+        if jti not in self._bloom:
+            return False
+        return cache.get(revoked_key(jti)) is not None
+
+    async def ais_revoked(self, token) -> bool:
+        '''
+        Async `is_revoked`
+        '''
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti is None:
+            return False
+        if self._needs_sync():
+            await sync_to_async(self.sync)()
+        if jti not in self._bloom:
+            return False
+        return await cache.aget(revoked_key(jti)) is not None
+
+    def reset(self):
+        with self._lock:
+            self._bloom = None
+            self._seen = 0
+            self._applied = set()
+            self._last_sync = 0.0
+
+
+revocation_store = TokenRevocationStore()
+
+
+def check_token(token):
+    '''
+    Raises if a validated token was revoked, by `jti` or by a newer token
+    version of its user
+
+    Raises
+    ------
+        `InvalidToken`
+            if the token was revoked
+        `AuthenticationFailed`
+            if the user no longer exists or is inactive
+    '''
+    if revocation_store.is_revoked(token):
+        raise InvalidToken(_('Token has been revoked'))
+    if TOKEN_VERSION_CLAIM in token:
+        _check_version(token, get_token_version(token[api_settings.USER_ID_CLAIM]))
+
+
+async def acheck_token(token):
+    '''
+    Async `check_token`
+    '''
+    if await revocation_store.ais_revoked(token):
+        raise InvalidToken(_('Token has been revoked'))
+    if TOKEN_VERSION_CLAIM in token:
+        _check_version(
+            token, await aget_token_version(token[api_settings.USER_ID_CLAIM]))
+
+
+def _check_version(token, version):
+    if version is None:
+        raise AuthenticationFailed(_('User not found or inactive'),
+                                   code='user_inactive')
+    if token[TOKEN_VERSION_CLAIM] != version:
+        raise InvalidToken(_('Token has been revoked'))
@@ -0,0 +1,162 @@
+'''
+Read replica routing for users app
+
+Reads of `apps.users` models made while handling a safe method request
+(GET, HEAD, OPTIONS) go to one of `DATABASE_REPLICAS`, everything else
+goes to the primary (`default`).
+
+Read your writes: a request that wrote reads from the primary for the
+rest of the request, and users whose data changed are pinned to the
+primary for `DATABASE_REPLICA_PIN_SECONDS` (longer than the replica lag),
+so their next requests do not see the replica's older rows.
+Role/designation changes touch every profile and pin everybody.
+
+Usage:
+    DATABASE_ROUTERS = ['apps.users.routers.ReplicaRouter']
+    DATABASE_REPLICAS = ['replica']
+    MIDDLEWARE = [..., 'apps.users.routers.ReplicaRoutingMiddleware']
+
+    from apps.users.routers import pin_to_primary
+
+    pin_to_primary(user.id)
+'''
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+ROUTED_APP_LABELS = ('users',)
+PIN_ALL_KEY = 'users:db_pin:all'
+
+_routing_state = ContextVar('users_db_routing_state', default=None)
+
+
+def pin_key(user_id) -> str:
+    return f'users:db_pin:{user_id}'
+
+
+def pin_to_primary(*user_ids):
+    '''
+    Sends the reads of the given users to the primary for a while
+    '''
+    if user_ids and settings.DATABASE_REPLICAS:
+        cache.set_many({pin_key(user_id): True for user_id in user_ids},
+                       timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def pin_all_to_primary():
+    '''
+    Sends every read to the primary for a while
+    '''
+    if settings.DATABASE_REPLICAS:
+        cache.set(PIN_ALL_KEY, True, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def _request_user_id(request):
+    user = getattr(request, 'user', None)
+    if user is None:
+        return None
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        # session user not loaded yet, loading it here would query
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+class RoutingState:
+    '''
+    Routing decisions of one request
+    '''
+    __slots__ = ('request', 'read_only', 'wrote', 'pinned')
+
+    def __init__(self, request):
+        self.request = request
+        self.read_only = request.method in SAFE_METHODS
+        self.wrote = False
+        self.pinned = None
+
+    def use_replica(self) -> bool:
+        if not self.read_only or self.wrote:
+            return False
+        if self.pinned is None:
+            user_id = _request_user_id(self.request)
+            keys = [PIN_ALL_KEY] if user_id is None else [PIN_ALL_KEY, pin_key(user_id)]
+            pinned = bool(cache.get_many(keys))
+            if user_id is None and not pinned:
+                # the user may be authenticated later in the request
+                return True
+            self.pinned = pinned
+        return not self.pinned
+
+
+class ReplicaRouter:
+    '''
+    Sends safe method reads of `apps.users` models to a replica
+    '''
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in ROUTED_APP_LABELS:
+            return None
+        state = _routing_state.get()
+        if not settings.DATABASE_REPLICAS or state is None or not state.use_replica():
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    '''
+    Tracks the request for `ReplicaRouter` and pins users that wrote to
+    the primary
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState(request)
+        token = _routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+        self.finish(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState(request)
+        token = _routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing_state.reset(token)
+        if state.wrote:
+            await sync_to_async(self.finish)(request, state)
+        return response
+
+    @staticmethod
+    def finish(request, state):
+        if state.wrote:
+            user_id = _request_user_id(request)
+            if user_id is not None:
+                pin_to_primary(user_id)
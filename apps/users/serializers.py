@@ -1,12 +1,20 @@
-from webbrowser import get
-
+from django.conf import settings
 from django.db import transaction
-from django.http import Http404
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
+                                                  TokenRefreshSerializer,
+                                                  TokenVerifySerializer)
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+
+from django_drf_boilerplate.utils.serializers import CompiledSerializer
 
+from .cache import designation_lookup, role_lookup
+from .errors import UserErrorMessages
+from .loaders import load_user_relations
 from .models import CustomUser, Designation, Role
+from .revocation import TOKEN_VERSION_CLAIM, check_token
+from .signals import batch_role_changes
 
 
 class RoleSerializer(serializers.ModelSerializer):
@@ -48,8 +56,16 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ('id', 'email',
                   'first_name', 'last_name', 'password', 'roles', 'designation')
 
+    def validate_email(self, value):
+        # the email becomes the username, which an imported user may hold
+        if CustomUser.objects.filter(username=value).exists():
+            raise serializers.ValidationError(UserErrorMessages.USER_ALREADY_EXISTS.value)
+        return value
+
     def create(self, validated_data):
+        # username is unique, the email stands in for it like in the importer
         user = CustomUser.objects.create_user(email=validated_data['email'],
+                                              username=validated_data['email'],
                                               first_name=validated_data['first_name'],
                                               last_name=validated_data['last_name'],
                                               password=validated_data['password'])
@@ -72,6 +88,47 @@ class UserSerializer(serializers.ModelSerializer):
         return instance
 
 
+class RoleReadSerializer(CompiledSerializer):
+    """
+    Read-only Role Serializer for the list views
+    """
+    serializer_class = RoleSerializer
+
+
+class DesignationReadSerializer(CompiledSerializer):
+    """
+    Read-only Designation Serializer for the list views
+    """
+    serializer_class = DesignationSerializer
+
+
+class UserReadSerializer(CompiledSerializer):
+    """
+    Read-only User Serializer for the profile and user list
+    """
+    serializer_class = UserSerializer
+
+
+class UserImportSerializer(UserSerializer):
+    """
+    User Import Serializer
+
+    Validates one row of a bulk import with the `UserSerializer` field rules.
+    Roles and designation are given by name, email uniqueness is checked per
+    chunk by the importer instead of one query per row.
+    """
+    username = serializers.CharField(max_length=150, required=False)
+    roles = serializers.ListField(
+        child=serializers.CharField(max_length=255), required=False)
+    designation = serializers.CharField(
+        max_length=255, required=False, allow_blank=True)
+
+    class Meta(UserSerializer.Meta):
+        """ Meta Class For User Import"""
+        fields = UserSerializer.Meta.fields + ('username',)
+        extra_kwargs = {'email': {'validators': []}}
+
+
 # class LoginResponseSerializer(serializers.Serializer):
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     """
@@ -86,11 +143,15 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
         token = super().get_token(user)
+        load_user_relations(user)
         # Add custom claims
         if user.designation:
             token['designation'] = user.designation.title
-        if user.roles:
-            token['roles'] = [role.name for role in user.roles.all()]
+        token['roles'] = [role.name for role in user.roles.all()]
+        # read by StatelessJWTAuthentication instead of loading the user
+        token['is_staff'] = user.is_staff
+        token['is_superuser'] = user.is_superuser
+        token[TOKEN_VERSION_CLAIM] = user.token_version
         return token
 
     def create(self, validated_data):
@@ -100,6 +161,55 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         pass
 
 
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token Refresh Serializer rejecting revoked refresh tokens
+    """
+
+    def validate(self, attrs):
+        check_token(RefreshToken(attrs['refresh']))
+        return super().validate(attrs)
+
+
+class CustomTokenVerifySerializer(TokenVerifySerializer):
+    """
+    Token Verify Serializer rejecting revoked tokens
+    """
+
+    def validate(self, attrs):
+        check_token(UntypedToken(attrs['token']))
+        return super().validate(attrs)
+
+
+class UserBatchSerializer(serializers.Serializer):
+    """
+    User Batch Lookup Serializer
+    """
+    # larger ids overflow the BIGINT parameters of the query
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1),
+        required=False, default=list)
+    emails = serializers.ListField(child=serializers.EmailField(),
+                                   required=False, default=list)
+
+    def validate(self, attrs):
+        size = len(attrs['ids']) + len(attrs['emails'])
+        if not size:
+            raise serializers.ValidationError(UserErrorMessages.EMPTY_USER_BATCH.value)
+        if size > settings.USER_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                UserErrorMessages.USER_BATCH_TOO_LARGE.value.format(
+                    max_size=settings.USER_BATCH_MAX_SIZE))
+        return attrs
+
+
+class LogoutSerializer(serializers.Serializer):
+    """
+    Logout Serializer
+    """
+    refresh = serializers.CharField(required=False)
+
+
 class ManageUserRolesSerializer(serializers.ModelSerializer):
     """
     Manage User Roles Serializer
@@ -116,26 +226,36 @@ class ManageUserRolesSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         roles_data = validated_data.pop('roles', [])
+        if not roles_data:
+            return instance
 
-        # instance = super().update(instance, validated_data)
-        with transaction.atomic():
-            if roles_data:
-                instance.roles.clear()
-                for role in roles_data:
-                    instance.roles.add(role)
-            instance.save()
+        # uses the prefetched roles when the user came from the loader
+        current = {role.pk for role in instance.roles.all()}
+        wanted = {role.pk for role in roles_data}
+        removed, added = current - wanted, wanted - current
+        if removed or added:
+            with transaction.atomic(), batch_role_changes():
+                if removed:
+                    instance.roles.remove(*removed)
+                if added:
+                    instance.roles.add(*added)
         return instance
 
     def to_internal_value(self, data):
-        if 'roles' in data:
-            roles = data.pop('roles')
-            try:
-                data['roles'] = [get_object_or_404(
-                    Role, name=role['name'].upper()).id for role in roles]
-            except Http404:
-                raise serializers.ValidationError(
-                    {'roles': 'Role not found'})
-        return super().to_internal_value(data)
+        if 'roles' not in data:
+            return super().to_internal_value(data)
+        names = list(dict.fromkeys(
+            role['name'].upper() for role in data['roles']))
+        roles = role_lookup.resolve(names)
+        missing = [name for name in names if name not in roles]
+        if missing:
+            raise serializers.ValidationError({
+                'roles': UserErrorMessages.ROLE_NOT_FOUND.value.format(
+                    names=', '.join(missing))})
+        ret = super().to_internal_value(
+            {key: value for key, value in data.items() if key != 'roles'})
+        ret['roles'] = [roles[name] for name in names]
+        return ret
 
 
 class ManageUserDesignation(serializers.ModelSerializer):
@@ -160,12 +280,14 @@ class ManageUserDesignation(serializers.ModelSerializer):
         return instance
 
     def to_internal_value(self, data):
-        if 'designation' in data:
-            designation = data.pop('designation')
-            try:
-                data['designation'] = get_object_or_404(
-                    Designation, title=designation['title'].upper()).id
-            except Http404:
-                raise serializers.ValidationError(
-                    {'designation': _('Designation not found')})
-        return super().to_internal_value(data)
+        if 'designation' not in data:
+            return super().to_internal_value(data)
+        designation = designation_lookup.resolve(
+            [data['designation']['title']])
+        if not designation:
+            raise serializers.ValidationError(
+                {'designation': UserErrorMessages.DESIGNATION_NOT_FOUND.value})
+        ret = super().to_internal_value(
+            {key: value for key, value in data.items() if key != 'designation'})
+        ret['designation'], = designation.values()
+        return ret
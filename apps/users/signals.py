@@ -1,9 +1,117 @@
-from django.db.models.signals import post_save
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from .models import CustomUser
+from django.utils import timezone
+
+from apps.users.cache import (designation_lookup, invalidate_all_profiles,
+                              invalidate_user_profile, revoke_user_tokens,
+                              role_lookup)
+
+from apps.users.routers import pin_all_to_primary, pin_to_primary
+from apps.users.tasks import user_registered
+
+from .models import CustomUser, Designation, Role
+
+# {user pk: instance or None} of the role changes of a batch_role_changes block
+_batched_role_changes = ContextVar('batched_role_changes', default=None)
 
 
 @receiver(post_save, sender=CustomUser)
 def user_post_save(sender, instance, created, **kwargs):
     if created:
-        print(f'New user created: {instance.username}')
+        # run by a worker once the user is committed
+        user_registered.delay_on_commit(instance.pk)
+    else:
+        invalidate_user_profile(instance.pk)
+        pin_to_primary(instance.pk)
+        if instance.token_fields_changed():
+            # deactivated, password or staff flags changed
+            revoke_user_tokens(instance.pk)
+    instance.track_token_fields()
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_post_delete(sender, instance, **kwargs):
+    invalidate_user_profile(instance.pk)
+    revoke_user_tokens(instance.pk)
+
+
+def _roles_changed(users: dict):
+    '''
+    Keeps Last-Modified of the profiles moving with their roles, one
+    update for all the users
+    '''
+    now = timezone.now()
+    CustomUser.objects.filter(pk__in=list(users)).update(updated_at=now)
+    for instance in users.values():
+        if instance is not None:
+            instance.updated_at = now
+    invalidate_user_profile(*users)
+    pin_to_primary(*users)
+
+
+@contextmanager
+def batch_role_changes():
+    '''
+    Handles the role changes made in the block together when it exits, so
+    a remove then an add touch each user once
+
+    Usage:
+        with transaction.atomic(), batch_role_changes():
+            user.roles.remove(*removed)
+            user.roles.add(*added)
+    '''
+    if _batched_role_changes.get() is not None:
+        # nested, the outer block handles them
+        yield
+        return
+    users = {}
+    token = _batched_role_changes.set(users)
+    try:
+        yield
+    finally:
+        _batched_role_changes.reset(token)
+    if users:
+        _roles_changed(users)
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def user_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        # add() of roles the user already has
+        return
+    if not reverse:
+        # user.roles.add(...)
+        users = {instance.pk: instance}
+    elif pk_set:
+        # role.users.add(...)
+        users = dict.fromkeys(pk_set)
+    else:
+        # role.users.clear() does not report the affected users
+        invalidate_all_profiles()
+        pin_all_to_primary()
+        return
+    batch = _batched_role_changes.get()
+    if batch is None:
+        _roles_changed(users)
+    else:
+        batch.update(users)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_save, sender=Designation)
+@receiver(post_delete, sender=Role)
+@receiver(post_delete, sender=Designation)
+def lookup_changed(sender, instance, created=False, **kwargs):
+    lookup = role_lookup if sender is Role else designation_lookup
+    lookup.invalidate_on_commit()
+    if created:
+        # nobody has a new role or designation yet
+        return
+    # role names and designation titles are embedded in every profile
+    invalidate_all_profiles()
+    pin_all_to_primary()
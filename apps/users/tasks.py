@@ -0,0 +1,42 @@
+'''
+Background tasks of users app, run by `manage.py run_worker`
+
+Usage:
+    from apps.users.tasks import user_registered
+
+    user_registered.delay_on_commit(user.pk)
+'''
+import logging
+
+from django.conf import settings
+
+from apps.tasks.queue import task
+from apps.users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+
+@task
+def user_registered(user_id):
+    '''
+    Follow-up work of a new user (welcome email, audit record, search
+    indexing), off the request that created it
+    '''
+    user = CustomUser.objects.filter(pk=user_id).only('username').first()
+    if user is None:
+        # deleted before the worker got to it
+        return
+    logger.info('New user created: %s', user.username)
+
+
+# not retried: rows committed by a failed run would be reported as
+# duplicates by the next one
+@task(max_retries=0, visibility_timeout=settings.USER_IMPORT_TIMEOUT)
+def import_users_file(job_id, path, file_format, batch_size=None):
+    '''
+    Runs an import job of the import endpoint
+    '''
+    from apps.users.importers import run_import_job
+
+    job = run_import_job(job_id, path, file_format, batch_size=batch_size)
+    logger.info('Import job %s %s', job_id, job['status'])
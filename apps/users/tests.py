@@ -1,3 +1,1166 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import signal
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from uuid import UUID
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import JsonResponse
+from django.test import (AsyncRequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import resolve, reverse
+from django.utils.translation import gettext_lazy
+from prometheus_client import REGISTRY
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from apps.tasks.backends import get_backend
+from apps.tasks.worker import Worker
+from apps.users import async_views
+from apps.users.authentication import ClaimsUser
+from apps.users.cache import (designation_lookup, get_cached_profile,
+                              get_token_version, profile_cache_stats,
+                              revoke_user_tokens, role_lookup)
+from apps.users.dataloaders import BatchLoader
+from apps.users.hashing import password_hasher
+from apps.users.loaders import load_user, profile_queryset
+from apps.users.models import CustomUser, Designation, Role
+from apps.users.revocation import (REVOKED_LOG_SEQ_KEY, BloomFilter,
+                                   TokenRevocationStore, revocation_store)
+from apps.users.routers import ReplicaRouter
+from apps.users.serializers import (CustomTokenObtainPairSerializer,
+                                    RoleReadSerializer, RoleSerializer,
+                                    UserReadSerializer, UserSerializer)
+from apps.users.throttling import CacheGCRABackend
+from django_drf_boilerplate.utils.database import postgres_database
+from django_drf_boilerplate.utils.logger import AsyncQueueHandler
+from django_drf_boilerplate.utils.query_budget import (QueryBudget,
+                                                      QueryBudgetExceeded,
+                                                      assert_query_budget)
+from django_drf_boilerplate.utils.renderers import FastJSONRenderer
+from django_drf_boilerplate.utils.response import ApiResponse
+from django_drf_boilerplate.utils.serializers import CompiledSerializer
+from django_drf_boilerplate.utils.tracing import JsonFormatter
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+USERS_TEST_SETTINGS = {
+    'CACHES': LOCMEM_CACHES,
+    'TASKS_BACKEND': 'memory',
+    'PASSWORD_HASHERS': ['django.contrib.auth.hashers.MD5PasswordHasher'],
+}
+
+
+class UsersTestMixin:
+    '''
+    Local memory cache and an authenticated user
+    '''
+
+    def setUp(self):
+        cache.clear()
+        profile_cache_stats.reset()
+        revocation_store.reset()
+        self.designation = Designation.objects.create(title='ENGINEER')
+        self.role = Role.objects.create(name='ADMIN')
+        self.user = CustomUser.objects.create_user(
+            email='user@example.com', password='secret-pass-123',
+            username='user', first_name='Test', last_name='User',
+            designation=self.designation)
+        self.user.roles.add(self.role)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+@override_settings(**USERS_TEST_SETTINGS)
+class UsersTestCase(UsersTestMixin, TestCase):
+    '''
+    Base test case with a local memory cache and an authenticated user
+    '''
+
+
+@override_settings(**USERS_TEST_SETTINGS)
+class UsersTransactionTestCase(UsersTestMixin, TransactionTestCase):
+    '''
+    `UsersTestCase` with committed rows, for code reading them from other
+    threads
+    '''
+
+
+class ProfileCacheTests(UsersTestCase):
+
+    def get_profile(self):
+        response = self.client.get(reverse('get_user_profile'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['data']
+
+    def test_profile_not_modified(self):
+        response = self.client.get(reverse('get_user_profile'))
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        response = self.client.get(reverse('get_user_profile'),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.user.roles.add(Role.objects.create(name='EDITOR'))
+        response = self.client.get(reverse('get_user_profile'),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_profile_is_served_from_cache(self):
+        first = self.get_profile()
+        with self.assertNumQueries(0):
+            second = self.get_profile()
+        self.assertEqual(first, second)
+        self.assertEqual(profile_cache_stats.local(),
+                         {'hits': 1, 'misses': 1})
+
+    def test_user_save_invalidates_profile(self):
+        self.get_profile()
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertIsNone(get_cached_profile(self.user.id))
+        self.assertEqual(self.get_profile()['first_name'], 'Changed')
+
+    def test_roles_change_invalidates_profile(self):
+        self.get_profile()
+        self.user.roles.add(Role.objects.create(name='EDITOR'))
+        self.assertEqual(len(self.get_profile()['roles']), 2)
+
+    def test_adding_a_held_role_changes_nothing(self):
+        self.get_profile()
+        updated_at = CustomUser.objects.get(pk=self.user.pk).updated_at
+        # existing through rows check only
+        with self.assertNumQueries(1):
+            self.user.roles.add(self.role)
+        self.assertIsNotNone(get_cached_profile(self.user.id))
+        self.assertEqual(CustomUser.objects.get(pk=self.user.pk).updated_at, updated_at)
+
+    def test_lookup_edit_invalidates_profile(self):
+        self.get_profile()
+        self.designation.title = 'MANAGER'
+        self.designation.save()
+        self.assertEqual(self.get_profile()['designation']['title'], 'MANAGER')
+
+
+class QueryCountTests(UsersTestCase):
+    '''
+    Fixed query counts per endpoint, a failure here usually means an N+1
+    crept back into the serializers
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.user.roles.add(*[Role.objects.create(name=f'ROLE{i}')
+                              for i in range(5)])
+        Role.objects.create(name='EDITOR')
+        Designation.objects.create(title='MANAGER')
+        # role and designation names are resolved from the lookup cache
+        role_lookup.all()
+        designation_lookup.all()
+
+    def test_login(self):
+        # user joined with designation, roles prefetch
+        with self.assertNumQueries(2):
+            response = APIClient().post(reverse('token_obtain_pair'), {
+                'email': 'user@example.com', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile(self):
+        # user joined with designation, roles prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('get_user_profile'))
+        self.assertEqual(len(response.json()['data']['roles']), 6)
+
+    def test_update_designation(self):
+        # load user, roles prefetch, update
+        with self.assertNumQueries(3):
+            response = self.client.put(reverse('update_user_designation'), {
+                'designation': {'title': 'manager'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_roles(self):
+        # load user, roles prefetch, savepoint, delete of the removed roles,
+        # existing through rows check, insert, one updated_at bump, release
+        with self.assertNumQueries(8):
+            response = self.client.put(reverse('update_user_roles'), {
+                'roles': [{'name': 'admin'}, {'name': 'editor'}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(self.user.roles.values_list('name', flat=True)),
+                         ['ADMIN', 'EDITOR'])
+
+    def test_update_roles_unchanged(self):
+        roles = [{'name': name} for name in
+                 self.user.roles.values_list('name', flat=True)]
+        # load user, roles prefetch and no writes
+        with self.assertNumQueries(2):
+            response = self.client.put(reverse('update_user_roles'),
+                                       {'roles': roles}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_roles_reports_missing_names(self):
+        response = self.client.put(reverse('update_user_roles'), {
+            'roles': [{'name': 'admin'}, {'name': 'ghost'}, {'name': 'nope'}]},
+            format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'],
+                         {'roles': 'Role not found: GHOST, NOPE'})
+
+
+class StatelessAuthenticationTests(UsersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        response = APIClient().post(reverse('token_obtain_pair'), {
+            'email': 'user@example.com', 'password': 'secret-pass-123'})
+        self.token = response.json()['access']
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_cached_profile_needs_no_query(self):
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('get_user_profile'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_check_uses_claims(self):
+        self.client.get(reverse('get_user_profile'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('user_list'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_user_row_is_loaded_lazily(self):
+        user = ClaimsUser(AccessToken(self.token))
+        self.assertFalse(user.is_staff)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'user@example.com')
+            self.assertEqual(user.designation.title, 'ENGINEER')
+
+    def test_user_members_come_from_the_row(self):
+        user = ClaimsUser(AccessToken(self.token))
+        self.assertEqual(user.get_username(), 'user@example.com')
+        self.assertFalse(user.has_perm('users.change_role'))
+        self.assertEqual(user, self.user)
+        superuser = CustomUser.objects.create_superuser(
+            email='admin@example.com', password='secret-pass-123',
+            username='admin', first_name='Admin', last_name='User')
+        claims = ClaimsUser(CustomTokenObtainPairSerializer.get_token(superuser).access_token)
+        self.assertTrue(claims.is_superuser)
+        self.assertTrue(claims.has_perm('users.change_role'))
+        self.assertTrue(claims.has_module_perms('users'))
+        self.assertTrue(claims.check_password('secret-pass-123'))
+
+    def test_deactivation_revokes_tokens(self):
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 401)
+
+    def test_password_change_revokes_tokens(self):
+        self.client.get(reverse('get_user_profile'))
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.set_password('another-pass-456')
+        user.save()
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 401)
+
+    def test_stale_instance_keeps_token_version(self):
+        stale = CustomUser.objects.get(pk=self.user.pk)
+        revoke_user_tokens(self.user.pk)
+        stale.first_name = 'Changed'
+        stale.save()
+        self.assertEqual(get_token_version(self.user.pk), 1)
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 401)
+
+
+class RevocationTests(UsersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tokens = APIClient().post(reverse('token_obtain_pair'), {
+            'email': 'user@example.com', 'password': 'secret-pass-123'}).json()
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def refresh(self):
+        return APIClient().post(reverse('token_refresh'),
+                                {'refresh': self.tokens['refresh']})
+
+    def test_logout_revokes_access_and_refresh(self):
+        response = self.client.post(reverse('logout_user'),
+                                    {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 401)
+        self.assertEqual(self.refresh().status_code, 401)
+        response = APIClient().post(reverse('token_verify'),
+                                    {'token': self.tokens['access']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_processes_see_revocations_after_sync(self):
+        other = TokenRevocationStore()
+        access = AccessToken(self.tokens['access'])
+        self.assertFalse(other.is_revoked(access))
+        revocation_store.revoke(access)
+        # still within the sync interval of the other process
+        self.assertFalse(other.is_revoked(access))
+        other.sync()
+        self.assertTrue(other.is_revoked(access))
+        self.assertFalse(other.is_revoked(RefreshToken(self.tokens['refresh'])))
+
+    def test_sync_counts_each_revocation_once(self):
+        other = TokenRevocationStore()
+        other.sync()
+        revocation_store.sync()
+        revocation_store.revoke(AccessToken(self.tokens['access']))
+        revocation_store.revoke(RefreshToken(self.tokens['refresh']))
+        for _ in range(3):
+            other.sync()
+            revocation_store.sync()
+        self.assertEqual((other._bloom.count, revocation_store._bloom.count), (2, 2))
+
+    def test_rebuild_starts_at_the_oldest_live_entry(self):
+        # a long running log, its old entries expired
+        cache.set(REVOKED_LOG_SEQ_KEY, 100000, timeout=None)
+        access = AccessToken(self.tokens['access'])
+        revocation_store.revoke(access)
+        other = TokenRevocationStore()
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            other.sync()
+        self.assertTrue(other.is_revoked(access))
+        self.assertLess(sum(len(call.args[0]) for call in get_many.call_args_list), 200)
+
+    def test_revoke_all_sessions_rejects_refresh(self):
+        self.assertEqual(self.refresh().status_code, 200)
+        admin = CustomUser.objects.create_superuser(
+            email='admin@example.com', password='secret-pass-123',
+            username='admin', first_name='Admin', last_name='User')
+        client = APIClient()
+        client.force_login(admin)
+        response = client.post(reverse('admin:users_customuser_changelist'), {
+            'action': 'revoke_all_sessions', '_selected_action': [self.user.pk]})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.refresh().status_code, 401)
+        self.assertEqual(self.client.get(reverse('get_user_profile')).status_code, 401)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom.add(f'jti-{number}')
+        self.assertTrue(all(f'jti-{number}' in bloom for number in range(1000)))
+        false_positives = sum(f'other-{number}' in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class AdminTests(UsersTestCase):
+
+    def test_admin_add_user_sets_email(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        client = APIClient()
+        client.force_login(self.user)
+        for number in range(2):
+            response = client.post(reverse('admin:users_customuser_add'), {
+                'username': f'added{number}', 'email': f'added{number}@example.com',
+                'first_name': 'Added', 'last_name': 'User',
+                'password1': 'secret-pass-123', 'password2': 'secret-pass-123'})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(CustomUser.objects.filter(username__startswith='added')
+                 .order_by('username').values_list('email', flat=True)),
+            ['added0@example.com', 'added1@example.com'])
+
+
+class ThrottleTests(UsersTestCase):
+
+    def test_gcra_spreads_the_limit_over_the_period(self):
+        backend = CacheGCRABackend()
+        results = [backend.check('throttle:test', 3, 60) for _ in range(4)]
+        self.assertEqual([result.allowed for result in results],
+                         [True, True, True, False])
+        self.assertEqual([result.remaining for result in results[:3]], [2, 1, 0])
+        self.assertAlmostEqual(results[3].retry_after, 20, delta=1)
+
+    def test_register_is_limited_per_ip(self):
+        client = APIClient()
+        for number in range(5):
+            # throttles run before validation
+            response = client.post(reverse('register_user'), {})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.headers['X-RateLimit-Limit'], '5')
+            self.assertEqual(response.headers['X-RateLimit-Remaining'],
+                             str(4 - number))
+        response = client.post(reverse('register_user'), {})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers['Retry-After']), 0)
+        self.assertEqual(response.headers['X-RateLimit-Remaining'], '0')
+
+
+class AsyncViewTests(UsersTransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tokens = APIClient().post(reverse('token_obtain_pair'), {
+            'email': 'user@example.com', 'password': 'secret-pass-123'}).json()
+        self.sync_profile = self.client.get(reverse('get_user_profile')).json()
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    def profile_request(self, access=None, **headers):
+        if access is not None:
+            headers['Authorization'] = f'Bearer {access}'
+        return self.factory.get('/api/profile/', headers=headers)
+
+    def login_request(self, password='secret-pass-123'):
+        return self.factory.post('/api/login/', {
+            'email': 'user@example.com', 'password': password},
+            content_type='application/json')
+
+    async def test_profile_matches_sync_view(self):
+        response = await async_views.get_user_profile(
+            self.profile_request(self.tokens['access']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), self.sync_profile)
+        response = await async_views.get_user_profile(self.profile_request(
+            self.tokens['access'], if_none_match=response.headers['ETag']))
+        self.assertEqual(response.status_code, 304)
+
+    async def test_profile_requires_a_valid_token(self):
+        response = await async_views.get_user_profile(self.profile_request())
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response.headers)
+        response = await async_views.get_user_profile(self.profile_request('nope'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_login_and_refresh(self):
+        response = await async_views.token_obtain_pair(self.login_request())
+        self.assertEqual(response.status_code, 200)
+        tokens = json.loads(response.content)
+        response = await async_views.get_user_profile(
+            self.profile_request(tokens['access']))
+        self.assertEqual(response.status_code, 200)
+        response = await async_views.token_refresh(self.factory.post(
+            '/api/token/refresh/', {'refresh': tokens['refresh']},
+            content_type='application/json'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', json.loads(response.content))
+
+    async def test_logins_run_concurrently(self):
+        # both password checks must be in flight at once to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+        authenticate = async_views.authenticate
+
+        def blocking_authenticate(request, **credentials):
+            barrier.wait()
+            return authenticate(request, **credentials)
+
+        with mock.patch.object(async_views, 'authenticate', blocking_authenticate):
+            responses = await asyncio.gather(
+                async_views.token_obtain_pair(self.login_request()),
+                async_views.token_obtain_pair(self.login_request()))
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+
+    async def test_login_rejects_bad_credentials(self):
+        response = await async_views.token_obtain_pair(self.login_request('wrong'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_refresh_rejects_revoked_tokens(self):
+        revocation_store.revoke(RefreshToken(self.tokens['refresh']))
+        response = await async_views.token_refresh(self.factory.post(
+            '/api/token/refresh/', {'refresh': self.tokens['refresh']},
+            content_type='application/json'))
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(UsersTestCase):
+    '''
+    `replica` is a separate, empty test database: rows only found on the
+    primary show which database a request read from
+    '''
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        # drop the pins of the setUp writes
+        cache.clear()
+
+    def get_profile(self):
+        return self.client.get(reverse('get_user_profile')).json()
+
+    def test_safe_reads_go_to_the_replica(self):
+        self.assertEqual(self.get_profile()['message'], 'User not found')
+
+    def test_lookups_are_loaded_from_the_primary(self):
+        response = self.client.get(reverse('role_list'))
+        self.assertEqual([role['name'] for role in response.json()['results']],
+                         ['ADMIN'])
+
+    def test_writers_read_their_writes(self):
+        Designation.objects.create(title='MANAGER')
+        cache.clear()
+        response = self.client.put(reverse('update_user_designation'), {
+            'designation': {'title': 'manager'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        profile = self.get_profile()
+        self.assertEqual(profile['data']['designation']['title'], 'MANAGER')
+        cache.clear()
+        self.assertEqual(self.get_profile()['message'], 'User not found')
+
+    def test_changed_users_are_pinned_to_the_primary(self):
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.get_profile()['data']['first_name'], 'Changed')
+
+    def test_router_outside_requests_uses_the_primary(self):
+        self.assertEqual(ReplicaRouter().db_for_read(CustomUser), 'default')
+        self.assertIsNone(ReplicaRouter().db_for_read(Session))
+
+
+class RequestTracingTests(UsersTestCase):
+
+    def get_profile(self, **headers):
+        with self.assertLogs('django_drf_boilerplate.requests', 'INFO') as logs:
+            response = self.client.get(reverse('get_user_profile'), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response, logs.records[0]
+
+    def test_request_id_is_generated_or_propagated(self):
+        response, _ = self.get_profile()
+        self.assertRegex(response.headers['X-Request-ID'], r'^[0-9a-f]{32}$')
+        response, _ = self.get_profile(**{'X-Request-ID': 'lb-7f3a.42'})
+        self.assertEqual(response.headers['X-Request-ID'], 'lb-7f3a.42')
+        response, _ = self.get_profile(**{'X-Request-ID': 'bad id\r\n'})
+        self.assertNotEqual(response.headers['X-Request-ID'], 'bad id')
+
+    def test_queries_are_timed(self):
+        response, record = self.get_profile()
+        self.assertGreater(record.db_queries, 0)
+        self.assertEqual(record.view, 'get_user_profile')
+        self.assertIn(f'desc="{record.db_queries} queries"', response.headers['Server-Timing'])
+        # served from the cache
+        _, record = self.get_profile()
+        self.assertEqual(record.db_queries, 0)
+
+    def test_json_formatter(self):
+        _, record = self.get_profile()
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data['logger'], 'django_drf_boilerplate.requests')
+        self.assertEqual(data['status'], 200)
+        self.assertEqual(data['db_queries'], record.db_queries)
+        self.assertIn('duration_ms', data)
+
+
+class MetricsTests(UsersTestCase):
+
+    @staticmethod
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_are_recorded_by_view(self):
+        labels = {'view': 'get_user_profile', 'method': 'GET', 'status': '200'}
+        before = self.sample('http_request_duration_seconds_count', **labels)
+        queries = self.sample('http_request_db_queries_sum', view='get_user_profile')
+        self.client.get(reverse('get_user_profile'))
+        self.assertEqual(self.sample('http_request_duration_seconds_count', **labels),
+                         before + 1)
+        self.assertGreater(self.sample('http_request_db_queries_sum',
+                                       view='get_user_profile'), queries)
+
+    def test_throttle_rejections_are_counted(self):
+        before = self.sample('throttle_rejections_total', scope='register')
+        client = APIClient()
+        for _ in range(6):
+            client.post(reverse('register_user'), {})
+        self.assertEqual(self.sample('throttle_rejections_total', scope='register'),
+                         before + 1)
+
+    def test_password_hashes_are_timed(self):
+        before = self.sample('password_hash_duration_seconds_count')
+        password_hasher.set_password(self.user, 'another-secret-456')
+        self.assertEqual(self.sample('password_hash_duration_seconds_count'), before + 1)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('get_user_profile'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_request_duration_seconds_bucket{', response.content)
+        with self.settings(METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'),
+                                       headers={'Authorization': 'Bearer scrape-token'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_metrics_need_a_token_in_production(self):
+        with self.settings(ENV='production', METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        with self.settings(ENV='production', METRICS_TOKEN='scrape-token'):
+            response = self.client.get(reverse('metrics'),
+                                       headers={'Authorization': 'Bearer scrape-token'})
+            self.assertEqual(response.status_code, 200)
+
+
+class QueryBudgetTests(UsersTestCase):
+
+    def test_view_within_budget(self):
+        with assert_query_budget('get_user_profile') as recorder:
+            self.client.get(reverse('get_user_profile'))
+        self.assertTrue(recorder.queries)
+
+    def test_assert_query_budget_reports_queries(self):
+        with self.assertRaisesRegex(AssertionError, r'queries > 0(.|\n)*apps/users/'):
+            with assert_query_budget(max_queries=0):
+                self.client.get(reverse('get_user_profile'))
+
+    @override_settings(QUERY_BUDGETS={'role_list': {'max_queries': 0}})
+    def test_overrun_raises_in_development(self):
+        with self.assertRaisesRegex(QueryBudgetExceeded, 'role_list'):
+            self.client.get(reverse('role_list'))
+
+    def test_write_overrun_says_the_write_was_applied(self):
+        Designation.objects.create(title='MANAGER')
+        view = resolve(reverse('update_user_designation')).func
+        with (mock.patch.object(view, 'query_budget', QueryBudget(max_queries=0)),
+              self.assertLogs('django_drf_boilerplate.utils.query_budget', 'ERROR')):
+            response = self.client.put(reverse('update_user_designation'), {
+                'designation': {'title': 'manager'}}, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('The PUT request was applied', response.json()['message'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.designation.title, 'MANAGER')
+
+    @override_settings(QUERY_BUDGETS={'role_list': {'max_queries': 0}},
+                       QUERY_BUDGET_ACTION='log')
+    def test_overrun_is_logged_in_production(self):
+        with self.assertLogs('django_drf_boilerplate.utils.query_budget', 'WARNING') as logs:
+            response = self.client.get(reverse('role_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Query budget of role_list exceeded: 1 queries > 0', logs.output[0])
+
+    @override_settings(QUERY_SAMPLE_MIN_MS=0, QUERY_SAMPLE_LIMIT=1)
+    def test_slow_queries_are_sampled_with_their_origin(self):
+        with self.assertLogs('django_drf_boilerplate.utils.query_budget', 'WARNING') as logs:
+            self.client.get(reverse('get_user_profile'))
+        message = logs.output[0]
+        self.assertIn('Slow queries in get_user_profile', message)
+        self.assertEqual(message.count('\n  '), 1)
+        self.assertRegex(message, r'apps/users/\w+\.py:\d+ in \w+: SELECT')
+
+    @override_settings(QUERY_SAMPLE_MIN_MS=0, QUERY_SAMPLE_LIMIT=0)
+    def test_slow_query_sampling_can_be_turned_off(self):
+        with self.assertNoLogs('django_drf_boilerplate.utils.query_budget', 'WARNING'):
+            response = self.client.get(reverse('get_user_profile'))
+        self.assertEqual(response.status_code, 200)
+
+
+class LookupCacheTests(UsersTestCase):
+
+    def test_list_views_are_served_from_cache(self):
+        role_lookup.all()
+        designation_lookup.all()
+        with self.assertNumQueries(0):
+            roles = self.client.get(reverse('role_list')).json()
+            designations = self.client.get(reverse('designation_list')).json()
+        self.assertEqual(roles['results'], [{'id': self.role.id, 'name': 'ADMIN'}])
+        self.assertEqual(designations['results'],
+                         [{'id': self.designation.id, 'title': 'ENGINEER'}])
+
+    def test_list_not_modified(self):
+        response = self.client.get(reverse('role_list'))
+        etag = response.headers['ETag']
+        response = self.client.get(reverse('role_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Role.objects.create(name='EDITOR')
+        response = self.client.get(reverse('role_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_resolve_is_case_insensitive(self):
+        self.assertEqual(role_lookup.resolve(['admin', 'missing']),
+                         {'ADMIN': self.role})
+        self.assertEqual(role_lookup.get(self.role.id), self.role)
+
+    def test_changes_invalidate_lookups(self):
+        role_lookup.all()
+        editor = Role.objects.create(name='EDITOR')
+        self.assertEqual(role_lookup.resolve(['editor']), {'EDITOR': editor})
+        editor.delete()
+        self.assertEqual(role_lookup.resolve(['editor']), {})
+
+
+class PaginationTests(UsersTestCase):
+
+    def walk(self, url):
+        ids, previous = [], None
+        while url:
+            body = self.client.get(url).json()
+            ids += [row['id'] for row in body['results']]
+            url, previous = body['next'], body['previous'] or previous
+        return ids, previous
+
+    def test_lookup_list_pages_forward_and_back(self):
+        roles = [self.role] + [Role.objects.create(name=f'ROLE{i}')
+                               for i in range(6)]
+        ids, previous = self.walk(reverse('role_list') + '?page_size=3')
+        self.assertEqual(ids, [role.id for role in roles])
+        back = self.client.get(previous).json()
+        self.assertEqual([row['id'] for row in back['results']],
+                         [role.id for role in roles[3:6]])
+
+    def test_user_list_filters_and_pages(self):
+        self.user.is_staff = True
+        self.user.save()
+        editor = Role.objects.create(name='EDITOR')
+        users = [CustomUser.objects.create_user(
+            email=f'u{i}@example.com', username=f'u{i}', password='x',
+            designation=self.designation if i % 2 else None)
+            for i in range(5)]
+        for user in users[:3]:
+            user.roles.add(editor)
+
+        ids, _ = self.walk(reverse('user_list') + '?page_size=2')
+        self.assertEqual(ids, [self.user.id] + [user.id for user in users])
+        ids, _ = self.walk(reverse('user_list') + '?role=editor&designation=engineer')
+        self.assertEqual(ids, [users[1].id])
+        ids, _ = self.walk(reverse('user_list') + '?role=ghost')
+        self.assertEqual(ids, [])
+        # page of users, roles prefetch
+        with self.assertNumQueries(2):
+            self.client.get(reverse('user_list'))
+
+    def test_user_list_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('user_list')).status_code, 403)
+
+
+class ImportUsersTests(UsersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        uploads = tempfile.TemporaryDirectory()
+        self.addCleanup(uploads.cleanup)
+        settings = override_settings(USER_IMPORT_UPLOAD_DIR=uploads.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.backend = get_backend()
+        self.backend.clear()
+
+    def upload(self, name, content, **data):
+        return self.client.post(reverse('import_users'), {
+            'file': SimpleUploadedFile(name, content), **data})
+
+    def run_import(self, name, content, **data) -> dict:
+        '''
+        Uploads a file, runs the queued jobs and returns the import report
+        '''
+        response = self.upload(name, content, **data)
+        self.assertEqual(response.status_code, 202)
+        job = response.json()['data']
+        self.assertEqual(job['status'], 'queued')
+        # the import and then the post-registration tasks it enqueued
+        with self.captureOnCommitCallbacks(execute=True):
+            Worker(backend=self.backend).run(burst=True)
+        Worker(backend=self.backend).run(burst=True)
+        response = self.client.get(reverse('import_users_status', args=[job['id']]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['status'], 'done')
+        return response.json()['data']['report']
+
+    def test_csv_import(self):
+        content = (
+            'email,password,first_name,last_name,roles,designation\n'
+            'a@example.com,pass-a,A,One,admin,engineer\n'
+            'b@example.com,pass-b,B,Two,,\n'
+            'user@example.com,pass-c,C,Three,,\n'
+            'not-an-email,pass-d,D,Four,,\n'
+            'e@example.com,pass-e,E,Five,ghost,\n'
+        ).encode()
+        with self.assertLogs('apps.users.tasks', 'INFO') as logs:
+            report = self.run_import('users.csv', content, batch_size=2)
+        self.assertEqual((report['total'], report['created'], report['failed']),
+                         (5, 2, 3))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5])
+        imported = CustomUser.objects.get(email='a@example.com')
+        self.assertTrue(imported.check_password('pass-a'))
+        self.assertEqual(imported.designation, self.designation)
+        self.assertEqual(list(imported.roles.all()), [self.role])
+        self.assertIn('INFO:apps.users.tasks:New user created: a@example.com', logs.output)
+        self.assertEqual(os.listdir(settings.USER_IMPORT_UPLOAD_DIR), [])
+
+    def test_jsonl_import(self):
+        content = (
+            b'{"email": "a@example.com", "password": "x", "roles": ["ADMIN"]}\n'
+            b'\n'
+            b'not json\n'
+        )
+        report = self.run_import('users.jsonl', content)
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(report['errors'][0]['row'], 3)
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse('import_users_status', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_batch_size(self):
+        for batch_size in ('-5', 'many'):
+            response = self.upload('users.jsonl', b'{"email": "a@example.com"}\n',
+                                   batch_size=batch_size)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('batch_size', response.json()['error'])
+        self.assertFalse(CustomUser.objects.filter(email='a@example.com').exists())
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.upload('users.csv', b'email,password\n')
+        self.assertEqual(response.status_code, 403)
+
+
+class ProfileSummarySerializer(serializers.ModelSerializer):
+    designation_title = serializers.CharField(source='designation.title', read_only=True)
+    role_ids = serializers.PrimaryKeyRelatedField(source='roles', many=True, read_only=True)
+    initials = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'email', 'is_active', 'updated_at', 'designation_title',
+                  'role_ids', 'initials')
+
+    def get_initials(self, user):
+        return f'{user.first_name[:1]}{user.last_name[:1]}'
+
+
+class ProfileSummaryReadSerializer(CompiledSerializer):
+    serializer_class = ProfileSummarySerializer
+
+
+class CompiledSerializerTests(UsersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.roles.add(Role.objects.create(name='EDITOR'))
+        self.bare = CustomUser.objects.create_user(
+            email='bare@example.com', password='x', username='bare')
+
+    def assertSameData(self, compiled, expected):
+        # same keys in the same order, as rendered to JSON
+        self.assertEqual(JSONRenderer().render(compiled), JSONRenderer().render(expected))
+
+    def test_user_matches_serializer(self):
+        for user in load_user(pk=self.user.pk), self.bare:
+            self.assertSameData(UserReadSerializer(user).data, UserSerializer(user).data)
+
+    def test_many_matches_serializer(self):
+        users = profile_queryset().order_by('pk')
+        self.assertSameData(UserReadSerializer(users, many=True).data,
+                            UserSerializer(users, many=True).data)
+        self.assertSameData(RoleReadSerializer(self.user.roles, many=True).data,
+                            RoleSerializer(self.user.roles, many=True).data)
+
+    def test_values_rows(self):
+        self.assertSameData(
+            RoleReadSerializer(Role.objects.order_by('pk').values('id', 'name'), many=True).data,
+            RoleSerializer(Role.objects.order_by('pk'), many=True).data)
+        row = {'id': self.user.pk, 'email': self.user.email, 'first_name': 'Test',
+               'last_name': 'User', 'designation': {'id': self.designation.pk,
+                                                    'title': 'ENGINEER'},
+               'roles': list(self.user.roles.order_by('pk').values('id', 'name'))}
+        self.assertSameData(UserReadSerializer(row).data,
+                            UserSerializer(load_user(pk=self.user.pk)).data)
+
+    def test_fields_rendered_by_drf(self):
+        for user in self.user, self.bare:
+            self.assertSameData(ProfileSummaryReadSerializer(user).data,
+                                ProfileSummarySerializer(user).data)
+
+    def test_plan_built_once_per_class(self):
+        self.assertIs(UserReadSerializer.get_plan(), UserReadSerializer.get_plan())
+        self.assertIsNot(RoleReadSerializer.get_plan(), UserReadSerializer.get_plan())
+
+    def test_list_views(self):
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('user_list'))
+        self.assertSameData(response.json()['results'],
+                            UserSerializer(profile_queryset().order_by('pk'), many=True).data)
+        response = self.client.get(reverse('role_list'))
+        self.assertSameData(response.json()['results'],
+                            RoleSerializer(Role.objects.order_by('pk'), many=True).data)
+
+
+class BatchUsersTests(UsersTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        editor = Role.objects.create(name='EDITOR')
+        self.users = [CustomUser.objects.create_user(
+            email=f'batch{i}@example.com', password='x', username=f'batch{i}',
+            designation=self.designation if i else None) for i in range(3)]
+        self.users[1].roles.add(self.role, editor)
+
+    def batch(self, **data):
+        return self.client.post(reverse('batch_users'), data, format='json')
+
+    def test_batch_lookup(self):
+        response = self.batch(ids=[self.users[2].pk, 999999, self.users[0].pk],
+                              emails=['batch1@example.com', 'ghost@example.com',
+                                      'batch0@example.com'])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertEqual(data['users'], [
+            UserReadSerializer(load_user(pk=user.pk)).data
+            for user in (self.users[2], self.users[0], self.users[1])])
+        self.assertEqual(data['missing'], {'ids': [999999],
+                                           'emails': ['ghost@example.com']})
+
+    def test_lookups_are_coalesced(self):
+        role_lookup.all()
+        designation_lookup.all()
+        ids = [user.pk for user in self.users]
+        # emails, users, their role ids
+        with self.assertNumQueries(3):
+            self.batch(ids=ids[:1], emails=['batch1@example.com', 'batch2@example.com'])
+        # every profile from the cache
+        with self.assertNumQueries(0):
+            response = self.batch(ids=ids)
+        self.assertEqual([user['id'] for user in response.json()['data']['users']], ids)
+        with assert_query_budget('batch_users'):
+            cache.clear()
+            self.batch(ids=ids)
+
+    def test_batch_size(self):
+        self.assertEqual(self.batch().status_code, 400)
+        with override_settings(USER_BATCH_MAX_SIZE=2):
+            response = self.batch(ids=[1, 2], emails=['batch0@example.com'])
+        self.assertEqual(response.status_code, 400)
+
+    def test_ids_out_of_range(self):
+        response = self.batch(ids=[2 ** 63 - 1])
+        self.assertEqual(response.json()['data']['missing']['ids'], [2 ** 63 - 1])
+        self.assertEqual(self.batch(ids=[2 ** 70]).status_code, 400)
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.batch(ids=[self.user.pk]).status_code, 403)
+
+    def test_batch_loader(self):
+        calls = []
+
+        def batch(keys):
+            calls.append(keys)
+            return {key: key * 10 for key in keys if key != 3}
+
+        loader = BatchLoader(batch)
+        self.assertEqual(loader.load_many([2, 1, 2, 3]), {2: 20, 1: 10})
+        self.assertEqual(loader.load_many([1, 3, 4]), {1: 10, 4: 40})
+        self.assertIsNone(loader.load(3))
+        self.assertEqual(calls, [[2, 1, 3], [4]])
+
+
+class RegisterTests(UsersTestCase):
+
+    def register(self, email):
+        return APIClient().post(reverse('register_user'), {
+            'email': email, 'password': 'secret-pass-123',
+            'first_name': 'A', 'last_name': 'User'}, format='json')
+
+    def test_registrations_get_distinct_usernames(self):
+        # without a username the second registration hit the unique constraint
+        for email in ('a@example.com', 'b@example.com'):
+            self.assertEqual(self.register(email).status_code, 200)
+        self.assertEqual(CustomUser.objects.get(email='a@example.com').username,
+                         'a@example.com')
+        self.assertEqual(CustomUser.objects.get(email='b@example.com').username,
+                         'b@example.com')
+
+    def test_email_taken_as_a_username(self):
+        CustomUser.objects.create_user(email='other@example.com', username='a@example.com',
+                                       password='secret-pass-123')
+        response = self.register('a@example.com')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json()['error'])
+
+
+class SeedUsersTests(UsersTestCase):
+
+    def test_seed_users(self):
+        for _ in range(2):
+            call_command('seed_users', users=5, roles=3, designations=2,
+                         stdout=StringIO())
+        users = CustomUser.objects.filter(email__startswith='bench')
+        self.assertEqual(users.count(), 6)
+        self.assertTrue(users.get(email='bench-staff@example.com').is_staff)
+        seeded = users.get(email='bench0@example.com')
+        self.assertEqual(seeded.roles.count(), 3)
+        self.assertTrue(seeded.check_password('bench-password-123'))
+
+
+class JsonBackendTests(SimpleTestCase):
+    '''
+    Output of the orjson backend against the stdlib encoders it replaces
+    '''
+    payload = {
+        'id': 1, 'name': 'ADMIN \u0939\u093f\u0902\u0926\u0940',
+        'ratio': 0.5, 'amount': Decimal('10.50'), 'flag': None,
+        'joined': datetime(2024, 5, 29, 7, 24, 1, 123456, tzinfo=timezone.utc),
+        'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+        'label': gettext_lazy('User not found'),
+        'roles': [{'id': i, 'name': f'ROLE{i}'} for i in range(3)],
+        'nested': {'empty': [], 'line': 'a\u2028b'},
+    }
+
+    def envelope(self, backend):
+        with self.settings(API_JSON_BACKEND=backend):
+            return ApiResponse.success(data=self.payload, message='Success')
+
+    def test_json_backend_matches_json_response(self):
+        expected = JsonResponse({'success': True, 'message': 'Success',
+                                 'data': self.payload})
+        response = self.envelope('json')
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response['Content-Type'], expected['Content-Type'])
+        self.assertIsInstance(response, JsonResponse)
+
+    def test_orjson_backend_matches_envelope(self):
+        expected = self.envelope('json').content
+        content = self.envelope('orjson').content
+        # same keys in the same order with the same values
+        self.assertEqual(json.loads(content, object_pairs_hook=list),
+                         json.loads(expected, object_pairs_hook=list))
+
+    def test_orjson_backend_bytes(self):
+        # compact and UTF-8, the documented difference from the json backend
+        self.assertEqual(self.envelope('orjson').content, (
+            '{"success":true,"message":"Success","data":{"id":1,'
+            '"name":"ADMIN \u0939\u093f\u0902\u0926\u0940","ratio":0.5,'
+            '"amount":"10.50","flag":null,"joined":"2024-05-29T07:24:01.123Z",'
+            '"uuid":"12345678-1234-5678-1234-567812345678","label":"User not found",'
+            '"roles":[{"id":0,"name":"ROLE0"},{"id":1,"name":"ROLE1"},'
+            '{"id":2,"name":"ROLE2"}],"nested":{"empty":[],"line":"a\u2028b"}}}'
+        ).encode())
+
+    def test_renderer_matches_drf_renderer(self):
+        with self.settings(API_JSON_BACKEND='orjson'):
+            content = FastJSONRenderer().render(self.payload)
+        self.assertEqual(content, JSONRenderer().render(self.payload))
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+
+    def test_persistent_connections_by_default(self):
+        database = postgres_database({'DB_NAME': 'app'})
+        self.assertEqual(database['NAME'], 'app')
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertFalse(database['DISABLE_SERVER_SIDE_CURSORS'])
+
+    def test_transaction_pooling_disables_server_side_cursors(self):
+        database = postgres_database({'DB_PGBOUNCER_TRANSACTION_POOLING': 'true',
+                                      'DB_CONN_MAX_AGE': '0'})
+        self.assertTrue(database['DISABLE_SERVER_SIDE_CURSORS'])
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   PASSWORD_HASHING_WORKERS=2, PASSWORD_HASHING_POOL_THRESHOLD=2,
+                   PASSWORD_HASHING_START_METHOD='fork')
+class PasswordHashingTests(SimpleTestCase):
+
+    def tearDown(self):
+        password_hasher.shutdown()
+
+    def test_broken_pool_is_replaced(self):
+        passwords = [f'secret-{i}' for i in range(4)]
+        password_hasher.hash_many(passwords)
+        pool = password_hasher._pool
+        # a hashing process dies, e.g. killed by the OOM killer
+        os.kill(next(iter(pool._processes)), signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while not pool._broken and time.monotonic() < deadline:
+            time.sleep(0.01)
+        with self.assertLogs('apps.users.hashing', 'WARNING'):
+            hashes = password_hasher.hash_many(passwords)
+        self.assertIsNot(password_hasher._pool, pool)
+        self.assertTrue(all(check_password(password, encoded)
+                            for password, encoded in zip(passwords, hashes)))
+
+
+class RecordingHandler(logging.Handler):
+    '''
+    Keeps formatted records, waits for `gate` (if given) on every record
+    '''
+
+    def __init__(self, gate=None):
+        super().__init__()
+        self.gate = gate
+        self.entered = threading.Event()
+        self.records = []
+
+    def emit(self, record):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.records.append(self.format(record))
+
+
+class AsyncLoggingTests(SimpleTestCase):
+
+    def make_logger(self, handler):
+        logger = logging.getLogger('apps.users.tests.async_logging')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(handler.close)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_records_are_written_by_the_listener_thread(self):
+        target = RecordingHandler()
+        handler = AsyncQueueHandler([target])
+        logger = self.make_logger(handler)
+        data = {'title': 'manager'}
+        logger.info('Update User Designation: %s', data)
+        data['title'] = 'changed'
+        logger.debug('below the logger level: %s', data)
+        handler.stop()
+        self.assertEqual(target.records, ["Update User Designation: {'title': 'manager'}"])
+
+    def test_full_queue_drops_and_reports_records(self):
+        gate = threading.Event()
+        target = RecordingHandler(gate)
+        handler = AsyncQueueHandler([target], maxsize=2, batch_size=1)
+        logger = self.make_logger(handler)
+        logger.info('record %d', 0)
+        # the listener holds record 0, two more fit in the queue
+        self.assertTrue(target.entered.wait(5))
+        for number in range(1, 10):
+            logger.info('record %d', number)
+        self.assertEqual(handler.dropped, 7)
+        gate.set()
+        handler.stop()
+        self.assertEqual([record for record in target.records if record.startswith('record')],
+                         ['record 0', 'record 1', 'record 2'])
+        self.assertIn('Logging queue full, 7 records dropped', target.records)
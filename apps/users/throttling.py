@@ -1,5 +1,233 @@
-from rest_framework.throttling import UserRateThrottle
+'''
+GCRA rate limiting for users app
 
+Each throttle key stores a single "theoretical arrival time" (TAT) instead
+of the request history `SimpleRateThrottle` keeps, so memory is O(1) per
+key. With Redis the check and update run in one Lua script, atomic across
+every worker; other cache backends use a get/set under a process lock.
 
-class CustomThrottle(UserRateThrottle):
+Rates come from `REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']` by scope.
+Denied requests get `Retry-After`, and `RateLimitHeadersMiddleware` adds
+`X-RateLimit-Limit`, `X-RateLimit-Remaining` and `X-RateLimit-Reset` to
+throttled endpoints.
+
+Usage:
+    @api_view(['POST'])
+    @throttle_classes([AnonIPRateThrottle, RegisterRateThrottle])
+    def register_user(request):
+        ...
+'''
+import logging
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from redis.exceptions import RedisError
+from rest_framework.throttling import SimpleRateThrottle
+
+from django_drf_boilerplate.utils.metrics import THROTTLE_REJECTIONS
+from django_drf_boilerplate.utils.redis import get_redis_client, make_key
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] throttle key, ARGV[1] emission interval, ARGV[2] period (seconds)
+# returns {allowed, remaining, retry_after, reset_after}, floats as strings
+GCRA_SCRIPT = '''
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, tostring(allow_at - now), tostring(tat - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, math.floor((now - allow_at) / interval), '0', tostring(new_tat - now)}
+'''
+
+
+class GCRAResult:
+    '''
+    Outcome of a rate limit check
+    '''
+    __slots__ = ('allowed', 'limit', 'remaining', 'retry_after', 'reset_after')
+
+    def __init__(self, allowed, limit, remaining, retry_after, reset_after):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+        self.reset_after = reset_after
+
+
+class RedisGCRABackend:
+    '''
+    GCRA check and update in a single Lua script
+    '''
+
+    def __init__(self, client):
+        self.client = client
+        self.script = client.register_script(GCRA_SCRIPT)
+
+    def check(self, key, limit, period) -> GCRAResult:
+        allowed, remaining, retry_after, reset_after = self.script(
+            keys=[make_key(key)], args=[period / limit, period], client=self.client)
+        return GCRAResult(bool(allowed), limit, int(remaining),
+                          float(retry_after), float(reset_after))
+
+
+class CacheGCRABackend:
+    '''
+    GCRA on the Django cache API, atomic within a process only (local
+    memory cache, tests)
+    '''
+    _lock = threading.Lock()
+
+    def check(self, key, limit, period) -> GCRAResult:
+        interval = period / limit
+        with self._lock:
+            now = time.time()
+            tat = max(cache.get(key, now), now)
+            new_tat = tat + interval
+            allow_at = new_tat - period
+            if now < allow_at:
+                return GCRAResult(False, limit, 0, allow_at - now, tat - now)
+            cache.set(key, new_tat, timeout=math.ceil(new_tat - now))
+        return GCRAResult(True, limit, math.floor((now - allow_at) / interval),
+                          0.0, new_tat - now)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    '''
+    Returns the GCRA backend of the default cache
+    '''
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                client = get_redis_client()
+                _backend = (CacheGCRABackend() if client is None
+                            else RedisGCRABackend(client))
+    return _backend
+
+
+def reset_backend():
+    global _backend
+    _backend = None
+
+
+class GCRAThrottle(SimpleRateThrottle):
+    '''
+    Base GCRA throttle, keyed by user id or client IP
+    '''
+    cache_format = 'throttle:gcra:%(scope)s:%(ident)s'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        try:
+            self.result = get_backend().check(key, self.num_requests, self.duration)
+        except RedisError as exp:
+            # fail open, an unreachable cache must not take the API down
+            logger.warning('Rate limit check failed for %s: %s', key, exp)
+            return True
+        record_rate_limit(request, self.result)
+        if not self.result.allowed:
+            THROTTLE_REJECTIONS.labels(self.scope).inc()
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after
+
+
+class UserRateGCRAThrottle(GCRAThrottle):
+    scope = 'user'
+
+
+class AnonIPRateThrottle(GCRAThrottle):
+    '''
+    Per client IP, whether the request is authenticated or not
+    '''
+    scope = 'anon_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope,
+                                    'ident': self.get_ident(request)}
+
+
+class LoginRateThrottle(GCRAThrottle):
+    scope = 'login'
+
+
+class RegisterRateThrottle(GCRAThrottle):
+    scope = 'register'
+
+
+class ProfileRateThrottle(GCRAThrottle):
+    scope = 'profile'
+
+
+class CustomThrottle(UserRateGCRAThrottle):
     rate = '15/minute'
+
+
+def record_rate_limit(request, result):
+    '''
+    Keeps the most restrictive rate limit of a request for the response
+    headers
+    '''
+    http_request = getattr(request, '_request', request)
+    current = getattr(http_request, 'rate_limit', None)
+    if current is None or result.remaining < current.remaining or not result.allowed:
+        http_request.rate_limit = result
+
+
+class RateLimitHeadersMiddleware:
+    '''
+    Adds the `X-RateLimit-*` headers of the throttles a request went through
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    @staticmethod
+    def add_headers(request, response):
+        result = getattr(request, 'rate_limit', None)
+        if result is not None:
+            response.headers['X-RateLimit-Limit'] = str(result.limit)
+            response.headers['X-RateLimit-Remaining'] = str(result.remaining)
+            response.headers['X-RateLimit-Reset'] = str(math.ceil(result.reset_after))
+        return response
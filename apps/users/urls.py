@@ -1,21 +1,41 @@
 # urls.py
+from django.conf import settings
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView, TokenVerifyView
 
-from apps.users.views import (CustomTokenObtainPairView, DesignationListViews,
-                              RoleListViews, get_user_profile, register_user,
+from apps.users import async_views
+from apps.users.views import (CustomTokenObtainPairView,
+                              CustomTokenRefreshView, CustomTokenVerifyView,
+                              DesignationListViews, RoleListViews,
+                              UserListView, batch_users, get_user_profile,
+                              import_users_status, import_users_view,
+                              logout_user, register_user,
                               update_user_designation, update_user_roles)
 
+if settings.API_ASYNC_VIEWS:
+    profile_view = async_views.get_user_profile
+    token_obtain_pair_view = async_views.token_obtain_pair
+    token_refresh_view = async_views.token_refresh
+else:
+    profile_view = get_user_profile
+    token_obtain_pair_view = CustomTokenObtainPairView.as_view()
+    token_refresh_view = CustomTokenRefreshView.as_view()
+
 urlpatterns = [
     path('user/', register_user, name='register_user'),
-    path('profile/', get_user_profile, name='get_user_profile'),
+    path('profile/', profile_view, name='get_user_profile'),
     # path('login/', login_user, name='login_user'),
-    path('login/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
+    path('login/', token_obtain_pair_view, name='token_obtain_pair'),
+    path('logout/', logout_user, name='logout_user'),
+    path('token/refresh/', token_refresh_view, name='token_refresh'),
+    path('api/token/verify/', CustomTokenVerifyView.as_view(), name='token_verify'),
     path('roles/', RoleListViews.as_view(), name='role_list'),
     path('designations/', DesignationListViews.as_view(), name='designation_list'),
     path('update-role/', update_user_roles, name='update_user_roles'),
     path('update-designation/', update_user_designation,
          name='update_user_designation'),
+    path('users/', UserListView.as_view(), name='user_list'),
+    path('users/import/', import_users_view, name='import_users'),
+    path('users/import/<str:job_id>/', import_users_status,
+         name='import_users_status'),
+    path('users/batch/', batch_users, name='batch_users'),
 ]
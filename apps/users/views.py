@@ -2,23 +2,47 @@
 import logging
 
 from django.http import Http404
-from django.shortcuts import get_object_or_404
 from django.utils.translation import gettext as _
 from drf_yasg.utils import swagger_auto_schema
-from rest_framework import generics
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework import generics, status
+from rest_framework.decorators import (api_view, parser_classes,
+                                       permission_classes, throttle_classes)
+from rest_framework.parsers import MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import (TokenObtainPairView,
+                                            TokenRefreshView, TokenVerifyView)
 
+from apps.users.cache import (designation_lookup, get_cached_profile,
+                              role_lookup, set_cached_profile)
+from apps.users.dataloaders import RequestLoaders
 from apps.users.errors import UserErrorMessages
-from apps.users.models import CustomUser, Designation, Role
+from apps.users.importers import (IMPORT_FORMATS, get_import_job,
+                                  start_import_job)
+from apps.users.loaders import load_user, profile_queryset, user_last_modified
+from apps.users.models import Designation, Role
 from apps.users.permissions import IsAdminUserOrReadOnly
+from apps.users.revocation import check_token, revocation_store
+from apps.users.throttling import (AnonIPRateThrottle, LoginRateThrottle,
+                                   ProfileRateThrottle, RegisterRateThrottle)
+from django_drf_boilerplate.utils.conditional import (ConditionalGetMixin,
+                                                      conditional_response,
+                                                      make_etag, payload_etag,
+                                                      set_validators)
+from django_drf_boilerplate.utils.query_budget import query_budget
 from django_drf_boilerplate.utils.response import ApiResponse
 
 from .serializers import (CustomTokenObtainPairSerializer,
-                          DesignationSerializer, ManageUserDesignation,
-                          ManageUserRolesSerializer, RoleSerializer,
-                          UserSerializer)
+                          CustomTokenRefreshSerializer,
+                          CustomTokenVerifySerializer,
+                          DesignationReadSerializer, DesignationSerializer,
+                          LogoutSerializer, ManageUserDesignation,
+                          ManageUserRolesSerializer, RoleReadSerializer,
+                          RoleSerializer, UserBatchSerializer,
+                          UserReadSerializer, UserSerializer)
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +52,7 @@ logger = logging.getLogger(__name__)
                      request_body=UserSerializer,
                      responses={200: UserSerializer})
 @api_view(['POST'])
+@throttle_classes([AnonIPRateThrottle, RegisterRateThrottle])
 def register_user(request):
     '''
     Register User API
@@ -56,11 +81,14 @@ def register_user(request):
                              error=serializer.errors)
 
 
+# user joined with designation, roles prefetch, cold lookup cache load
+@query_budget(max_queries=3)
 @swagger_auto_schema(method='get',
                      operation_description=_('Get User Profile API'),
                      responses={200: UserSerializer})
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([ProfileRateThrottle])
 def get_user_profile(request):
     '''
     Get User Profile API
@@ -77,11 +105,18 @@ def get_user_profile(request):
     '''
     logger.info('Get user profile: %s', request.user.id)
     try:
-        user = get_object_or_404(CustomUser, id=request.user.id)
-        serializer = UserSerializer(user)
-        logger.debug('User profile fetched successfully: %s', user)
-        return ApiResponse.success(data=serializer.data,
-                                   message=UserErrorMessages.USER_FETCHED_SUCCESSFULLY.value)
+        entry = get_cached_profile(request.user.id)
+        if entry is None:
+            user = load_user(id=request.user.id)
+            entry = set_cached_profile(user.id, UserReadSerializer(user).data,
+                                       last_modified=user_last_modified(user))
+            logger.debug('User profile fetched successfully: %s', user)
+        etag = payload_etag(entry['digest'])
+        response = conditional_response(request, etag, entry['last_modified'])
+        if response is None:
+            response = ApiResponse.success(data=entry['data'],
+                                           message=UserErrorMessages.USER_FETCHED_SUCCESSFULLY.value)
+        return set_validators(response, etag, entry['last_modified'])
     except Http404:
         logger.debug('User not found: %s', request.user.id)
         return ApiResponse.error(message=UserErrorMessages.USER_NOT_FOUND.value)
@@ -91,22 +126,72 @@ def get_user_profile(request):
                                  error=str(exp))
 
 
-class RoleListViews(generics.ListCreateAPIView):
+class ReadSerializerMixin:
+    """
+    List with `read_serializer_class` (a compiled read-only serializer),
+    `serializer_class` is kept for writes and the API schema
+    """
+    read_serializer_class = None
+
+    def get_read_serializer(self, *args, **kwargs):
+        if self.read_serializer_class is None:
+            return self.get_serializer(*args, **kwargs)
+        return self.read_serializer_class(*args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_read_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_read_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+
+class LookupListMixin(ReadSerializerMixin, ConditionalGetMixin):
+    """
+    List a lookup table from the lookup cache, paginated and with
+    conditional GET support
+    """
+    lookup = None
+
+    def get_etag(self, request):
+        return make_etag(self.lookup.prefix, self.lookup.version(),
+                         self.get_representation_key(request))
+
+    def get_last_modified(self, request):
+        return self.lookup.last_modified()
+
+    def list(self, request, *args, **kwargs):
+        rows = self.lookup.all()
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            serializer = self.get_read_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_read_serializer(rows, many=True)
+        return Response(serializer.data)
+
+
+class RoleListViews(LookupListMixin, generics.ListCreateAPIView):
     """
     Role List Views
     """
     queryset = Role.objects.all()
     serializer_class = RoleSerializer
+    read_serializer_class = RoleReadSerializer
     permission_classes = [IsAdminUserOrReadOnly, IsAuthenticated]
+    lookup = role_lookup
 
 
-class DesignationListViews(generics.ListCreateAPIView):
+class DesignationListViews(LookupListMixin, generics.ListCreateAPIView):
     """
     Designation List Views
     """
     queryset = Designation.objects.all()
     serializer_class = DesignationSerializer
+    read_serializer_class = DesignationReadSerializer
     permission_classes = [IsAdminUserOrReadOnly, IsAuthenticated]
+    lookup = designation_lookup
 
     # def get(self, request, *args, **kwargs):
     #     """
@@ -115,6 +200,84 @@ class DesignationListViews(generics.ListCreateAPIView):
     #     return super().get(request, *args, **kwargs)
 
 
+class UserListView(ReadSerializerMixin, generics.ListAPIView):
+    """
+    User List View (staff only)
+
+    Filters: `role` (name), `designation` (title), `is_active` (true/false)
+    """
+    serializer_class = UserSerializer
+    read_serializer_class = UserReadSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        queryset = profile_queryset()
+        params = self.request.query_params
+        if 'role' in params:
+            role = role_lookup.resolve([params['role']])
+            if not role:
+                return queryset.none()
+            queryset = queryset.filter(roles=next(iter(role.values())).pk)
+        if 'designation' in params:
+            designation = designation_lookup.resolve([params['designation']])
+            if not designation:
+                return queryset.none()
+            queryset = queryset.filter(
+                designation_id=next(iter(designation.values())).pk)
+        if 'is_active' in params:
+            queryset = queryset.filter(
+                is_active=params['is_active'].lower() in ('1', 'true', 'yes'))
+        return queryset
+
+
+# emails, profile cache miss: users, their role ids, cold role and
+# designation lookup cache loads
+@query_budget(max_queries=5)
+@swagger_auto_schema(method='post',
+                     operation_description=_('Batch User Lookup'),
+                     request_body=UserBatchSerializer,
+                     responses={200: UserSerializer(many=True)})
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def batch_users(request):
+    '''
+    Batch User Lookup API (staff and service accounts)
+
+    Returns the profiles of up to `USER_BATCH_MAX_SIZE` users given by
+    `ids` and/or `emails`, in the order asked, with the ids and emails that
+    matched no user in `missing`. Profiles come from the profile cache, the
+    misses are loaded together.
+
+    Parameters
+    ----------
+        request : `HttpRequest`
+            User request object
+
+    Returns
+    -------
+        `ApiResponse`
+        API response in standard format
+    '''
+    serializer = UserBatchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return ApiResponse.error(message=UserErrorMessages.ERROR_FETCHING_USER.value,
+                                 error=serializer.errors)
+    ids, emails = serializer.validated_data['ids'], serializer.validated_data['emails']
+    logger.info('Batch user lookup: %s ids, %s emails by %s',
+                len(ids), len(emails), request.user.id)
+    loaders = RequestLoaders.for_request(request)
+    ids_by_email = loaders.user_ids_by_email.load_many(emails)
+    user_ids = list(dict.fromkeys([*ids, *ids_by_email.values()]))
+    entries = loaders.load_profiles(user_ids)
+    return ApiResponse.success(data={
+        'users': [entries[user_id]['data'] for user_id in user_ids if user_id in entries],
+        'missing': {'ids': [user_id for user_id in dict.fromkeys(ids)
+                            if user_id not in entries],
+                    'emails': [email for email in dict.fromkeys(emails)
+                               if email not in ids_by_email]},
+    }, message=UserErrorMessages.USERS_FETCHED_SUCCESSFULLY.value)
+
+
 # custom authentication Token pair
 class CustomTokenObtainPairView(TokenObtainPairView):
     """Custom Token Obtain Pair View
@@ -124,8 +287,57 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     """
     serializer_class = CustomTokenObtainPairSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [AnonIPRateThrottle, LoginRateThrottle]
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    """Token Refresh View rejecting revoked refresh tokens
+    """
+    serializer_class = CustomTokenRefreshSerializer
+
+
+class CustomTokenVerifyView(TokenVerifyView):
+    """Token Verify View rejecting revoked tokens
+    """
+    serializer_class = CustomTokenVerifySerializer
 
 
+@swagger_auto_schema(method='post',
+                     operation_description=_('Logout User'),
+                     request_body=LogoutSerializer)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_user(request):
+    """
+    Logout User
+
+    Revokes the access token of the request and the `refresh` token of
+    the body, if given.
+    """
+    serializer = LogoutSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    refresh = None
+    if 'refresh' in serializer.validated_data:
+        try:
+            refresh = RefreshToken(serializer.validated_data['refresh'])
+            check_token(refresh)
+        except (TokenError, AuthenticationFailed) as exp:
+            logger.error('Error in logging out user: %s', exp)
+            return ApiResponse.error(message=UserErrorMessages.USER_LOGOUT_FAILED.value,
+                                     error={'refresh': str(exp)})
+        if refresh[api_settings.USER_ID_CLAIM] != request.user.id:
+            return ApiResponse.error(message=UserErrorMessages.USER_LOGOUT_FAILED.value,
+                                     error={'refresh': UserErrorMessages.USER_NOT_PERMISSION.value})
+    if request.auth is not None:
+        revocation_store.revoke(request.auth)
+    if refresh is not None:
+        revocation_store.revoke(refresh)
+    logger.info('User logged out: %s', request.user.id)
+    return ApiResponse.success(message=UserErrorMessages.USER_LOGGED_OUT_SUCCESSFULLY.value)
+
+
+# see QueryCountTests.test_update_roles, plus a cold lookup cache load
+@query_budget(max_queries=10)
 @swagger_auto_schema(method='put',
                      operation_description=_('Update User Roles'),
                      request_body=RoleSerializer,
@@ -138,7 +350,7 @@ def update_user_roles(request):
     """
     logger.info('Update User Roles: %s', request.data)
     try:
-        user = get_object_or_404(CustomUser, id=request.user.id)
+        user = load_user(id=request.user.id)
         roles_serializer = ManageUserRolesSerializer(
             instance=user, data=request.data, partial=True)
         if not roles_serializer.is_valid():
@@ -160,6 +372,8 @@ def update_user_roles(request):
 
 
 # update designation
+# load user, roles prefetch, cold lookup cache load, update
+@query_budget(max_queries=4)
 @swagger_auto_schema(method='put',
                      operation_description=_('Update User Designation'),
                      request_body=DesignationSerializer,
@@ -172,7 +386,7 @@ def update_user_designation(request):
     """
     logger.info('Update User Designation: %s', request.data)
     try:
-        user = get_object_or_404(CustomUser, id=request.user.id)
+        user = load_user(id=request.user.id)
         designation_serializer = ManageUserDesignation(
             instance=user, data=request.data, partial=True)
         if not designation_serializer.is_valid():
@@ -193,3 +407,68 @@ def update_user_designation(request):
         logger.exception('Error in updating user designation: %s', exp)
         return ApiResponse.error(message=UserErrorMessages.ERROR_UPDATING_USER_DESIGNATION.value,
                                  error=str(exp))
+
+
+@swagger_auto_schema(method='post',
+                     operation_description=_('Bulk Import Users'))
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+@parser_classes([MultiPartParser])
+def import_users_view(request):
+    """
+    Bulk Import Users
+
+    Expects a CSV or JSONL `file`, the format is taken from the `format`
+    field or the file extension. `batch_size` overrides
+    `USER_IMPORT_BATCH_SIZE`. The import is run by a task worker, the
+    response (202) holds the job to poll at `import_users_status`.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return ApiResponse.error(message=UserErrorMessages.USER_IMPORT_FAILED.value,
+                                 error={'file': _('This field is required.')})
+    file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+    if file_format not in IMPORT_FORMATS:
+        return ApiResponse.error(message=UserErrorMessages.USER_IMPORT_FAILED.value,
+                                 error=UserErrorMessages.UNSUPPORTED_IMPORT_FORMAT.value.format(
+                                     format=file_format))
+    try:
+        batch_size = int(request.data.get('batch_size') or 0) or None
+    except ValueError:
+        return ApiResponse.error(message=UserErrorMessages.USER_IMPORT_FAILED.value,
+                                 error={'batch_size': _('A valid integer is required.')})
+    if batch_size is not None and batch_size < 1:
+        return ApiResponse.error(
+            message=UserErrorMessages.USER_IMPORT_FAILED.value,
+            error={'batch_size': _('Ensure this value is greater than or equal to 1.')})
+    try:
+        job = start_import_job(upload, file_format, batch_size=batch_size,
+                               user_id=request.user.id)
+    except Exception as exp:
+        logger.exception('Error in queueing user import: %s', exp)
+        return ApiResponse.error(message=UserErrorMessages.USER_IMPORT_FAILED.value,
+                                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                 error=str(exp))
+    logger.info('Import users: %s (%s) by %s queued as %s',
+                upload.name, file_format, request.user.id, job['id'])
+    return ApiResponse.success(data=job, message=UserErrorMessages.USER_IMPORT_QUEUED.value,
+                               status_code=status.HTTP_202_ACCEPTED)
+
+
+@swagger_auto_schema(method='get',
+                     operation_description=_('Bulk Import Users Status'))
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def import_users_status(request, job_id):
+    """
+    Bulk Import Users Status
+
+    Returns the job of `import_users_view`, with its report once done.
+    """
+    job = get_import_job(job_id)
+    if job is None:
+        return ApiResponse.error(message=UserErrorMessages.IMPORT_JOB_NOT_FOUND.value,
+                                 status_code=status.HTTP_404_NOT_FOUND)
+    message = (UserErrorMessages.USERS_IMPORTED_SUCCESSFULLY.value if job['status'] == 'done'
+               else UserErrorMessages.IMPORT_JOB_FETCHED_SUCCESSFULLY.value)
+    return ApiResponse.success(data=job, message=message)
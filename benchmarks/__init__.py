@@ -0,0 +1,5 @@
+'''
+Benchmarks for the API
+
+Run from the project root, e.g. `python -m benchmarks.query_plans`.
+'''
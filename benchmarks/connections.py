@@ -0,0 +1,107 @@
+'''
+Connection churn and latency of per request vs persistent connections
+
+Simulated requests run on `--threads` threads with the connection handling
+of a real request (`close_old_connections()` when it starts and ends) and
+load a user profile. The run is repeated with `CONN_MAX_AGE=0` and with
+persistent, health checked connections, reporting the connections opened
+and p50/p99 latency of each.
+
+Meant for Postgres; an in-memory SQLite test database is never closed
+by Django, so it shows no churn.
+
+Usage:
+    ENV=production python -m benchmarks.connections --requests 2000 --threads 8
+'''
+import argparse
+import statistics
+import threading
+import time
+
+from benchmarks.utils import benchmark_database, setup_django
+
+MODES = {
+    'per request (CONN_MAX_AGE=0)': {'CONN_MAX_AGE': 0,
+                                     'CONN_HEALTH_CHECKS': False},
+    'persistent (CONN_MAX_AGE=60, health checks)': {'CONN_MAX_AGE': 60,
+                                                    'CONN_HEALTH_CHECKS': True},
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run(mode, user_id, requests, threads):
+    from django.db import close_old_connections, connections
+    from django.db.backends.signals import connection_created
+
+    from apps.users.loaders import load_user
+    from apps.users.serializers import UserSerializer
+
+    connections.settings['default'].update(mode)
+    opened = []
+    latencies = []
+    lock = threading.Lock()
+
+    def count_connection(sender, connection, **kwargs):
+        with lock:
+            opened.append(connection)
+
+    def worker(count):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            close_old_connections()
+            UserSerializer(load_user(id=user_id)).data
+            close_old_connections()
+            timings.append(time.perf_counter() - start)
+        connections.close_all()
+        with lock:
+            latencies.extend(timings)
+
+    connection_created.connect(count_connection)
+    try:
+        workers = [threading.Thread(target=worker, args=(requests // threads,))
+                   for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        connection_created.disconnect(count_connection)
+    return {'requests': len(latencies), 'connections': len(opened),
+            'rps': len(latencies) / elapsed,
+            'p50': statistics.median(latencies) * 1000,
+            'p99': percentile(latencies, 99) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        from apps.users.models import CustomUser, Designation, Role
+
+        designation = Designation.objects.create(title='ENGINEER')
+        user = CustomUser.objects.create_user(
+            email='bench@example.com', password='bench', username='bench',
+            first_name='Bench', last_name='User', designation=designation)
+        user.roles.add(*[Role.objects.create(name=f'ROLE{i}') for i in range(5)])
+
+        print(f'{"mode":<46} {"requests":>8} {"conns":>6} {"req/s":>8} '
+              f'{"p50 ms":>8} {"p99 ms":>8}')
+        for name, mode in MODES.items():
+            result = run(mode, user.pk, args.requests, args.threads)
+            print(f'{name:<46} {result["requests"]:>8} {result["connections"]:>6} '
+                  f'{result["rps"]:>8.0f} {result["p50"]:>8.2f} {result["p99"]:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
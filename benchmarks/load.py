@@ -0,0 +1,308 @@
+'''
+Load benchmark of the users API against a running server
+
+Drives each scenario (an API endpoint) with `--requests` requests on
+`--concurrency` threads, one keep-alive connection per thread, and reports
+throughput, p50/p95/p99 latency, status codes and database queries per
+request (read from the `Server-Timing` header). The results can be saved
+as JSON and compared with an earlier run: a scenario whose throughput drops
+or p95 latency or queries per request grow by more than `--threshold`
+fails the run (exit status 1), so CI can flag regressions between commits.
+
+The authenticated scenarios log in as the users of `seed_users`; the rate
+limits must be raised for the server under test, the defaults reject most
+of the requests with 429.
+
+Usage:
+    python manage.py migrate && python manage.py seed_users --users 1000
+    THROTTLE_RATE_ANON_IP=1000000/minute THROTTLE_RATE_LOGIN=1000000/minute \\
+        THROTTLE_RATE_REGISTER=1000000/minute THROTTLE_RATE_PROFILE=1000000/minute \\
+        THROTTLE_RATE_USER=1000000/minute ENV=production gunicorn -c gunicorn.conf.py
+    python -m benchmarks.load --concurrency 8 --requests 2000 --output results.json
+    python -m benchmarks.load --compare baseline.json --threshold 0.2
+'''
+import argparse
+import collections
+import http.client
+import json
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from benchmarks.connections import percentile
+
+# password of the seed_users command
+DEFAULT_PASSWORD = 'bench-password-123'
+QUERIES_PATTERN = re.compile(r'desc="(\d+) queries"')
+
+
+class Client:
+    '''
+    JSON client on one keep-alive connection, reconnecting when the server
+    closed it
+    '''
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        connection_class = (http.client.HTTPSConnection if parts.scheme == 'https'
+                            else http.client.HTTPConnection)
+        self.connection = connection_class(parts.hostname, parts.port, timeout=30)
+        self.prefix = parts.path.rstrip('/')
+        self.token = None
+
+    def request(self, method, path, data=None):
+        '''
+        Returns the status, decoded body and queries of the request (`None`
+        without a `Server-Timing` header)
+        '''
+        headers = {'Accept': 'application/json'}
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+        if self.token is not None:
+            headers['Authorization'] = f'Bearer {self.token}'
+        body = json.dumps(data) if data is not None else None
+        for attempt in range(2):
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                if attempt:
+                    raise
+        match = QUERIES_PATTERN.search(response.getheader('Server-Timing') or '')
+        try:
+            content = json.loads(content) if content else None
+        except ValueError:
+            content = None
+        return response.status, content, int(match.group(1)) if match else None
+
+    def login(self, email, password):
+        status, content, _ = self.request('POST', '/api/login/',
+                                          {'email': email, 'password': password})
+        if status != 200:
+            raise RuntimeError(f'Login of {email} failed with {status}: {content}')
+        self.token = content['access']
+        return content
+
+    def close(self):
+        self.connection.close()
+
+
+def register_user(client, state, number):
+    return client.request('POST', '/api/user/', {
+        'email': f'{state["run"]}-{number}@example.com', 'password': state['password'],
+        'first_name': 'Load', 'last_name': f'User {number}'})
+
+
+def token_obtain_pair(client, state, number):
+    return client.request('POST', '/api/login/', {
+        'email': state['email'](number), 'password': state['password']})
+
+
+def token_refresh(client, state, number):
+    return client.request('POST', '/api/token/refresh/', {'refresh': client.refresh})
+
+
+def get_user_profile(client, state, number):
+    return client.request('GET', '/api/profile/')
+
+
+def update_user_roles(client, state, number):
+    roles = state['roles']
+    return client.request('PUT', '/api/update-role/', {
+        'roles': [{'name': roles[(number + offset) % len(roles)]} for offset in range(3)]})
+
+
+def role_list(client, state, number):
+    return client.request('GET', '/api/roles/')
+
+
+def designation_list(client, state, number):
+    return client.request('GET', '/api/designations/')
+
+
+def user_list(client, state, number):
+    return client.request('GET', '/api/users/')
+
+
+# scenario: (function, login as, None for anonymous, 'user' or 'staff')
+SCENARIOS = {
+    'register_user': (register_user, None),
+    'token_obtain_pair': (token_obtain_pair, None),
+    'token_refresh': (token_refresh, 'user'),
+    'get_user_profile': (get_user_profile, 'user'),
+    'update_user_roles': (update_user_roles, 'user'),
+    'role_list': (role_list, 'user'),
+    'designation_list': (designation_list, 'user'),
+    'user_list': (user_list, 'staff'),
+}
+
+
+def run_scenario(name, args, state):
+    function, login = SCENARIOS[name]
+    latencies = []
+    statuses = collections.Counter()
+    queries = []
+    errors = collections.Counter()
+    lock = threading.Lock()
+    # every thread takes its own slice of the request numbers
+    per_thread = [range(start, args.requests, args.concurrency)
+                  for start in range(args.concurrency)]
+
+    def worker(thread, numbers):
+        client = Client(args.url)
+        timings, codes, counts, failures = [], collections.Counter(), [], collections.Counter()
+        try:
+            if login == 'user':
+                client.refresh = client.login(state['email'](thread), args.password)['refresh']
+            elif login == 'staff':
+                client.login(state['staff_email'], args.password)
+            for number in numbers:
+                start = time.perf_counter()
+                try:
+                    status, _, count = function(client, state, number)
+                except (OSError, http.client.HTTPException) as exp:
+                    failures[type(exp).__name__] += 1
+                    continue
+                timings.append(time.perf_counter() - start)
+                codes[status] += 1
+                if count is not None:
+                    counts.append(count)
+        except Exception as exp:
+            failures[f'{type(exp).__name__}: {exp}'] += 1
+        finally:
+            client.close()
+            with lock:
+                latencies.extend(timings)
+                statuses.update(codes)
+                queries.extend(counts)
+                errors.update(failures)
+
+    threads = [threading.Thread(target=worker, args=(thread, numbers))
+               for thread, numbers in enumerate(per_thread)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {'requests': len(latencies), 'seconds': round(elapsed, 3),
+              'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+              'statuses': {str(status): count for status, count in sorted(statuses.items())},
+              'errors': dict(errors)}
+    if latencies:
+        result.update({'p50_ms': round(statistics.median(latencies) * 1000, 2),
+                       'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+                       'p99_ms': round(percentile(latencies, 99) * 1000, 2)})
+    if queries:
+        result['queries_per_request'] = round(statistics.fmean(queries), 2)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold) -> list:
+    '''
+    Returns the regressions of `results` against `baseline`, more than
+    `threshold` (a fraction) worse throughput, p95 latency or queries
+    '''
+    regressions = []
+    for name, result in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            continue
+        if before.get('rps') and result['rps'] < before['rps'] * (1 - threshold):
+            regressions.append(f'{name}: {result["rps"]} req/s < {before["rps"]}')
+        for metric in ('p95_ms', 'queries_per_request'):
+            if metric in before and result.get(metric, 0) > before[metric] * (1 + threshold):
+                regressions.append(f'{name}: {metric} {result[metric]} > {before[metric]}')
+    return regressions
+
+
+def print_results(results):
+    print(f'{"scenario":<20} {"requests":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"queries":>8}  statuses')
+    for name, result in results['scenarios'].items():
+        statuses = ' '.join(f'{status}x{count}' for status, count in result['statuses'].items())
+        print(f'{name:<20} {result["requests"]:>8} {result["rps"]:>8.1f} '
+              f'{result.get("p50_ms", 0):>8.2f} {result.get("p95_ms", 0):>8.2f} '
+              f'{result.get("p99_ms", 0):>8.2f} {result.get("queries_per_request", 0):>8.2f}'
+              f'  {statuses}')
+        for error, count in result['errors'].items():
+            print(f'{"":<20} {count} x {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=1000,
+                        help='users seeded by seed_users, logins are spread over them')
+    parser.add_argument('--prefix', default='bench', help='prefix given to seed_users')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='regression allowed against --compare (default: 0.2)')
+    args = parser.parse_args()
+
+    users = max(1, args.users)
+    state = {
+        'run': f'load-{uuid.uuid4().hex[:8]}',
+        'password': args.password,
+        'email': lambda number: f'{args.prefix}{number % users}@example.com',
+        'staff_email': f'{args.prefix}-staff@example.com',
+    }
+    client = Client(args.url)
+    client.login(state['email'](0), args.password)
+    status, content, _ = client.request('GET', '/api/roles/')
+    client.close()
+    roles = content.get('results', content.get('data')) if isinstance(content, dict) else content
+    state['roles'] = [role['name'] for role in roles or ()]
+    if not state['roles']:
+        sys.exit(f'No roles found ({status}), run seed_users first')
+
+    results = {
+        'commit': git_commit(),
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'url': args.url,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'python': platform.python_version(),
+        'scenarios': {name: run_scenario(name, args, state) for name in args.scenarios},
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+'''
+Microbenchmarks of the serialization hot paths of the users views
+
+Times `UserSerializer(user).data` for users with 0/10/100 roles (and the
+compiled `UserReadSerializer`), role lists with `RoleSerializer` and
+`RoleReadSerializer`, `ManageUserRolesSerializer.to_internal_value`,
+`CustomTokenObtainPairSerializer.get_token` and `ApiResponse.success` with
+large payloads, on a throw away test database. Every benchmark reports the
+best and median time per call over `--rounds` rounds, the database queries
+of one call and, measured in a separate pass with tracemalloc (which slows
+the code down), the memory allocated at peak by one call and the memory
+still held after `--number` calls and a garbage collection.
+
+The users are loaded with their relations beforehand like the views do, so
+the numbers are the cost of serialization alone.
+
+Usage:
+    python -m benchmarks.micro
+    python -m benchmarks.micro --filter user_serializer --rounds 20 --output micro.json
+'''
+import argparse
+import gc
+import json
+import statistics
+import time
+import tracemalloc
+
+from benchmarks.utils import benchmark_database, setup_django
+
+ROLE_COUNTS = (0, 10, 100)
+PAYLOAD_SIZES = (100, 1000)
+
+
+def measure(function, rounds, number) -> dict:
+    '''
+    Returns the time per call (µs), queries of one call and the allocations
+    of `function`
+
+    Parameters
+    ----------
+        function : `callable`
+            benchmarked code, called without arguments
+        rounds : `int`
+            timed rounds, the best and median are reported
+        number : `int`
+            calls per round
+    '''
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    # warm up caches (lookup tables, lazy settings, serializer fields)
+    function()
+    with CaptureQueriesContext(connection) as queries:
+        function()
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        for _ in range(number):
+            function()
+        # serializers and their fields are reference cycles, only what
+        # survives a collection is held
+        gc.collect()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'best_us': round(min(timings) * 1e6, 2),
+            'median_us': round(statistics.median(timings) * 1e6, 2),
+            'queries': len(queries),
+            'peak_kib': round((peak - baseline) / 1024, 2),
+            'retained_kib': round((retained - baseline) / 1024, 2)}
+
+
+def seed():
+    '''
+    Returns users with 0/10/100 roles, by role count
+    '''
+    from apps.users.loaders import load_user
+    from apps.users.models import CustomUser, Designation, Role
+
+    designation = Designation.objects.create(title='ENGINEER')
+    roles = Role.objects.bulk_create(Role(name=f'ROLE{i}') for i in range(max(ROLE_COUNTS)))
+    users = {}
+    for count in ROLE_COUNTS:
+        user = CustomUser.objects.create_user(
+            email=f'micro{count}@example.com', username=f'micro{count}',
+            password='micro-password-123', first_name='Micro', last_name=f'User {count}',
+            designation=designation)
+        user.roles.add(*roles[:count])
+        users[count] = load_user(pk=user.pk)
+    return users
+
+
+def benchmarks(users) -> dict:
+    '''
+    Returns the benchmarks by name
+    '''
+    from apps.users.models import Role
+    from apps.users.serializers import (CustomTokenObtainPairSerializer,
+                                        ManageUserRolesSerializer,
+                                        RoleReadSerializer, RoleSerializer,
+                                        UserReadSerializer, UserSerializer)
+    from django_drf_boilerplate.utils.response import ApiResponse
+
+    cases = {}
+    for count, user in users.items():
+        cases[f'user_serializer_data[{count} roles]'] = (
+            lambda user=user: UserSerializer(user).data)
+        cases[f'user_read_serializer_data[{count} roles]'] = (
+            lambda user=user: UserReadSerializer(user).data)
+    roles = list(Role.objects.order_by('pk'))
+    role_rows = list(Role.objects.order_by('pk').values('id', 'name'))
+    cases[f'role_serializer_many[{len(roles)} roles]'] = (
+        lambda: RoleSerializer(roles, many=True).data)
+    cases[f'role_read_serializer_many[{len(roles)} roles]'] = (
+        lambda: RoleReadSerializer(roles, many=True).data)
+    cases[f'role_read_serializer_many[{len(roles)} values rows]'] = (
+        lambda: RoleReadSerializer(role_rows, many=True).data)
+
+    user = users[10]
+    roles_data = {'roles': [{'name': f'role{i}'} for i in range(10)]}
+    cases['manage_roles_to_internal_value[10 roles]'] = (
+        lambda: ManageUserRolesSerializer(instance=user, data=roles_data, partial=True)
+        .to_internal_value(roles_data))
+    cases['token_get_token[10 roles]'] = (
+        lambda: CustomTokenObtainPairSerializer.get_token(user))
+
+    profile = dict(UserSerializer(user).data)
+    for size in PAYLOAD_SIZES:
+        payload = [profile] * size
+        cases[f'api_response_success[{size} users]'] = (
+            lambda payload=payload: ApiResponse.success(data=payload))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--number', type=int, default=200, help='calls per round')
+    parser.add_argument('--filter', default='', help='run the benchmarks containing this')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = {}
+        print(f'{"benchmark":<42} {"best µs":>10} {"median µs":>10} {"queries":>8} '
+              f'{"peak KiB":>9} {"held KiB":>9}')
+        for name, function in benchmarks(seed()).items():
+            if args.filter not in name:
+                continue
+            # large payloads get fewer calls per round
+            number = max(1, args.number // 10) if '1000' in name else args.number
+            result = results[name] = measure(function, args.rounds, number)
+            print(f'{name:<42} {result["best_us"]:>10.2f} {result["median_us"]:>10.2f} '
+                  f'{result["queries"]:>8} {result["peak_kib"]:>9.2f} '
+                  f'{result["retained_kib"]:>9.2f}')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+'''
+Query plans of role/designation filtered user queries before and after
+the `0007_user_lookup_indexes` migration
+
+Seeds a throw away test database with every migration applied, removes
+the indexes of 0007 (only that migration, the later ones stay applied so
+the models match the tables), prints the plans, adds the indexes back and
+prints them again.
+
+Usage:
+    ENV=development python -m benchmarks.query_plans --users 20000
+    ENV=production python -m benchmarks.query_plans --users 200000  # Postgres
+'''
+import argparse
+import random
+import time
+
+from benchmarks.utils import benchmark_database, setup_django
+
+BEFORE = ('users', '0006_customuser_updated_at_designation_updated_at_and_more')
+AFTER = ('users', '0007_user_lookup_indexes')
+
+
+def run_indexes_migration(backwards=False):
+    '''
+    Applies (or unapplies with `backwards`) the operations of 0007 alone
+    '''
+    from django.db import connection
+    from django.db.migrations.loader import MigrationLoader
+
+    loader = MigrationLoader(connection)
+    migration = loader.get_migration(*AFTER)
+    with connection.schema_editor(atomic=migration.atomic) as schema_editor:
+        if backwards:
+            migration.unapply(loader.project_state(AFTER), schema_editor)
+        else:
+            migration.apply(loader.project_state(BEFORE), schema_editor)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def seed(users, roles, designations):
+    from apps.users.models import CustomUser, Designation, Role
+
+    Role.objects.bulk_create(Role(name=f'ROLE{i}') for i in range(roles))
+    Designation.objects.bulk_create(
+        Designation(title=f'DESIGNATION{i}') for i in range(designations))
+    role_ids = list(Role.objects.values_list('id', flat=True))
+    designation_ids = list(Designation.objects.values_list('id', flat=True))
+    rng = random.Random(0)
+    batch = 5000
+    for start in range(0, users, batch):
+        created = CustomUser.objects.bulk_create(
+            CustomUser(email=f'user{i}@example.com', username=f'user{i}',
+                       password='!', is_active=rng.random() > 0.1,
+                       designation_id=rng.choice(designation_ids))
+            for i in range(start, min(start + batch, users)))
+        if any(user.pk is None for user in created):
+            created = CustomUser.objects.filter(
+                email__in=[user.email for user in created])
+        CustomUser.roles.through.objects.bulk_create(
+            CustomUser.roles.through(customuser_id=user.pk, role_id=role_id)
+            for user in created
+            for role_id in rng.sample(role_ids, 2))
+
+
+def queries():
+    from apps.users.loaders import profile_queryset
+    from apps.users.models import CustomUser
+
+    return {
+        'users with role X and designation Y':
+            profile_queryset().filter(roles=1, designation_id=1).order_by('pk')[:50],
+        'active users by designation':
+            CustomUser.objects.filter(designation_id=1, is_active=True).order_by('pk')[:50],
+        'users with role X':
+            CustomUser.objects.filter(roles=1).order_by('pk')[:50],
+    }
+
+
+def report(label):
+    print(f'\n===== {label} =====')
+    for name, queryset in queries().items():
+        start = time.perf_counter()
+        list(queryset)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f'\n--- {name} ({elapsed:.2f} ms)\n{queryset.explain()}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--roles', type=int, default=50)
+    parser.add_argument('--designations', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        seed(args.users, args.roles, args.designations)
+        run_indexes_migration(backwards=True)
+        report(f'before (without {AFTER[1]})')
+        run_indexes_migration()
+        report(f'after ({AFTER[1]})')
+
+
+if __name__ == '__main__':
+    main()
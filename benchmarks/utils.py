@@ -0,0 +1,49 @@
+'''
+Shared helpers for the benchmarks
+'''
+import os
+from contextlib import contextmanager
+
+import django
+
+
+def setup_django():
+    '''
+    Configures Django for a standalone benchmark script
+    '''
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_drf_boilerplate.settings')
+    django.setup()
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
+@contextmanager
+def benchmark_database(local_cache=True):
+    '''
+    Creates throw away test databases (like `manage.py test`) for the
+    duration of the block, with a local memory cache and task queue unless
+    `local_cache` is false
+    '''
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import (override_settings, setup_test_environment,
+                                   teardown_test_environment)
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0, interactive=False)
+    old_config = runner.setup_databases()
+    caches = (override_settings(CACHES=LOCMEM_CACHES, TASKS_BACKEND='memory')
+              if local_cache else None)
+    if caches is not None:
+        caches.enable()
+    try:
+        yield
+    finally:
+        if caches is not None:
+            caches.disable()
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
@@ -14,7 +14,7 @@ ALLOWED_HOSTS = ['*']
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "BACKEND": "django_drf_boilerplate.utils.redis.TimedRedisCache",
         "LOCATION": "redis://127.0.0.1:6379",
     }
 }
@@ -32,8 +32,15 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # local stand in for a read replica, only read from when listed in
+    # DATABASE_REPLICAS (the routing tests use it)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+    },
 }
+DATABASE_REPLICAS = []
 
 SWAGGER_SETTINGS = {
     'DEFAULT_INFO': 'import.path.to.urls.api_info',
@@ -4,6 +4,7 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from django_drf_boilerplate.utils.database import postgres_database
 from django_drf_boilerplate.utils.env_validate import validate_env
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -25,7 +26,7 @@ SECRET_KEY = os.getenv('DJANGO_SECRET')
 
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "BACKEND": "django_drf_boilerplate.utils.redis.TimedRedisCache",
         "LOCATION": os.getenv('CACHE_URL'),
     }
 }
@@ -35,13 +36,12 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(hours=2),
 }
 
+# persistent connections / psycopg pool / pgbouncer, see utils/database.py
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.getenv('DB_NAME'),
-        'USER': os.getenv('DB_USER'),
-        'PASSWORD': os.getenv('DB_PASSWORD'),
-        'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT'),
-    }
+    'default': postgres_database(),
 }
+# read replica, DB_REPLICA_* fall back to the DB_* values
+DATABASE_REPLICAS = []
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = postgres_database(prefix='DB_REPLICA_')
+    DATABASE_REPLICAS = ['replica']
@@ -14,8 +14,6 @@ import os
 from pathlib import Path
 from venv import logger
 
-from django_drf_boilerplate.utils.logger import get_extra_params
-
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -53,6 +51,7 @@ INSTALLED_APPS = [
 
     # Other apps
     'apps.users',
+    'apps.tasks',
     'rest_framework',
     'rest_framework_simplejwt',
     'drf_yasg',
@@ -63,18 +62,120 @@ SESSIONS_ENGINE = 'django.contrib.sessions.backends.cache'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'apps.users.authentication.StatelessJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'django_drf_boilerplate.utils.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'DEFAULT_PAGINATION_CLASS': 'django_drf_boilerplate.utils.pagination.PrimaryKeyCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 50)),
+    # GCRA throttles of apps.users.throttling, by scope
+    'DEFAULT_THROTTLE_RATES': {
+        'anon_ip': os.getenv('THROTTLE_RATE_ANON_IP', '30/minute'),
+        'login': os.getenv('THROTTLE_RATE_LOGIN', '10/minute'),
+        'register': os.getenv('THROTTLE_RATE_REGISTER', '5/minute'),
+        'profile': os.getenv('THROTTLE_RATE_PROFILE', '120/minute'),
+        'user': os.getenv('THROTTLE_RATE_USER', '600/minute'),
+    },
 }
 
+# serve profile, login and token refresh with the async views (ASGI),
+# on by default in production
+API_ASYNC_VIEWS = os.getenv(
+    'API_ASYNC_VIEWS', str(ENV == 'production')).lower() in ('1', 'true', 'yes')
+
+# JSON encoder of ApiResponse and FastJSONRenderer: 'orjson' (compact, UTF-8)
+# or 'json' (same bytes as JsonResponse), see utils/encoders.py
+API_JSON_BACKEND = os.getenv('API_JSON_BACKEND', 'orjson')
+
+# seconds a serialized user profile stays in the cache
+USER_PROFILE_CACHE_TIMEOUT = int(os.getenv('USER_PROFILE_CACHE_TIMEOUT', 300))
+
+# background tasks (apps/tasks): 'redis' keeps the queues in the Redis of
+# the default cache, 'memory' in the process (tests)
+TASKS_BACKEND = os.getenv('TASKS_BACKEND', 'redis')
+# seconds a worker may run a task before it is handed to another worker
+TASKS_VISIBILITY_TIMEOUT = int(os.getenv('TASKS_VISIBILITY_TIMEOUT', 300))
+# failed tasks kept per queue in the dead letter list
+TASKS_DEAD_LETTER_LIMIT = int(os.getenv('TASKS_DEAD_LETTER_LIMIT', 1000))
+
+# user ids and emails one batch lookup (POST /api/users/batch/) may ask for
+USER_BATCH_MAX_SIZE = int(os.getenv('USER_BATCH_MAX_SIZE', 100))
+
+# seconds a user's token version (JWT revocation check) stays in the cache
+TOKEN_VERSION_CACHE_TIMEOUT = int(os.getenv('TOKEN_VERSION_CACHE_TIMEOUT', 3600))
+
+# revoked JWTs: seconds between bloom filter syncs of a process, revoked
+# tokens the filter is sized for and its false positive rate at that size
+TOKEN_REVOCATION_SYNC_INTERVAL = float(
+    os.getenv('TOKEN_REVOCATION_SYNC_INTERVAL', 5))
+TOKEN_REVOCATION_BLOOM_CAPACITY = int(
+    os.getenv('TOKEN_REVOCATION_BLOOM_CAPACITY', 100000))
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = float(
+    os.getenv('TOKEN_REVOCATION_BLOOM_ERROR_RATE', 0.001))
+
+# role/designation lookup cache: local LRU size, seconds between version
+# checks against the shared cache and lifetime of the shared copy
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv('LOOKUP_CACHE_MAX_ENTRIES', 1024))
+LOOKUP_CACHE_VERSION_TTL = float(os.getenv('LOOKUP_CACHE_VERSION_TTL', 5))
+LOOKUP_CACHE_TIMEOUT = int(os.getenv('LOOKUP_CACHE_TIMEOUT', 3600))
+
+# rows validated and inserted per batch by the bulk user import
+USER_IMPORT_BATCH_SIZE = int(os.getenv('USER_IMPORT_BATCH_SIZE', 1000))
+# files uploaded to the import endpoint wait here for a task worker, the
+# directory must be shared by the web and worker processes
+USER_IMPORT_UPLOAD_DIR = os.getenv('USER_IMPORT_UPLOAD_DIR',
+                                   str(BASE_DIR / 'uploads' / 'imports'))
+# seconds an import task may run before another worker takes it over
+USER_IMPORT_TIMEOUT = int(os.getenv('USER_IMPORT_TIMEOUT', 6 * 3600))
+
+# processes hashing password batches per server process (every gunicorn
+# worker has its own pool, keep it small), 0 uses every core and 1 hashes
+# inline
+PASSWORD_HASHING_WORKERS = int(os.getenv('PASSWORD_HASHING_WORKERS', 2))
+# smaller batches are hashed inline, the pool round trip is not worth it
+PASSWORD_HASHING_POOL_THRESHOLD = int(
+    os.getenv('PASSWORD_HASHING_POOL_THRESHOLD', 8))
+# spawn keeps hashing processes clear of locks held by server threads
+PASSWORD_HASHING_START_METHOD = os.getenv(
+    'PASSWORD_HASHING_START_METHOD', 'spawn')
+
+# level of the django loggers, records below it are dropped before they
+# are formatted
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO' if ENV == 'production' else 'DEBUG')
+# records waiting for the log writer thread at most, more are dropped
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# records written between two flushes of the log files
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', 256))
+# requests slower than this (milliseconds) are logged at WARNING
+REQUEST_SLOW_THRESHOLD_MS = float(os.getenv('REQUEST_SLOW_THRESHOLD_MS', 500))
+
+# bearer token /metrics requires, when empty /metrics is open in development
+# and not found in production
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# view query budget overruns: 'raise', 'log' or 'off', see utils/query_budget.py
+QUERY_BUDGET_ACTION = os.getenv(
+    'QUERY_BUDGET_ACTION', 'log' if ENV == 'production' else 'raise')
+# budgets by URL name of views without a @query_budget
+QUERY_BUDGETS = {
+    # user joined with designation, roles prefetch
+    'token_obtain_pair': {'max_queries': 2},
+}
+# queries slower than this (milliseconds) are logged with their origin,
+# the slowest QUERY_SAMPLE_LIMIT of a request (0 turns sampling off)
+QUERY_SAMPLE_MIN_MS = float(os.getenv('QUERY_SAMPLE_MIN_MS', 100))
+QUERY_SAMPLE_LIMIT = int(os.getenv('QUERY_SAMPLE_LIMIT', 5))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'filters': {
-        'add_extra_params': {
-            '()': 'django.utils.log.CallbackFilter',
-            'callback': get_extra_params,
-        }
+        # request id, method, path and client address of the request
+        'request_context': {
+            '()': 'django_drf_boilerplate.utils.tracing.RequestContextFilter',
+        },
     },
     'formatters': {
         'verbose': {
@@ -90,15 +191,15 @@ LOGGING = {
             "format": "[{server_time}] {message}",
             "style": "{",
         },
-        'request_formatter': {
-            'format': '{levelname} {asctime} {request.method} {ip} MODULE: [{module}] MESSAGE: [{message}]',
-            'style': '{'
-        }
+        # one JSON object per line, for the log pipeline
+        'json': {
+            '()': 'django_drf_boilerplate.utils.tracing.JsonFormatter',
+        },
     },
     'handlers': {
         'file-debug': {
             'level': 'DEBUG',
-            'class': 'logging.handlers.TimedRotatingFileHandler',
+            'class': 'django_drf_boilerplate.utils.logger.BatchTimedRotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs/debug.log'),
             'when': 'midnight',
             'interval': 1,
@@ -108,7 +209,7 @@ LOGGING = {
         },
         'console': {
             'level': 'INFO',
-            'class': 'logging.StreamHandler',
+            'class': 'django_drf_boilerplate.utils.logger.BatchStreamHandler',
             'formatter': 'simple',
         },
         "django.server": {
@@ -118,21 +219,61 @@ LOGGING = {
         },
         'log_to_file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
+            'class': 'django_drf_boilerplate.utils.logger.BatchFileHandler',
             'filename': './logs/api.log',
-            'formatter': 'request_formatter',
-            'filters': ['add_extra_params']
+            'formatter': 'json',
+        },
+        # request threads only enqueue, a background thread writes the
+        # records to the targets (utils/logger.py)
+        'queue-debug': {
+            '()': 'django_drf_boilerplate.utils.logger.AsyncQueueHandler',
+            'filters': ['request_context'],
+            'targets': ['file-debug', 'console'],
+            'maxsize': LOG_QUEUE_SIZE,
+            'batch_size': LOG_BATCH_SIZE,
+        },
+        'queue-request': {
+            '()': 'django_drf_boilerplate.utils.logger.AsyncQueueHandler',
+            'filters': ['request_context'],
+            'targets': ['console', 'log_to_file'],
+            'maxsize': LOG_QUEUE_SIZE,
+            'batch_size': LOG_BATCH_SIZE,
+        },
+        'queue-timing': {
+            '()': 'django_drf_boilerplate.utils.logger.AsyncQueueHandler',
+            'filters': ['request_context'],
+            'targets': ['log_to_file'],
+            'maxsize': LOG_QUEUE_SIZE,
+            'batch_size': LOG_BATCH_SIZE,
         },
     },
     'loggers': {
         'django': {
-            'handlers': ['file-debug', 'console'],
-            'level': 'DEBUG',
+            'handlers': ['queue-debug'],
+            'level': LOG_LEVEL,
             'propagate': True,
         },
         'django.request': {  # Logs only  only 4xx and 5xx requests.
-            'handlers': ['console', 'log_to_file'],
-            'level': 'DEBUG',
+            'handlers': ['queue-request'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        # query budget overruns and slow query samples
+        'django_drf_boilerplate.utils.query_budget': {
+            'handlers': ['queue-request'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        # task runs, retries and failures of the workers
+        'apps.tasks': {
+            'handlers': ['queue-debug'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+        # one record per request with its timings, see utils/tracing.py
+        'django_drf_boilerplate.requests': {
+            'handlers': ['queue-timing'],
+            'level': 'INFO',
             'propagate': False,
         },
         "django.server": {
@@ -145,6 +286,12 @@ LOGGING = {
 
 
 MIDDLEWARE = [
+    # request id, query/cache timings and the per request log record
+    'django_drf_boilerplate.utils.tracing.RequestTracingMiddleware',
+    # prometheus request metrics, exposed at /metrics
+    'django_drf_boilerplate.utils.metrics.MetricsMiddleware',
+    # per view SQL query budgets and slow query samples
+    'django_drf_boilerplate.utils.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -155,8 +302,20 @@ MIDDLEWARE = [
 
     # locale middleware
     'django.middleware.locale.LocaleMiddleware',
+
+    # X-RateLimit-* headers of throttled endpoints
+    'apps.users.throttling.RateLimitHeadersMiddleware',
+    # read replica routing of apps.users models
+    'apps.users.routers.ReplicaRoutingMiddleware',
 ]
 
+# safe method reads of apps.users models go to DATABASE_REPLICAS (set by
+# development.py / production.py), writes to the primary
+DATABASE_ROUTERS = ['apps.users.routers.ReplicaRouter']
+# seconds the reads of a user that wrote stay on the primary, above the
+# replica lag
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', 5))
+
 ROOT_URLCONF = 'django_drf_boilerplate.urls'
 
 TEMPLATES = [
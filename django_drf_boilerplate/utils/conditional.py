@@ -0,0 +1,130 @@
+'''
+Conditional GET helpers (ETag / Last-Modified)
+
+A view computes its validators cheaply (a version or a stored payload
+hash) and answers `If-None-Match` / `If-Modified-Since` with `304` before
+doing any serialization.
+
+Usage:
+    from django_drf_boilerplate.utils.conditional import (
+        conditional_response, payload_digest, payload_etag, set_validators)
+
+    etag = payload_etag(payload_digest(data))
+    response = conditional_response(request, etag, last_modified)
+    if response is None:
+        response = ApiResponse.success(data=data)
+    return set_validators(response, etag, last_modified)
+
+    # ListAPIView / ListCreateAPIView
+    class RoleListViews(ConditionalGetMixin, generics.ListCreateAPIView):
+        def get_etag(self, request):
+            return make_etag('roles', role_lookup.version(),
+                             self.get_representation_key(request))
+'''
+import hashlib
+import json
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+from django_drf_boilerplate.utils.encoders import get_backend
+
+
+def payload_digest(data) -> str:
+    '''
+    Returns a stable hash of a JSON serializable payload
+    '''
+    encoded = json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha1(encoded.encode(), usedforsecurity=False).hexdigest()
+
+
+def make_etag(*parts) -> str:
+    '''
+    Returns a quoted strong ETag built from `parts`
+    '''
+    return quote_etag('-'.join(str(part) for part in parts))
+
+
+def payload_etag(digest, *parts) -> str:
+    '''
+    Returns the ETag of an `ApiResponse` payload, the active language and
+    JSON backend are part of it since they change the response bytes
+    '''
+    return make_etag(digest, get_language(), get_backend(), *parts)
+
+
+def _timestamp(last_modified):
+    if isinstance(last_modified, datetime):
+        return int(last_modified.timestamp())
+    return last_modified
+
+
+def conditional_response(request, etag=None, last_modified=None):
+    '''
+    Returns a `304 Not Modified` (or `412`) response when the request
+    preconditions match the validators, `None` otherwise
+
+    Parameters
+    ----------
+        request : `HttpRequest`
+            Django or DRF request
+        etag : `str`
+            quoted ETag
+        last_modified : `datetime`
+            last modification time
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=_timestamp(last_modified))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    '''
+    Sets the `ETag` and `Last-Modified` headers of a response
+    '''
+    if etag and not response.has_header('ETag'):
+        response.headers['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(_timestamp(last_modified))
+    return response
+
+
+class ConditionalGetMixin:
+    '''
+    Conditional GET for DRF generic views
+
+    Subclasses implement `get_etag()` and optionally `get_last_modified()`,
+    both called after content negotiation and before the queryset is
+    touched.
+    '''
+
+    def get_etag(self, request):
+        raise NotImplementedError('get_etag() must be implemented')
+
+    def get_last_modified(self, request):
+        return None
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        last_modified = self.get_last_modified(request)
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+
+    def get_representation_key(self, request) -> str:
+        '''
+        Returns a short hash of the renderer, JSON backend and query string
+        of a request
+        '''
+        renderer = getattr(request, 'accepted_renderer', None)
+        key = (f"{getattr(renderer, 'format', '')}:{get_backend()}"
+               f"?{request.META.get('QUERY_STRING', '')}")
+        return hashlib.sha1(key.encode(), usedforsecurity=False).hexdigest()[:12]
@@ -0,0 +1,68 @@
+'''
+Postgres connection settings built from the environment
+
+    DB_CONN_MAX_AGE         seconds a connection is reused, 0 closes it after
+                            every request (default 60)
+    DB_CONN_HEALTH_CHECKS   ping a reused connection before the request uses
+                            it (default true)
+    DB_CONNECT_TIMEOUT      seconds to wait for a new connection (default 5)
+    DB_PGBOUNCER_TRANSACTION_POOLING
+                            behind pgbouncer in transaction mode: no server
+                            side cursors or prepared statements, they do not
+                            survive the end of a transaction
+
+Persistent connections belong to a thread. Under ASGI every request runs
+its sync code on a new thread, so they are never reused there: the
+production server (`gunicorn.conf.py`) defaults `DB_CONN_MAX_AGE` to 0 and
+connects through pgbouncer in transaction mode (the `pgbouncer` service of
+`docker-compose.yml`), which keeps the Postgres connections open, so a
+request only opens a cheap local connection to pgbouncer.
+
+Usage:
+    from django_drf_boilerplate.utils.database import postgres_database
+
+    DATABASES = {'default': postgres_database()}
+'''
+import os
+from importlib.util import find_spec
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def env_flag(env, name, default=False) -> bool:
+    return env.get(name, str(default)).lower() in TRUE_VALUES
+
+
+def postgres_database(env=None, prefix='DB_') -> dict:
+    '''
+    Returns a `DATABASES` entry for Postgres
+
+    Parameters
+    ----------
+        env : `dict`
+            environment, `os.environ` if not given
+        prefix : `str`
+            variable prefix, e.g. `DB_REPLICA_` for a replica, a missing
+            variable falls back to its `DB_` value
+    '''
+    env = os.environ if env is None else env
+    env = {**env, **{'DB_' + name[len(prefix):]: value for name, value in env.items()
+                     if name.startswith(prefix)}}
+    transaction_pooling = env_flag(env, 'DB_PGBOUNCER_TRANSACTION_POOLING')
+    psycopg3 = find_spec('psycopg') is not None
+    database = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env.get('DB_NAME'),
+        'USER': env.get('DB_USER'),
+        'PASSWORD': env.get('DB_PASSWORD'),
+        'HOST': env.get('DB_HOST'),
+        'PORT': env.get('DB_PORT'),
+        'CONN_MAX_AGE': int(env.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': env_flag(env, 'DB_CONN_HEALTH_CHECKS', True),
+        'DISABLE_SERVER_SIDE_CURSORS': transaction_pooling,
+        'OPTIONS': {'connect_timeout': int(env.get('DB_CONNECT_TIMEOUT', 5))},
+    }
+    if transaction_pooling and psycopg3:
+        # psycopg 3 prepares repeated queries server side
+        database['OPTIONS']['prepare_threshold'] = None
+    return database
@@ -0,0 +1,86 @@
+'''
+JSON encoding backends for API responses
+
+The backend is chosen with the `API_JSON_BACKEND` setting:
+
+    'orjson'    orjson, falls back to 'json' when it is not installed
+    'json'      stdlib json with `DjangoJSONEncoder`, byte for byte the same
+                output as `JsonResponse`
+
+Types orjson does not know (Decimal, lazy translations, ...) and dates are
+handed to `DjangoJSONEncoder` so both backends produce the same values.
+
+The bytes differ though: orjson, the default, writes no spaces after `:`
+and `,` and writes non-ASCII characters (U+2028 and U+2029 included) as
+UTF-8 instead of `\\uXXXX` escapes. Clients parsing JSON see no
+difference, set `API_JSON_BACKEND=json` for byte for byte compatibility
+with `JsonResponse` (response signatures, cached bodies, ...).
+
+Usage:
+    from django_drf_boilerplate.utils.encoders import dumps
+
+    dumps({'key': 'value'})     # b'{"key":"value"}'
+'''
+import json
+import logging
+from functools import cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+JSON_BACKENDS = ('orjson', 'json')
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def _orjson_default(obj):
+    return _django_encoder.default(obj)
+
+
+def dumps_json(data) -> bytes:
+    '''
+    Encodes `data` like `JsonResponse` does
+    '''
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+def dumps_orjson(data, default=_orjson_default) -> bytes:
+    '''
+    Encodes `data` with orjson, compact and UTF-8
+    '''
+    return orjson.dumps(data, default=default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+@cache
+def _warn_orjson_missing():
+    logger.warning('orjson is not installed, using the json backend')
+
+
+def get_backend() -> str:
+    '''
+    Returns the configured backend, `json` if orjson is not installed
+    '''
+    backend = getattr(settings, 'API_JSON_BACKEND', 'orjson')
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f'Unknown API_JSON_BACKEND: {backend}')
+    if backend == 'orjson' and orjson is None:
+        _warn_orjson_missing()
+        return 'json'
+    return backend
+
+
+def dumps(data) -> bytes:
+    '''
+    Encodes `data` with the configured backend
+    '''
+    if get_backend() == 'orjson':
+        return dumps_orjson(data)
+    return dumps_json(data)
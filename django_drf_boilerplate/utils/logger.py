@@ -1,16 +1,242 @@
 '''
 logging configuration for django project
+
+Log records are written off the request path: `AsyncQueueHandler` puts
+them on a bounded queue and a background thread (`BatchQueueListener`)
+hands them to the real handlers in batches, flushing each handler once per
+batch. A full queue drops records instead of blocking the request, the
+number dropped is kept on the handler and logged once there is room again.
+
+Usage:
+    LOGGING = {
+        'handlers': {
+            'file': {'class': 'django_drf_boilerplate.utils.logger.BatchFileHandler',
+                     'filename': 'logs/api.log'},
+            'queue': {'()': 'django_drf_boilerplate.utils.logger.AsyncQueueHandler',
+                      'targets': ['file'], 'maxsize': 10000},
+        },
+        'loggers': {'django': {'handlers': ['queue'], 'level': 'INFO'}},
+    }
 '''
-from datetime import datetime
+import copy
+import logging
+import queue
+from logging.handlers import (QueueHandler, QueueListener,
+                              TimedRotatingFileHandler)
 
 
 def get_extra_params(record):
     """Returns extra params for the logger filter that can be accessed on formatter
 
+    `tracing.RequestContextFilter` adds these and the request id without
+    the request object, prefer it
+
     Args:
         record (LogRecord): LogRecord object
     """
-    record.ip = record.request.META.get('REMOTE_ADDR')  # ip
-    record.time = datetime.strftime(
-        datetime.now(), '%Y-%m-%d %H:%M %p')  # formatted date and time
+    request = getattr(record, 'request', None)
+    record.ip = request.META.get('REMOTE_ADDR') if request is not None else None  # ip
     return True
+
+
+class BatchFlushMixin:
+    '''
+    Stream handler that `BatchQueueListener` flushes once per batch instead
+    of after every record
+    '''
+    # listeners in a batch, a handler can be the target of several
+    batching = 0
+
+    def flush(self):
+        if not self.batching:
+            super().flush()
+
+
+class BatchStreamHandler(BatchFlushMixin, logging.StreamHandler):
+    pass
+
+
+class BatchFileHandler(BatchFlushMixin, logging.FileHandler):
+    pass
+
+
+class BatchTimedRotatingFileHandler(BatchFlushMixin, TimedRotatingFileHandler):
+    pass
+
+
+def _handler_by_name(name):
+    if hasattr(logging, 'getHandlerByName'):  # python 3.12+
+        return logging.getHandlerByName(name)
+    return logging._handlers.get(name)
+
+
+class BatchQueueListener(QueueListener):
+    '''
+    `QueueListener` handling up to `batch_size` records per wake up
+
+    Parameters
+    ----------
+        log_queue : `queue.Queue`
+            queue the records are read from
+        handlers : `logging.Handler`
+            handlers the records are passed to, their levels are respected
+        batch_size : `int`
+            records handled before the handlers are flushed
+        on_batch : `callable`
+            called with the listener after every batch, on its thread
+    '''
+
+    def __init__(self, log_queue, *handlers, batch_size=256, on_batch=None):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+
+    def start(self):
+        super().start()
+        self._thread.name = 'log-listener'
+
+    def _next_batch(self):
+        batch = [self.dequeue(True)]
+        while batch[-1] is not self._sentinel and len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    # a failing filter must not stop the listener thread
+                    handler.handleError(record)
+
+    def handle_batch(self, records):
+        batching = [handler for handler in self.handlers
+                    if isinstance(handler, BatchFlushMixin)]
+        for handler in batching:
+            with handler.lock:
+                handler.batching += 1
+        try:
+            for record in records:
+                self.handle(record)
+        finally:
+            for handler in batching:
+                with handler.lock:
+                    handler.batching -= 1
+                handler.flush()
+
+    def _monitor(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is self._sentinel
+            if stop:
+                batch.pop()
+            self.handle_batch(batch)
+            for _ in range(len(batch) + stop):
+                self.queue.task_done()
+            if self.on_batch is not None:
+                self.on_batch(self)
+            if stop:
+                break
+
+    def enqueue_sentinel(self):
+        # the queue may be full, wait for room
+        self.queue.put(self._sentinel)
+
+
+class AsyncQueueHandler(QueueHandler):
+    '''
+    Puts records on a bounded queue that a background thread writes to
+    `targets`
+
+    The listener thread starts with the first record, in the process that
+    logs it (gunicorn workers fork after the settings are loaded). Records
+    are formatted on that thread, only the message is built by the caller.
+
+    Parameters
+    ----------
+        targets : `list`
+            handlers or names of handlers configured before this one,
+            `dictConfig` creates them in name order
+        maxsize : `int`
+            records queued at most, more are dropped and counted
+        batch_size : `int`
+            records written between two flushes of the targets
+    '''
+
+    def __init__(self, targets=(), maxsize=10000, batch_size=256):
+        super().__init__(queue.Queue(maxsize))
+        # the targets are not attached to a logger, this keeps them alive
+        self.targets = [self._resolve_target(target) for target in targets]
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._reported = 0
+        self._listener = None
+
+    @staticmethod
+    def _resolve_target(target):
+        if isinstance(target, logging.Handler):
+            return target
+        handler = _handler_by_name(target)
+        if handler is None:
+            raise ValueError(f'Logging handler {target!r} is not configured, '
+                             'queue handlers must sort after their targets')
+        return handler
+
+    def start(self):
+        with self.lock:
+            if self._listener is None:
+                self._listener = BatchQueueListener(
+                    self.queue, *self.targets, batch_size=self.batch_size,
+                    on_batch=self._report_dropped)
+                self._listener.start()
+
+    def stop(self):
+        '''
+        Writes the queued records and stops the listener thread
+        '''
+        with self.lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+
+    def prepare(self, record):
+        # only the message is built here, its arguments may change once the
+        # logging call returns; formatting is left to the listener thread
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self._listener is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _report_dropped(self, listener):
+        dropped = self.dropped
+        if dropped > self._reported and not self.queue.full():
+            record = logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'Logging queue full, %d records dropped',
+                'args': (dropped - self._reported,)})
+            self._reported = dropped
+            listener.handle_batch([record])
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def _at_fork_reinit(self):
+        # the parent's queue and listener thread are not usable after a fork
+        super()._at_fork_reinit()
+        self.queue = queue.Queue(self.queue.maxsize)
+        self._listener = None
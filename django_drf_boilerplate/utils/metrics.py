@@ -0,0 +1,137 @@
+'''
+Prometheus metrics
+
+`MetricsMiddleware` records the latency of every request by view (URL
+name), method and status, with the database queries and query/cache time
+measured by `django_drf_boilerplate.utils.tracing` for the request. Cache
+hits and misses are counted by `TimedRedisCache`, throttle rejections by
+the GCRA throttles and password hash time by the hashing service, so
+views of new apps are covered without changes.
+
+Under gunicorn every worker writes its samples to `PROMETHEUS_MULTIPROC_DIR`
+(set by `gunicorn.conf.py`) and `/metrics` aggregates the files of all
+workers, whichever worker serves it.
+
+Usage:
+    MIDDLEWARE = [
+        'django_drf_boilerplate.utils.tracing.RequestTracingMiddleware',
+        'django_drf_boilerplate.utils.metrics.MetricsMiddleware',
+        ...
+    ]
+
+    path('metrics', metrics_view, name='metrics')
+'''
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry,
+                               Counter, Histogram, generate_latest, multiprocess)
+
+from django_drf_boilerplate.utils.tracing import get_request_context
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by view, method and status',
+    ['view', 'method', 'status'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request',
+    ['view'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per request',
+    ['view'], buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1))
+REQUEST_CACHE_TIME = Histogram(
+    'http_request_cache_duration_seconds', 'Time spent in cache calls per request',
+    ['view'], buckets=(.0005, .001, .005, .01, .025, .05, .1))
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Cache reads by result (hit or miss)', ['result'])
+THROTTLE_REJECTIONS = Counter(
+    'throttle_rejections', 'Requests rejected by a rate limit', ['scope'])
+PASSWORD_HASH_TIME = Histogram(
+    'password_hash_duration_seconds', 'Password hashing time',
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5))
+
+
+def record_cache_reads(hits, misses):
+    if hits:
+        CACHE_REQUESTS.labels('hit').inc(hits)
+    if misses:
+        CACHE_REQUESTS.labels('miss').inc(misses)
+
+
+def view_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # unknown URLs must not create a label value each
+        return UNRESOLVED_VIEW
+    return match.view_name
+
+
+class MetricsMiddleware:
+    '''
+    Records the latency, queries and query/cache time of every request,
+    below `RequestTracingMiddleware`
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def record(request, response, seconds):
+        view = view_name(request)
+        REQUEST_LATENCY.labels(view, request.method, response.status_code).observe(seconds)
+        context = get_request_context()
+        if context is not None:
+            REQUEST_DB_QUERIES.labels(view).observe(context.db_queries)
+            REQUEST_DB_TIME.labels(view).observe(context.db_time)
+            REQUEST_CACHE_TIME.labels(view).observe(context.cache_time)
+
+
+def get_registry():
+    '''
+    Returns the registry to expose, the samples of every worker when
+    `PROMETHEUS_MULTIPROC_DIR` is set
+    '''
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    '''
+    Prometheus exposition of the metrics, needs `Authorization: Bearer
+    <METRICS_TOKEN>` when `METRICS_TOKEN` is set. Without a token it is
+    only served outside production.
+    '''
+    if not settings.METRICS_TOKEN:
+        if settings.ENV == 'production':
+            raise Http404()
+    elif not constant_time_compare(
+            request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponse(status=403)
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,98 @@
+'''
+Keyset (cursor) pagination on the primary key
+
+Pages are selected with `pk > position` instead of `OFFSET`, so deep pages
+cost the same as the first one. Works on querysets and on lists of rows
+already sorted by primary key (e.g. the role/designation lookup cache).
+
+Usage:
+    REST_FRAMEWORK = {
+        'DEFAULT_PAGINATION_CLASS':
+            'django_drf_boilerplate.utils.pagination.PrimaryKeyCursorPagination',
+        'PAGE_SIZE': 50,
+    }
+
+    GET /api/roles/?page_size=20
+    GET /api/roles/?cursor=cD0yMA%3D%3D
+'''
+from bisect import bisect_left, bisect_right
+
+from django.db.models import QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    '''
+    Cursor pagination ordered by primary key
+    '''
+    ordering = 'pk'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if isinstance(queryset, QuerySet):
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_rows(queryset, request)
+
+    def paginate_rows(self, rows, request):
+        '''
+        Paginates a sequence of rows sorted by ascending primary key
+        '''
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = (self.ordering,) if isinstance(
+            self.ordering, str) else tuple(self.ordering)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+        keys = [row.pk for row in rows]
+        try:
+            position = None if current_position is None else int(current_position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+        if reverse:
+            end = len(keys) if position is None else bisect_left(keys, position)
+            end = max(0, end - offset)
+            results = list(reversed(rows[max(0, end - self.page_size - 1):end]))
+        else:
+            start = 0 if position is None else bisect_right(keys, position)
+            start += offset
+            results = list(rows[start:start + self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        # same bookkeeping as CursorPagination.paginate_queryset
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(
+                results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
@@ -0,0 +1,210 @@
+'''
+SQL query budgets per view
+
+A view's budget caps the queries and database time of one request. It is
+declared with `@query_budget` (outermost decorator, above `@api_view`) or
+in `QUERY_BUDGETS` by URL name, the decorator wins. `QueryBudgetMiddleware`
+checks it with the counts `django_drf_boilerplate.utils.tracing` keeps for
+the request; an overrun raises `QueryBudgetExceeded` when
+`QUERY_BUDGET_ACTION` is `raise` (development) and is logged with the
+slowest queries and the code that ran them when it is `log` (production).
+The check runs after the view, so for writes (POST, PUT, ...) `raise`
+does not raise: the response is replaced by a 500 that says the request
+was applied, a client should not retry it.
+Requests with queries slower than `QUERY_SAMPLE_MIN_MS` are logged the
+same way, budget or not.
+
+Tests can hold any block of code to a budget with `assert_query_budget`.
+
+Usage:
+    @query_budget(max_queries=2)
+    @api_view(['GET'])
+    def get_user_profile(request):
+        ...
+
+    QUERY_BUDGETS = {'token_obtain_pair': {'max_queries': 2, 'max_db_ms': 50}}
+
+    with assert_query_budget('get_user_profile'):
+        self.client.get(reverse('get_user_profile'))
+'''
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import resolve, reverse
+
+from django_drf_boilerplate.utils.response import ApiResponse
+from django_drf_boilerplate.utils.tracing import get_request_context, query_origin
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET_ACTIONS = ('raise', 'log', 'off')
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget:
+    '''
+    Queries and database time a view may use per request
+
+    Parameters
+    ----------
+        max_queries : `int`
+            queries at most, `None` for no limit
+        max_db_ms : `float`
+            milliseconds spent in queries at most, `None` for no limit
+    '''
+    __slots__ = ('max_queries', 'max_db_ms')
+
+    def __init__(self, max_queries=None, max_db_ms=None):
+        self.max_queries = max_queries
+        self.max_db_ms = max_db_ms
+
+    def overruns(self, queries, db_ms) -> list:
+        '''
+        Returns the exceeded limits, empty within the budget
+        '''
+        overruns = []
+        if self.max_queries is not None and queries > self.max_queries:
+            overruns.append(f'{queries} queries > {self.max_queries}')
+        if self.max_db_ms is not None and db_ms > self.max_db_ms:
+            overruns.append(f'{db_ms:.1f}ms in queries > {self.max_db_ms}ms')
+        return overruns
+
+
+def query_budget(max_queries=None, max_db_ms=None):
+    '''
+    Declares the query budget of a view
+    '''
+    def decorator(view):
+        view.query_budget = QueryBudget(max_queries, max_db_ms)
+        return view
+    return decorator
+
+
+def get_view_budget(match):
+    '''
+    Returns the budget of a resolved view, `None` without one
+    '''
+    budget = getattr(match.func, 'query_budget', None)
+    if budget is None:
+        view_class = getattr(match.func, 'view_class', None)
+        budget = getattr(view_class, 'query_budget', None)
+    if budget is None and match.view_name in settings.QUERY_BUDGETS:
+        budget = QueryBudget(**settings.QUERY_BUDGETS[match.view_name])
+    return budget
+
+
+def format_queries(queries) -> str:
+    return ''.join(f'\n  {seconds * 1000:.1f}ms {origin}: {sql}'
+                   for seconds, sql, origin in queries)
+
+
+class QueryBudgetMiddleware:
+    '''
+    Checks every request against the budget of its view and logs the
+    sampled slow queries, below `RequestTracingMiddleware`
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.QUERY_BUDGET_ACTION not in QUERY_BUDGET_ACTIONS:
+            raise ImproperlyConfigured(
+                f'QUERY_BUDGET_ACTION must be one of {", ".join(QUERY_BUDGET_ACTIONS)}')
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        return self.check(request) or response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.check(request) or response
+
+    @staticmethod
+    def check(request):
+        '''
+        Logs or raises the overruns of the request, returns the response
+        replacing the view's for a write over budget in `raise` mode
+        '''
+        context = get_request_context()
+        match = getattr(request, 'resolver_match', None)
+        if context is None or match is None or settings.QUERY_BUDGET_ACTION == 'off':
+            return None
+        budget = get_view_budget(match)
+        overruns = budget.overruns(context.db_queries, context.db_time * 1000) if budget else []
+        if overruns and settings.QUERY_BUDGET_ACTION == 'raise':
+            message = (f'Query budget of {match.view_name} exceeded: {", ".join(overruns)}'
+                       + format_queries(context.slowest_queries()))
+            if request.method in SAFE_METHODS:
+                raise QueryBudgetExceeded(message)
+            # the view committed its writes, raising would hide that
+            logger.error('%s\nThe %s request was applied', message, request.method)
+            return ApiResponse.error(
+                message=f'{message}\nThe {request.method} request was applied, '
+                        'do not retry it',
+                status_code=500, error='query_budget_exceeded')
+        if overruns:
+            logger.warning('Query budget of %s exceeded: %s%s', match.view_name,
+                           ', '.join(overruns), format_queries(context.slowest_queries()))
+        elif context.slow_queries:
+            logger.warning('Slow queries in %s:%s', match.view_name,
+                           format_queries(context.slowest_queries()))
+        return None
+
+
+class QueryRecorder:
+    '''
+    Execute wrapper keeping every query with its time and origin
+    '''
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql, query_origin()))
+
+    @property
+    def db_ms(self) -> float:
+        return sum(seconds for seconds, _, _ in self.queries) * 1000
+
+
+@contextmanager
+def assert_query_budget(view_name=None, max_queries=None, max_db_ms=None,
+                        using=DEFAULT_DB_ALIAS):
+    '''
+    Raises `AssertionError` when the block exceeds the budget of the view
+    `view_name` (URL name) or the given limits
+
+    Runs the block with an execute wrapper on the `using` connection, the
+    test client handles requests on the same thread.
+    '''
+    if view_name is not None:
+        budget = get_view_budget(resolve(reverse(view_name)))
+        if budget is None:
+            raise ValueError(f'View {view_name} has no query budget')
+    else:
+        budget = QueryBudget(max_queries, max_db_ms)
+    recorder = QueryRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+    overruns = budget.overruns(len(recorder.queries), recorder.db_ms)
+    if overruns:
+        raise AssertionError(f'Query budget exceeded: {", ".join(overruns)}'
+                             + format_queries(recorder.queries))
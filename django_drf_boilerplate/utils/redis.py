@@ -0,0 +1,100 @@
+'''
+Raw Redis access through the Django cache configuration
+
+For the few operations the cache API can not express atomically (Lua
+scripts), the client is taken from the configured `RedisCache` so no
+second connection setting is needed.
+
+`TimedRedisCache` is a `RedisCache` whose calls count in the timings of
+the request being handled (`django_drf_boilerplate.utils.tracing`) and
+whose reads count as hits or misses in the metrics.
+
+Usage:
+    from django_drf_boilerplate.utils.redis import get_redis_client
+
+    client = get_redis_client()
+    if client is not None:
+        client.eval(...)
+
+    CACHES = {'default': {
+        'BACKEND': 'django_drf_boilerplate.utils.redis.TimedRedisCache', ...}}
+'''
+import time
+from functools import wraps
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+from django_drf_boilerplate.utils.metrics import record_cache_reads
+from django_drf_boilerplate.utils.tracing import get_request_context
+
+_MISSING = object()
+
+
+def get_redis_client(alias='default'):
+    '''
+    Returns a redis-py client of a `RedisCache` cache, `None` for any other
+    cache backend
+    '''
+    backend = caches[alias]
+    if not isinstance(backend, RedisCache):
+        return None
+    return backend._cache.get_client(write=True)
+
+
+def make_key(key, alias='default') -> str:
+    '''
+    Returns `key` with the `KEY_PREFIX`/`VERSION` of the cache applied, the
+    same key the cache API would use
+    '''
+    return caches[alias].make_and_validate_key(key)
+
+
+def _timed(name):
+    method = getattr(RedisCache, name)
+
+    @wraps(method)
+    def timed(self, *args, **kwargs):
+        context = get_request_context()
+        if context is None:
+            return method(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            context.cache_time += time.perf_counter() - start
+            context.cache_calls += 1
+    return timed
+
+
+class TimedRedisCache(RedisCache):
+    '''
+    `RedisCache` adding the time of its calls to the current request's
+    timings and counting its reads, the async API runs these in a thread
+    '''
+    _timed_get = _timed('get')
+    _timed_get_many = _timed('get_many')
+
+    add = _timed('add')
+    set = _timed('set')
+    touch = _timed('touch')
+    delete = _timed('delete')
+    has_key = _timed('has_key')
+    incr = _timed('incr')
+    set_many = _timed('set_many')
+    delete_many = _timed('delete_many')
+    clear = _timed('clear')
+
+    def get(self, key, default=None, version=None):
+        value = self._timed_get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache_reads(0, 1)
+            return default
+        record_cache_reads(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self._timed_get_many(keys, version)
+        record_cache_reads(len(values), len(keys) - len(values))
+        return values
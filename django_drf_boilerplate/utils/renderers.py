@@ -0,0 +1,39 @@
+'''
+DRF renderers
+
+`FastJSONRenderer` renders with the `API_JSON_BACKEND` backend and produces
+the same bytes as DRF's `JSONRenderer` with the default `COMPACT_JSON` and
+`UNICODE_JSON` settings. Indented output (browsable API, `indent` media type
+parameter) is left to `JSONRenderer`.
+
+Usage:
+    REST_FRAMEWORK = {
+        'DEFAULT_RENDERER_CLASSES': (
+            'django_drf_boilerplate.utils.renderers.FastJSONRenderer',
+        ),
+    }
+'''
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from django_drf_boilerplate.utils.encoders import dumps_orjson, get_backend
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''
+    JSON renderer backed by orjson
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None
+                or get_backend() != 'orjson'
+                or not (self.compact and api_settings.UNICODE_JSON)
+                or self.get_indent(accepted_media_type or '', renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = dumps_orjson(data, default=self.encoder_class().default)
+        # JSONRenderer escapes these for javascript compatibility
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -16,11 +16,27 @@ Usage:
     # Custom response
     return ApiResponse.custom_response(data={'key': 'value'}, 
                                         message='Custom message', status_code=200)
+
+The body is encoded with the `API_JSON_BACKEND` backend (orjson by default,
+see `django_drf_boilerplate.utils.encoders`).
     
 '''
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from rest_framework import status
 
+from django_drf_boilerplate.utils.encoders import dumps
+
+
+class ApiJsonResponse(JsonResponse):
+    '''
+    `JsonResponse` encoded with the configured JSON backend
+    '''
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        # skip JsonResponse.__init__, it always encodes with the stdlib
+        HttpResponse.__init__(self, content=dumps(data), **kwargs)
+
 
 class ApiResponse:
     '''
@@ -43,7 +59,7 @@ class ApiResponse:
         response_data = {'success': True, 'message': message}
         if data is not None:
             response_data['data'] = data
-        return JsonResponse(response_data, status=status_code)
+        return ApiJsonResponse(response_data, status=status_code)
 
     @staticmethod
     def error(message='Error', status_code=status.HTTP_400_BAD_REQUEST, error=None) -> JsonResponse:
@@ -58,7 +74,7 @@ class ApiResponse:
                 status code of response
         '''
         response_data = {'success': False, 'message': message, 'error': error}
-        return JsonResponse(response_data, status=status_code)
+        return ApiJsonResponse(response_data, status=status_code)
 
     @staticmethod
     def exception(message="Exception", status_code=status.HTTP_500_INTERNAL_SERVER_ERROR) -> JsonResponse:
@@ -73,7 +89,7 @@ class ApiResponse:
                 status code of response
         '''
         response_data = {'success': False, 'message': message}
-        return JsonResponse(response_data, status=status_code)
+        return ApiJsonResponse(response_data, status=status_code)
 
     @staticmethod
     def custom_response(data: dict, message: str, status_code: int) -> JsonResponse:
@@ -90,4 +106,4 @@ class ApiResponse:
                 status code of response
         '''
         response_data = {'success': True, 'message': message, 'data': data}
-        return JsonResponse(response_data, status=status_code)
+        return ApiJsonResponse(response_data, status=status_code)
@@ -0,0 +1,140 @@
+'''
+Compiled read-only serializers
+
+A DRF serializer builds and binds its field objects for every instance,
+and `ModelSerializer` introspects the model to do so; with `many=True` the
+nested serializers pay it again for every row. `CompiledSerializer` builds
+the fields of its `serializer_class` once per class and turns them into a
+plan of `(name, getter, converter)` steps, so rendering a row is a loop of
+attribute reads and conversions. The output is the same as
+`serializer_class(instance).data`.
+
+Rows can be model instances or mappings (`.values()` rows, with nested
+fields given as mappings or lists of mappings). Reading only: there is no
+validation or saving, keep the DRF serializer for those and for the API
+schema.
+
+Usage:
+    class UserReadSerializer(CompiledSerializer):
+        serializer_class = UserSerializer
+
+    UserReadSerializer(user).data
+    RoleReadSerializer(Role.objects.values('id', 'name'), many=True).data
+'''
+from collections.abc import Mapping
+from operator import attrgetter, itemgetter
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.manager import BaseManager
+from rest_framework import fields, serializers
+from rest_framework.relations import PKOnlyObject
+
+# fields whose `to_representation` is a builtin conversion
+CONVERTERS = {
+    fields.CharField: str,
+    fields.EmailField: str,
+    fields.SlugField: str,
+    fields.IntegerField: int,
+    fields.ReadOnlyField: None,
+}
+
+
+def _field_step(field) -> tuple:
+    '''
+    Returns `(name, field, getters, convert, plan, many)` of a readable field,
+    `getters` is `None` for the fields rendered by DRF itself (dotted or `*`
+    sources, related fields)
+    '''
+    if (len(field.source_attrs) != 1
+            or type(field).get_attribute is not fields.Field.get_attribute):
+        return (field.field_name, field, None, None, None, False)
+    source = field.source_attrs[0]
+    getters = (attrgetter(source), itemgetter(source))
+    if isinstance(field, serializers.ListSerializer):
+        return (field.field_name, field, getters, None, _compile(field.child), True)
+    if isinstance(field, serializers.BaseSerializer):
+        return (field.field_name, field, getters, None, _compile(field), False)
+    return (field.field_name, field, getters,
+            CONVERTERS.get(type(field), field.to_representation), None, False)
+
+
+def _compile(serializer) -> tuple:
+    # the plan holds the bound fields of the prototype serializer
+    return tuple(_field_step(field) for field in serializer._readable_fields)
+
+
+def _render_field(data, field, instance):
+    # what `Serializer.to_representation` does for one field
+    try:
+        value = field.get_attribute(instance)
+    except fields.SkipField:
+        return
+    check = value.pk if isinstance(value, PKOnlyObject) else value
+    data[field.field_name] = None if check is None else field.to_representation(value)
+
+
+def render(plan, instance) -> dict:
+    '''
+    Returns the representation of `instance` following `plan`
+    '''
+    data = {}
+    is_mapping = isinstance(instance, Mapping)
+    for name, field, getters, convert, nested, many in plan:
+        if getters is None:
+            _render_field(data, field, instance)
+            continue
+        try:
+            value = getters[1](instance) if is_mapping else getters[0](instance)
+        except (KeyError, AttributeError, ObjectDoesNotExist):
+            # defaults, optional and missing fields are left to DRF
+            _render_field(data, field, instance)
+            continue
+        if value is None:
+            data[name] = None
+        elif nested is not None:
+            if many:
+                rows = value.all() if isinstance(value, BaseManager) else value
+                data[name] = [render(nested, row) for row in rows]
+            else:
+                data[name] = render(nested, value)
+        elif callable(value):
+            # methods used as a source are called by DRF
+            _render_field(data, field, instance)
+        elif convert is not None:
+            data[name] = convert(value)
+        else:
+            data[name] = value
+    return data
+
+
+class CompiledSerializer:
+    '''
+    Read-only renderer of `serializer_class` with the field plan built once
+    per class
+
+    Takes the arguments of a serializer (`instance`, `many`, `context`) so
+    it can stand in for one in `GenericAPIView.get_serializer`; the context
+    is not passed to the fields, which are shared by every instance.
+    '''
+    serializer_class = None
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def get_plan(cls) -> tuple:
+        plan = cls.__dict__.get('_plan')
+        if plan is None:
+            plan = _compile(cls.serializer_class())
+            # a race builds the same plan twice, no lock needed
+            cls._plan = plan
+        return plan
+
+    @property
+    def data(self):
+        plan = self.get_plan()
+        if self.many:
+            rows = self.instance.all() if isinstance(self.instance, BaseManager) else self.instance
+            return [render(plan, row) for row in rows]
+        return render(plan, self.instance)
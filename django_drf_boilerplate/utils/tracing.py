@@ -0,0 +1,282 @@
+'''
+Request IDs and per request timing
+
+`RequestTracingMiddleware` gives every request an id (the `X-Request-ID`
+header of the client or proxy when it is a sane value, a new one
+otherwise) and measures the time spent in database queries and cache
+calls while the request is handled. The id is returned in `X-Request-ID`,
+the timings in `Server-Timing`, and one summary record per request is
+logged to `django_drf_boilerplate.requests` (at WARNING above
+`REQUEST_SLOW_THRESHOLD_MS`).
+
+`RequestContextFilter` adds the request id to every record logged while a
+request is handled and `JsonFormatter` writes records as one JSON object
+per line.
+
+Queries are timed by a database execute wrapper installed on every
+connection, cache calls by `django_drf_boilerplate.utils.redis.TimedRedisCache`.
+Both read the current request from a context variable, so the timings
+include the work of sync views run in a thread under ASGI. Queries slower
+than `QUERY_SAMPLE_MIN_MS` are kept with the line of project code that
+ran them, the slowest `QUERY_SAMPLE_LIMIT` per request.
+
+Usage:
+    MIDDLEWARE = ['django_drf_boilerplate.utils.tracing.RequestTracingMiddleware', ...]
+
+    from django_drf_boilerplate.utils.tracing import get_request_id
+
+    get_request_id()    # id of the request being handled, None outside one
+'''
+import heapq
+import logging
+import os
+import re
+import sys
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from django_drf_boilerplate.utils.encoders import dumps
+
+logger = logging.getLogger('django_drf_boilerplate.requests')
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# ids taken from the client, anything else is replaced
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._:-]{1,128}')
+
+_request_context = ContextVar('request_context', default=None)
+
+# frames of these paths are skipped when looking for the origin of a query:
+# installed packages and the instrumentation in this directory
+_SKIPPED_PATHS = (os.path.dirname(__file__) + os.sep,
+                  *{path for path in sys.path if path.endswith('-packages')})
+
+
+class RequestContext:
+    '''
+    Id and timings of the request being handled
+    '''
+    __slots__ = ('request_id', 'method', 'path', 'ip', 'start',
+                 'db_time', 'db_queries', 'cache_time', 'cache_calls',
+                 'slow_queries')
+
+    def __init__(self, request_id, method, path, ip):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.ip = ip
+        self.start = time.perf_counter()
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.cache_time = 0.0
+        self.cache_calls = 0
+        # min heap of (seconds, sql, origin)
+        self.slow_queries = []
+
+    def add_slow_query(self, seconds, sql, origin):
+        if settings.QUERY_SAMPLE_LIMIT <= 0:
+            return
+        sample = (seconds, sql, origin)
+        if len(self.slow_queries) < settings.QUERY_SAMPLE_LIMIT:
+            heapq.heappush(self.slow_queries, sample)
+        elif seconds > self.slow_queries[0][0]:
+            heapq.heapreplace(self.slow_queries, sample)
+
+    def slowest_queries(self) -> list:
+        '''
+        Sampled queries, slowest first
+        '''
+        return sorted(self.slow_queries, reverse=True)
+
+    def timings(self) -> dict:
+        '''
+        Milliseconds spent in total, in queries, in cache calls and in the
+        rest of the application
+        '''
+        total = (time.perf_counter() - self.start) * 1000
+        db = self.db_time * 1000
+        cache = self.cache_time * 1000
+        return {'duration_ms': round(total, 2), 'db_ms': round(db, 2),
+                'db_queries': self.db_queries, 'cache_ms': round(cache, 2),
+                'cache_calls': self.cache_calls,
+                'app_ms': round(max(total - db - cache, 0), 2)}
+
+
+def get_request_context():
+    return _request_context.get()
+
+
+def get_request_id():
+    context = _request_context.get()
+    return context.request_id if context is not None else None
+
+
+def query_origin() -> str:
+    '''
+    Returns `file:line in function` of the innermost project frame of the
+    current stack, outside `utils` and installed packages
+    '''
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(str(settings.BASE_DIR))
+                and not filename.startswith(_SKIPPED_PATHS)):
+            return (f'{filename.removeprefix(str(settings.BASE_DIR) + "/")}:'
+                    f'{frame.f_lineno} in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return 'unknown'
+
+
+def time_query(execute, sql, params, many, context):
+    '''
+    Database execute wrapper adding the query time to the current request
+    '''
+    request_context = _request_context.get()
+    if request_context is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        request_context.db_time += seconds
+        request_context.db_queries += 1
+        if (settings.QUERY_SAMPLE_LIMIT > 0
+                and seconds * 1000 >= settings.QUERY_SAMPLE_MIN_MS):
+            # the stack is only walked for slow queries
+            request_context.add_slow_query(seconds, sql, query_origin())
+
+
+def install_query_timer(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def _request_id(request) -> str:
+    request_id = request.headers.get(REQUEST_ID_HEADER, '')
+    if REQUEST_ID_PATTERN.fullmatch(request_id):
+        return request_id
+    return uuid.uuid4().hex
+
+
+class RequestTracingMiddleware:
+    '''
+    Sets the request id and logs the timings of every request
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        connection_created.connect(install_query_timer)
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        context = self.start(request)
+        token = _request_context.set(context)
+        try:
+            response = self.get_response(request)
+            return self.finish(request, response, context)
+        finally:
+            _request_context.reset(token)
+
+    async def __acall__(self, request):
+        context = self.start(request)
+        token = _request_context.set(context)
+        try:
+            response = await self.get_response(request)
+            return self.finish(request, response, context)
+        finally:
+            _request_context.reset(token)
+
+    @staticmethod
+    def start(request):
+        context = RequestContext(_request_id(request), request.method,
+                                 request.path, request.META.get('REMOTE_ADDR'))
+        request.request_id = context.request_id
+        return context
+
+    @staticmethod
+    def finish(request, response, context):
+        timings = context.timings()
+        response.headers[REQUEST_ID_HEADER] = context.request_id
+        response.headers['Server-Timing'] = (
+            f'db;dur={timings["db_ms"]};desc="{timings["db_queries"]} queries", '
+            f'cache;dur={timings["cache_ms"]}, app;dur={timings["app_ms"]}, '
+            f'total;dur={timings["duration_ms"]}')
+        level = (logging.WARNING if timings['duration_ms'] >= settings.REQUEST_SLOW_THRESHOLD_MS
+                 else logging.INFO)
+        if logger.isEnabledFor(level):
+            match = getattr(request, 'resolver_match', None)
+            logger.log(level, '%s %s %s %.2fms', context.method, context.path,
+                       response.status_code, timings['duration_ms'], extra={
+                           'status': response.status_code,
+                           'view': match.view_name if match is not None else None,
+                           **timings})
+        return response
+
+
+class RequestContextFilter(logging.Filter):
+    '''
+    Adds the id, method, path and client address of the current request to
+    records, must run on the thread that logs (a queue handler, not its
+    targets)
+    '''
+
+    def filter(self, record):
+        context = _request_context.get()
+        if context is not None:
+            record.request_id = context.request_id
+            record.method = context.method
+            record.path = context.path
+            record.ip = context.ip
+        elif hasattr(record, 'request'):
+            # django.request logs 4xx responses once the middlewares returned
+            request = record.request
+            record.request_id = getattr(request, 'request_id', None)
+            record.method = request.method
+            record.path = request.path
+            record.ip = request.META.get('REMOTE_ADDR')
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    Formats records as one JSON object per line
+
+    The standard fields come first, then the request fields and any `extra`
+    given to the logging call that is listed in `FIELDS`.
+    '''
+    FIELDS = ('request_id', 'method', 'path', 'ip', 'status', 'view',
+              'duration_ms', 'db_ms', 'db_queries', 'cache_ms', 'cache_calls',
+              'app_ms')
+
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exception'] = ''.join(traceback.format_exception(*record.exc_info))
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        return dumps(data).decode()
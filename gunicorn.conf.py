@@ -0,0 +1,53 @@
+'''
+Gunicorn configuration, uvicorn workers serving the ASGI application
+
+Every setting can be overridden from the environment.
+
+Usage:
+    gunicorn -c gunicorn.conf.py
+    GUNICORN_WORKERS=8 GUNICORN_MAX_REQUESTS=5000 gunicorn -c gunicorn.conf.py
+'''
+import multiprocessing
+import os
+import shutil
+
+# persistent connections are per thread and never reused under ASGI, the
+# connections are pooled by pgbouncer (django_drf_boilerplate/utils/database.py)
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+# prometheus samples of every worker, aggregated by /metrics; set before
+# the workers import prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus-multiproc')
+
+wsgi_app = 'django_drf_boilerplate.asgi:application'
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+# an async worker handles many concurrent requests, one per core is enough
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+# seconds an idle client connection is kept open, above the load
+# balancer idle timeout avoids resets on reused connections
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# recycle workers after this many requests (+ jitter so they do not all
+# restart at once), bounds the effect of slow leaks
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # samples of a previous run would be added to this one
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
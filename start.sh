@@ -5,7 +5,28 @@ set -e
 
 load_env() {
     if [ -f .env ]; then
-        export $(cat .env | xargs)
+        # export the KEY=VALUE lines of .env (comments and quotes allowed),
+        # the variables already set win like with load_dotenv in
+        # production.py. Values are taken literally, never run.
+        local line key value
+        while IFS= read -r line || [ -n "$line" ]; do
+            case "$line" in
+            "" | "#"*) continue ;;
+            esac
+            line=${line#export }
+            key=${line%%=*}
+            value=${line#*=}
+            if [[ "$line" != *=* || ! "$key" =~ ^[A-Za-z_][A-Za-z0-9_]*$ ]]; then
+                echo "Ignoring invalid .env line: $line" >&2
+                continue
+            fi
+            if [[ "$value" =~ ^\'(.*)\'$ || "$value" =~ ^\"(.*)\"$ ]]; then
+                value=${BASH_REMATCH[1]}
+            fi
+            if [ -z "${!key}" ]; then
+                export "$key=$value"
+            fi
+        done <.env
     fi
 }
 
@@ -91,12 +112,18 @@ stop() {
 
 # start the application
 start() {
-    if [ "$ENV" == "prod" ]; then
+    export ENV
+    if [ "$ENV" == "production" ]; then
         echo "Running in production mode..."
         echo "Checking required environment variables..."
-        required_env_vars=("ENV" "DATABASE_URL")
+        # same as django_drf_boilerplate/production.py, which also reads .env
+        load_env
+        required_env_vars=("ENV" "DJANGO_SECRET" "DB_NAME" "DB_USER" "DB_PASSWORD" "DB_HOST" "DB_PORT" "CACHE_URL")
+        validate_env_variables "${required_env_vars[@]}"
+        echo "Starting the application..."
+        # gunicorn with uvicorn workers, see gunicorn.conf.py
+        PORT=$PORT exec gunicorn -c gunicorn.conf.py
     fi
-    validate_env_variables "${required_env_vars[@]}"
     echo "Starting the application..."
     python3 manage.py runserver 0.0.0.0:$PORT
 }